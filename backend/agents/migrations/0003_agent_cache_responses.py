@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-18 16:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('agents', '0002_remove_agent_updated_at_agent_web_search_enabled_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='agent',
+            name='cache_responses',
+            field=models.BooleanField(default=False),
+        ),
+    ]
@@ -14,6 +14,8 @@ class Agent(models.Model):
     model = models.CharField(max_length=100)
     system_message = models.TextField()
     web_search_enabled = models.BooleanField(default=False)
+    # Serve identical requests from the response cache (only for deterministic agents)
+    cache_responses = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
     
     def __str__(self):
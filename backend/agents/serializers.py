@@ -4,7 +4,7 @@ from .models import Agent
 class AgentSerializer(serializers.ModelSerializer):
     class Meta:
         model = Agent
-        fields = ('id', 'name', 'system_message', 'provider', 'model', 'web_search_enabled', 'created_at')
+        fields = ('id', 'name', 'system_message', 'provider', 'model', 'web_search_enabled', 'cache_responses', 'created_at')
         read_only_fields = ('created_at',)
 
     def create(self, validated_data):
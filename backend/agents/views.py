@@ -5,6 +5,7 @@ from .serializers import AgentSerializer
 class AgentListCreateView(generics.ListCreateAPIView):
     serializer_class = AgentSerializer
     permission_classes = [permissions.IsAuthenticated]
+    query_budget = 3
 
     def get_queryset(self):
         return Agent.objects.filter(user=self.request.user)
@@ -15,6 +16,7 @@ class AgentListCreateView(generics.ListCreateAPIView):
 class AgentDetailView(generics.RetrieveUpdateDestroyAPIView):
     serializer_class = AgentSerializer
     permission_classes = [permissions.IsAuthenticated]
+    query_budget = 8
 
     def get_queryset(self):
         return Agent.objects.filter(user=self.request.user)
@@ -60,6 +60,7 @@ INSTALLED_APPS = [
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
+    'core.querybudget.QueryBudgetMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -148,6 +149,78 @@ CORS_ALLOWED_ORIGINS = [origin.strip().rstrip('/') for origin in os.getenv('CORS
 
 AUTH_USER_MODEL = 'users.User'
 
+# Provider SDK clients are pooled per API key (see core/clients.py)
+LLM_CLIENT_POOL_SIZE = int(os.getenv('LLM_CLIENT_POOL_SIZE', '64'))
+LLM_CLIENT_TTL = int(os.getenv('LLM_CLIENT_TTL', '900'))
+
+# Cache for identical provider requests (see core/llm_cache.py).
+# BACKEND is one of 'memory', 'file', 'db' or 'none'.
+LLM_RESPONSE_CACHE = {
+    'BACKEND': os.getenv('LLM_RESPONSE_CACHE_BACKEND', 'memory'),
+    'LOCATION': os.getenv('LLM_RESPONSE_CACHE_LOCATION', str(BASE_DIR / '.llm_cache')),
+    'TTL': int(os.getenv('LLM_RESPONSE_CACHE_TTL', '86400')),
+    'MAX_ENTRIES': int(os.getenv('LLM_RESPONSE_CACHE_MAX_ENTRIES', '1000')),
+}
+
+# Django's cache, used for cached session reads (see chat_sessions/caching.py).
+# Set CACHE_BACKEND to django.core.cache.backends.filebased.FileBasedCache and
+# CACHE_LOCATION to a directory to share it between worker processes.
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('CACHE_LOCATION', 'agentverse'),
+    }
+}
+SESSION_READ_CACHE_TTL = int(os.getenv('SESSION_READ_CACHE_TTL', '300'))
+
+# Requests per second and burst size allowed per API key (see core/ratelimit.py).
+# Providers without an entry are not throttled but still retry transient errors.
+LLM_RATE_LIMITS = {
+    'OPENAI': {'rate': float(os.getenv('OPENAI_RATE_LIMIT', '5')), 'burst': int(os.getenv('OPENAI_RATE_BURST', '10'))},
+    'GEMINI': {'rate': float(os.getenv('GEMINI_RATE_LIMIT', '2')), 'burst': int(os.getenv('GEMINI_RATE_BURST', '5'))},
+}
+LLM_MAX_RETRIES = int(os.getenv('LLM_MAX_RETRIES', '4'))
+
+# Times a worker runs a job before giving up on it; a job is run again when
+# the lease of the worker running it expires (see chat_sessions/jobs.py)
+JOB_MAX_ATTEMPTS = int(os.getenv('JOB_MAX_ATTEMPTS', '3'))
+
+# Seconds a decrypted vault key stays in memory (see vault/resolver.py)
+VAULT_KEY_CACHE_TTL = int(os.getenv('VAULT_KEY_CACHE_TTL', '60'))
+
+# Most queries a request may run when its view declares no ``query_budget``
+# (see core/querybudget.py). Over-budget requests are logged, or raise when
+# QUERY_BUDGET_STRICT is on, as it always is under the test runner.
+QUERY_BUDGET_DEFAULT = int(os.getenv('QUERY_BUDGET_DEFAULT', '30'))
+QUERY_BUDGET_STRICT = os.getenv('QUERY_BUDGET_STRICT', 'False') == 'True'
+
+TEST_RUNNER = 'core.testrunner.TestRunner'
+
+# How calls are spread over several keys for one provider (see vault/keypool.py):
+# 'round_robin' or 'least_loaded'. A failing key sits out for the eject period,
+# doubling with each consecutive failure.
+VAULT_KEY_POOL_STRATEGY = os.getenv('VAULT_KEY_POOL_STRATEGY', 'round_robin')
+VAULT_KEY_EJECT_SECONDS = int(os.getenv('VAULT_KEY_EJECT_SECONDS', '30'))
+
+# Session summaries (see chat_sessions/summaries.py): turns per summarized block,
+# summaries combined per call, and calls in flight at once
+SUMMARY_CHUNK_TURNS = int(os.getenv('SUMMARY_CHUNK_TURNS', '20'))
+SUMMARY_FANOUT = int(os.getenv('SUMMARY_FANOUT', '10'))
+SUMMARY_CONCURRENCY = int(os.getenv('SUMMARY_CONCURRENCY', '4'))
+
+# Completed sessions untouched for this many days have their turn bodies
+# compressed into cold storage by the cold_storage command (see chat_sessions/coldstorage.py)
+TURN_COLD_STORAGE_DAYS = int(os.getenv('TURN_COLD_STORAGE_DAYS', '30'))
+
+# Prompts sent to agents hold the last MEMORY_RECENT_TURNS turns plus the
+# MEMORY_RETRIEVED_TURNS older turns most related to them (see chat_sessions/memory.py)
+MEMORY_RECENT_TURNS = int(os.getenv('MEMORY_RECENT_TURNS', '6'))
+MEMORY_RETRIEVED_TURNS = int(os.getenv('MEMORY_RETRIEVED_TURNS', '4'))
+
+# Full-text search (see chat_sessions/search.py) ranks at most this many of
+# the newest matches, which bounds the cost of searching for common words
+SEARCH_RANK_WINDOW = int(os.getenv('SEARCH_RANK_WINDOW', '10000'))
+
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
         'rest_framework.authentication.TokenAuthentication',
@@ -156,3 +229,17 @@ REST_FRAMEWORK = {
 }
 
 
+
+# The apps' own loggers (rate limiter retries and stats, over-budget requests)
+# write to the console; LOG_LEVEL=WARNING leaves out the INFO messages
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        app: {'handlers': ['console'], 'level': os.getenv('LOG_LEVEL', 'INFO')}
+        for app in ('core', 'chat_sessions', 'vault')
+    },
+}
@@ -16,7 +16,7 @@ class TurnInline(admin.TabularInline):
 
 @admin.register(Session)
 class SessionAdmin(admin.ModelAdmin):
-    list_display = ('id', 'topic', 'user', 'status', 'created_at')
+    list_display = ('id', 'topic', 'user', 'status', 'turn_count', 'created_at')
     list_filter = ('status', 'user')
     search_fields = ('topic',)
     inlines = [TurnInline]
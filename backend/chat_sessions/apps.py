@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class SessionsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'chat_sessions'
+
+    def ready(self):
+        from . import checks, signals
@@ -0,0 +1,364 @@
+"""
+Session archives, for moving a user's sessions between environments.
+
+An archive is JSON Lines: a header record, then the user's agents, the
+sessions and finally their turns, each a record with a ``type``. It can be
+written as-is, gzip or zstd compressed, or as a zip holding
+``sessions.jsonl``. Exports stream rows straight from ``values()`` querysets;
+imports write in batches with ``bulk_create`` and map the archived ids to the
+new ones, so moving 100k turns takes seconds. API keys are never archived.
+"""
+import datetime
+import gzip
+import io
+import json
+import zipfile
+import zlib
+
+from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.utils import timezone
+
+from agents.models import Agent
+from .coldstorage import ColdBodies
+from .models import Session, Turn
+from .stats import rebuild_stats
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Raised while reading a damaged or truncated file; BadGzipFile is an OSError
+DECOMPRESSION_ERRORS = (EOFError, OSError, zipfile.BadZipFile, zlib.error)
+if zstandard is not None:
+    DECOMPRESSION_ERRORS += (zstandard.ZstdError,)
+
+ARCHIVE_VERSION = 1
+# Rows per streamed query chunk and per bulk insert
+BATCH_SIZE = 2000
+ZIP_MEMBER = 'sessions.jsonl'
+
+AGENT_FIELDS = ('name', 'provider', 'model', 'system_message', 'web_search_enabled', 'cache_responses')
+SESSION_FIELDS = ('topic', 'max_turns', 'status', 'mode', 'created_at')
+TURN_FIELDS = ('prompt', 'response', 'prompt_tokens', 'completion_tokens', 'token_count', 'latency_ms', 'created_at')
+
+COMPRESSIONS = ('gzip', 'zstd')
+GZIP_MAGIC = b'\x1f\x8b'
+ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+ZIP_MAGIC = b'PK\x03\x04'
+
+
+class ArchiveError(ValueError):
+    pass
+
+
+class ArchiveEncoder(DjangoJSONEncoder):
+    # DjangoJSONEncoder cuts datetimes to milliseconds; keep them exact
+    def default(self, o):
+        if isinstance(o, datetime.datetime):
+            return o.isoformat()
+        return super().default(o)
+
+
+def archive_records(user, session_ids=None):
+    """
+    Yields the archive records for the user's sessions, or only for
+    ``session_ids`` when given.
+    """
+    sessions = Session.objects.filter(user=user).order_by('id')
+    if session_ids is not None:
+        sessions = sessions.filter(id__in=session_ids)
+    session_ids = list(sessions.values_list('id', flat=True))
+
+    yield {'type': 'archive', 'version': ARCHIVE_VERSION, 'exported_at': timezone.now()}
+
+    for agent in Agent.objects.filter(user=user).order_by('id').values('id', *AGENT_FIELDS):
+        yield {'type': 'agent', **agent}
+
+    members = {}
+    through = Session.agents.through.objects.filter(session_id__in=session_ids)
+    for session_id, agent_id in through.values_list('session_id', 'agent_id'):
+        members.setdefault(session_id, []).append(agent_id)
+    for session in sessions.values('id', *SESSION_FIELDS).iterator(chunk_size=BATCH_SIZE):
+        yield {'type': 'session', **session, 'agents': members.get(session['id'], [])}
+
+    turns = (
+        Turn.objects.filter(session_id__in=session_ids)
+        .order_by('session_id', 'created_at', 'id')
+        .values('id', 'cold', 'session_id', 'agent_id', *TURN_FIELDS)
+    )
+    cold = ColdBodies()
+    for turn in turns.iterator(chunk_size=BATCH_SIZE):
+        turn_id = turn.pop('id')
+        if turn.pop('cold'):
+            turn['prompt'], turn['response'] = cold.get(turn['session_id'], turn_id)
+        turn['session'] = turn.pop('session_id')
+        turn['agent'] = turn.pop('agent_id')
+        yield {'type': 'turn', **turn}
+
+
+def archive_lines(user, session_ids=None, size=64 * 1024):
+    """Archive records encoded as JSON Lines, joined into blocks of about ``size`` bytes."""
+    encoder = ArchiveEncoder()
+    buffer, length = [], 0
+    for record in archive_records(user, session_ids):
+        line = (encoder.encode(record) + '\n').encode()
+        buffer.append(line)
+        length += len(line)
+        if length >= size:
+            yield b''.join(buffer)
+            buffer, length = [], 0
+    if buffer:
+        yield b''.join(buffer)
+
+
+def compress_stream(chunks, compression):
+    if compression == 'gzip':
+        # wbits=31 writes a gzip header and trailer
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    elif compression == 'zstd':
+        if zstandard is None:
+            raise ArchiveError('zstd compression needs the zstandard package.')
+        compressor = zstandard.ZstdCompressor().compressobj()
+    else:
+        raise ArchiveError(f"Unknown compression. Use one of: {', '.join(COMPRESSIONS)}")
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+class _StreamBuffer(io.RawIOBase):
+    """Write-only file that hands written bytes to the caller as they come."""
+
+    def __init__(self):
+        self.chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def zip_stream(chunks):
+    # zipfile writes data descriptors instead of seeking back on unseekable files
+    buffer = _StreamBuffer()
+    with zipfile.ZipFile(buffer, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        with archive.open(ZIP_MEMBER, 'w', force_zip64=True) as member:
+            for chunk in chunks:
+                member.write(chunk)
+                data = buffer.drain()
+                if data:
+                    yield data
+    yield buffer.drain()
+
+
+def export_archive(user, session_ids=None, compression=None, as_zip=False):
+    """
+    Returns the archive as an iterator of bytes. ``compression`` is
+    'gzip', 'zstd' or None; ``as_zip`` writes a zip instead.
+    """
+    chunks = archive_lines(user, session_ids)
+    if as_zip:
+        return zip_stream(chunks)
+    if compression:
+        return compress_stream(chunks, compression)
+    return chunks
+
+
+def read_archive(fileobj):
+    """
+    Yields the records of an archive file opened in binary mode, whether
+    plain, gzip or zstd compressed, or zipped. A file that can't be
+    decompressed or decoded raises ArchiveError.
+    """
+    try:
+        yield from _read_archive(fileobj)
+    except UnicodeDecodeError:
+        raise ArchiveError('Archive is not UTF-8 text.')
+    except DECOMPRESSION_ERRORS as e:
+        raise ArchiveError(f'Archive is damaged or truncated ({e or type(e).__name__}).')
+
+
+def _read_archive(fileobj):
+    head = fileobj.read(4)
+    fileobj.seek(0)
+    if head.startswith(ZIP_MAGIC):
+        with zipfile.ZipFile(fileobj) as archive:
+            try:
+                stream = archive.open(ZIP_MEMBER)
+            except KeyError:
+                raise ArchiveError(f'Zip archive has no {ZIP_MEMBER}.')
+            yield from _read_lines(stream)
+        return
+    if head.startswith(GZIP_MAGIC):
+        stream = gzip.GzipFile(fileobj=fileobj)
+    elif head.startswith(ZSTD_MAGIC):
+        if zstandard is None:
+            raise ArchiveError('zstd archives need the zstandard package.')
+        stream = zstandard.ZstdDecompressor().stream_reader(fileobj)
+    else:
+        stream = fileobj
+    yield from _read_lines(stream)
+
+
+def _read_lines(stream):
+    for number, line in enumerate(io.TextIOWrapper(stream, encoding='utf-8'), 1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            raise ArchiveError(f'Line {number} is not valid JSON.')
+        if not isinstance(record, dict) or 'type' not in record:
+            raise ArchiveError(f'Line {number} is not an archive record.')
+        yield record
+
+
+def _fields(record, model, fields):
+    """
+    Returns the values of ``fields`` in ``record`` converted for ``model``,
+    so a value the database would reject raises ArchiveError instead.
+    """
+    values = {}
+    for name in fields:
+        if name not in record:
+            raise ArchiveError(f"{str(record['type']).capitalize()} record is missing '{name}'.")
+        field = model._meta.get_field(name)
+        try:
+            value = field.to_python(record[name])
+            if value is None and not field.null:
+                raise ValidationError('This field cannot be null.')
+            if value is not None:
+                field.run_validators(value)
+        except ValidationError as e:
+            raise ArchiveError(f"{str(record['type']).capitalize()} record has an invalid '{name}': {' '.join(e.messages)}")
+        values[name] = value
+    return values
+
+
+def _archived_id(record):
+    if not isinstance(record.get('id'), (int, str)):
+        raise ArchiveError(f"{str(record['type']).capitalize()} record is missing 'id'.")
+    return record['id']
+
+
+class ArchiveImporter:
+    """
+    Imports archive records for ``user``. Agents that match one the user
+    already has (same name, provider, model and system message) are reused
+    rather than duplicated. ``counts`` tells how many rows were created.
+    """
+
+    def __init__(self, user, batch_size=BATCH_SIZE):
+        self.user = user
+        self.batch_size = batch_size
+        self.agent_ids = {}
+        self.session_ids = {}
+        self.sessions = []
+        self.turns = []
+        self.counts = {'agents': 0, 'sessions': 0, 'turns': 0}
+
+    @transaction.atomic
+    def run(self, records):
+        records = iter(records)
+        header = next(records, None)
+        if not header or header.get('type') != 'archive':
+            raise ArchiveError('Not a session archive.')
+        if header.get('version') != ARCHIVE_VERSION:
+            raise ArchiveError(f"Unsupported archive version {header.get('version')}.")
+
+        agents, sessions = [], []
+        for record in records:
+            kind = record['type']
+            if kind == 'agent':
+                agents.append(record)
+            elif kind == 'session':
+                sessions.append(record)
+            elif kind == 'turn':
+                if agents is not None:
+                    # Agents and sessions all come before the first turn
+                    self._import_agents(agents)
+                    self._import_sessions(sessions)
+                    agents = sessions = None
+                self._add_turn(record)
+            else:
+                raise ArchiveError(f"Unknown record type '{kind}'.")
+        if agents is not None:
+            self._import_agents(agents)
+            self._import_sessions(sessions)
+        self._flush_turns()
+
+        rebuild_stats(self.sessions)
+        return self.counts
+
+    def _import_agents(self, records):
+        existing = {
+            (agent.name, agent.provider, agent.model, agent.system_message): agent.id
+            for agent in Agent.objects.filter(user=self.user)
+        }
+        new = []
+        for record in records:
+            archived_id = _archived_id(record)
+            values = _fields(record, Agent, AGENT_FIELDS)
+            key = (values['name'], values['provider'], values['model'], values['system_message'])
+            if key in existing:
+                self.agent_ids[archived_id] = existing[key]
+            else:
+                new.append((archived_id, Agent(user=self.user, **values)))
+        Agent.objects.bulk_create([agent for _, agent in new])
+        for archived_id, agent in new:
+            self.agent_ids[archived_id] = agent.id
+        self.counts['agents'] = len(new)
+
+    def _import_sessions(self, records):
+        archived_ids = [_archived_id(record) for record in records]
+        sessions = [Session(user=self.user, **_fields(record, Session, SESSION_FIELDS)) for record in records]
+        for record in records:
+            if not isinstance(record.get('agents', []), list):
+                raise ArchiveError("Session record has an invalid 'agents': expected a list of agent ids.")
+        Session.objects.bulk_create(sessions, batch_size=self.batch_size)
+
+        members = []
+        for record, archived_id, session in zip(records, archived_ids, sessions):
+            self.session_ids[archived_id] = session.id
+            for agent_id in record.get('agents', []):
+                members.append(Session.agents.through(session_id=session.id, agent_id=self._agent_id(agent_id)))
+        Session.agents.through.objects.bulk_create(members, batch_size=self.batch_size)
+        self.sessions = sessions
+        self.counts['sessions'] = len(sessions)
+
+    def _agent_id(self, archived_id):
+        try:
+            return self.agent_ids[archived_id]
+        except (KeyError, TypeError):
+            raise ArchiveError(f'Unknown agent {archived_id} in archive.')
+
+    def _add_turn(self, record):
+        try:
+            session_id = self.session_ids[record['session']]
+        except (KeyError, TypeError):
+            raise ArchiveError(f"Turn refers to unknown session {record.get('session')}.")
+        self.turns.append(Turn(session_id=session_id, agent_id=self._agent_id(record.get('agent')), **_fields(record, Turn, TURN_FIELDS)))
+        if len(self.turns) >= self.batch_size:
+            self._flush_turns()
+
+    def _flush_turns(self):
+        Turn.objects.bulk_create(self.turns, batch_size=self.batch_size)
+        self.counts['turns'] += len(self.turns)
+        self.turns = []
+
+
+def import_archive(user, fileobj):
+    """Imports an archive file for ``user``; returns the created row counts."""
+    return ArchiveImporter(user).run(read_archive(fileobj))
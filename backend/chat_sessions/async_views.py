@@ -0,0 +1,82 @@
+"""
+Async session views. These only pay off when served by an ASGI server
+(``uvicorn agentverse.asgi:application``): waiting on a provider then
+suspends a coroutine instead of holding a worker thread.
+"""
+import json
+
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse, StreamingHttpResponse
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.exceptions import AuthenticationFailed
+
+from .models import Session
+from .jobs import SessionBusy, conversation_blocker, start_inline_job, extend_lease, finish_job, default_worker_id
+from .events import event_payload, format_event
+from .orchestration import aiter_conversation, OrchestrationError
+
+
+async def aauthenticate(request):
+    # Token auth only: these views are CSRF exempt, so cookie sessions are not accepted
+    try:
+        result = await sync_to_async(TokenAuthentication().authenticate)(request)
+    except AuthenticationFailed:
+        return None
+    return result[0] if result else None
+
+
+async def _aevent_stream(session, job):
+    job_status, error = 'FAILED', 'Stream closed before the conversation finished'
+    try:
+        async for event, data in aiter_conversation(session, job.prompt, stream=True):
+            if event == 'turn_end':
+                await sync_to_async(extend_lease)(job)
+            yield format_event(event, await sync_to_async(event_payload)(event, data))
+        job_status, error = 'SUCCEEDED', ''
+    except OrchestrationError as e:
+        error = str(e)
+    except Exception as e:
+        error = f'Unexpected error: {str(e)}'
+    finally:
+        await sync_to_async(finish_job)(job, job_status, error)
+
+    if error:
+        yield format_event('error', {'error': error})
+    yield format_event('done', {'job': job.id, 'status': job.status})
+
+
+@csrf_exempt
+async def async_stream_conversation(request, pk):
+    """
+    Async equivalent of StreamConversationView.
+    """
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Method not allowed'}, status=405)
+
+    user = await aauthenticate(request)
+    if user is None:
+        return JsonResponse({'error': 'Authentication credentials were not provided.'}, status=401)
+
+    session = await Session.objects.select_related('user').filter(pk=pk, user=user).afirst()
+    if session is None:
+        return JsonResponse({'error': 'Not found.'}, status=404)
+
+    try:
+        prompt = json.loads(request.body or b'{}').get('prompt', '')
+    except ValueError:
+        return JsonResponse({'error': 'Invalid JSON body'}, status=400)
+
+    blocker = await sync_to_async(conversation_blocker)(session, prompt)
+    if blocker:
+        payload, status_code = blocker
+        return JsonResponse(payload, status=status_code)
+
+    try:
+        job = await sync_to_async(start_inline_job)(session, prompt, worker_id=f"astream:{default_worker_id()}")
+    except SessionBusy as e:
+        return JsonResponse(e.payload, status=409)
+    response = StreamingHttpResponse(_aevent_stream(session, job), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
@@ -0,0 +1,148 @@
+"""
+EXPLAIN audit of the queries the app issues, run by the ``audit_queries``
+management command.
+
+Each probe drives one real code path, mostly API views resolved from their
+URLs, against a benchmark session; every query it runs is captured and
+explained. Plans that read a whole table or sort rows that an index could
+have returned in order are flagged.
+"""
+import re
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from vault.resolver import CredentialResolver
+from .benchmarks import build_session
+from .coldstorage import cold_candidates
+from .context import ConversationContext
+from .jobs import enqueue_job, lease_job
+
+# Databases whose query plans explain() can read
+VENDORS = ('sqlite', 'postgresql')
+
+EXPLAINABLE = ('SELECT', 'UPDATE', 'DELETE', 'WITH')
+
+# Literals are blanked so the same query shape is only explained once
+LITERAL_RE = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+
+SQLITE_SCAN_RE = re.compile(r'^SCAN (\w+)\b(?! VIRTUAL TABLE)')
+POSTGRES_SCAN_RE = re.compile(r'Seq Scan on (\w+)')
+POSTGRES_SORT_RE = re.compile(r'^\s*(?:->\s*)?Sort\b')
+
+
+def _view_probe(method, path, data=None):
+    def probe(session):
+        factory = APIRequestFactory()
+        request = getattr(factory, method)(path, data)
+        force_authenticate(request, user=session.user)
+        match = resolve(request.path)
+        response = match.func(request, *match.args, **match.kwargs)
+        if getattr(response, 'streaming', False):
+            for _ in response.streaming_content:
+                pass
+        elif hasattr(response, 'render'):
+            response.render()
+    return probe
+
+
+def probes(session):
+    """
+    ``(name, callable, accepted)`` triples, each run with ``session``.
+    ``accepted`` maps issues known to be bounded to the reason why.
+    """
+    turns = session.turns.order_by('created_at', 'id').values_list('id', flat=True)
+    middle = turns[session.turn_count // 2]
+    job = enqueue_job(session, 'audit')
+    agents = list(session.agents.all())
+    return [
+        ('session list', _view_probe('get', '/api/sessions/'), {}),
+        ('session list filtered', _view_probe('get', '/api/sessions/?status=ACTIVE,COMPLETED&created_after=2000-01-01'), {}),
+        ('session detail', _view_probe('get', f'/api/sessions/{session.pk}/'), {}),
+        ('turn page', _view_probe('get', f'/api/sessions/{session.pk}/turns/'), {}),
+        ('turn page after', _view_probe('get', f'/api/sessions/{session.pk}/turns/?after={middle}'), {}),
+        ('export', _view_probe('get', f'/api/sessions/{session.pk}/export/txt/'), {}),
+        ('report', _view_probe('post', f'/api/sessions/{session.pk}/generate-report/'),
+         {'sort for order by': 'sorts the agents of one session'}),
+        ('search', _view_probe('get', '/api/sessions/search/?q=evidence'), {}),
+        ('archive', _view_probe('get', f'/api/sessions/archive/?sessions={session.pk}'), {}),
+        ('job detail', _view_probe('get', f'/api/sessions/{session.pk}/jobs/{job.pk}/'), {}),
+        ('agent list', _view_probe('get', '/api/agents/'), {}),
+        ('credential list', _view_probe('get', '/api/vault/credentials/'), {}),
+        ('conversation context', lambda session: ConversationContext.load(session), {}),
+        ('credential resolver', lambda session: CredentialResolver.for_agents(session.user_id, agents).get_key('CLAUDE'), {}),
+        ('job lease', lambda session: lease_job('audit'), {'sort for order by': 'sorts only the runnable jobs'}),
+        ('cold storage candidates', lambda session: list(cold_candidates()), {}),
+    ]
+
+
+def explain(sql):
+    """The query plan of ``sql`` as a list of lines."""
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+            return [row[3] for row in cursor.fetchall()]
+        if connection.vendor == 'postgresql':
+            # With sequential scans priced out, a Seq Scan in the plan means no index could serve
+            cursor.execute('SET enable_seqscan = off')
+            try:
+                cursor.execute(f'EXPLAIN {sql}')
+                return [row[0] for row in cursor.fetchall()]
+            finally:
+                cursor.execute('RESET enable_seqscan')
+    raise NotImplementedError(f'No query plans for {connection.vendor}.')
+
+
+def _by_primary_key(plan):
+    # Rows looked up from a list of ids are few, so sorting them is fine
+    lookups = [line for line in plan if line.startswith(('SEARCH', 'SCAN'))]
+    return all('PRIMARY KEY' in line or 'VIRTUAL TABLE' in line or '(subquery' in line for line in lookups)
+
+
+def plan_issues(plan):
+    issues = []
+    for line in plan:
+        if connection.vendor == 'sqlite':
+            scan = SQLITE_SCAN_RE.match(line)
+            if scan:
+                issues.append(f'full scan of {scan.group(1)}' + (' (in index order)' if 'INDEX' in line else ''))
+            if 'USE TEMP B-TREE' in line and not _by_primary_key(plan):
+                issues.append(line.strip().lower().replace('use temp b-tree for', 'sort for'))
+        else:
+            scan = POSTGRES_SCAN_RE.search(line)
+            if scan:
+                issues.append(f'sequential scan of {scan.group(1)}')
+            if POSTGRES_SORT_RE.match(line):
+                issues.append('sort')
+    return issues
+
+
+def run(turn_count=1000):
+    """
+    Builds a session of ``turn_count`` turns, runs every probe and returns
+    one dict per distinct query shape: the probe, SQL, plan, issues and the
+    issues accepted for the probe.
+    """
+    session = build_session(turn_count)
+    results, seen = [], set()
+    for name, probe, accepted in probes(session):
+        with CaptureQueriesContext(connection) as queries:
+            probe(session)
+        for query in queries.captured_queries:
+            sql = query['sql']
+            shape = LITERAL_RE.sub('?', sql)
+            if not sql.lstrip().upper().startswith(EXPLAINABLE) or shape in seen:
+                continue
+            seen.add(shape)
+            plan = explain(sql)
+            issues = plan_issues(plan)
+            results.append({
+                'probe': name,
+                'sql': sql,
+                'plan': plan,
+                'issues': [issue for issue in issues if issue not in accepted],
+                'accepted': [f'{issue} ({accepted[issue]})' for issue in issues if issue in accepted],
+            })
+    return results
@@ -0,0 +1,235 @@
+"""
+Micro-benchmarks for the session read paths, run by the
+``benchmark_sessions`` management command.
+
+Each case runs against a session of N turns generated with MockProvider and
+is measured for wall time, query count and peak Python memory, so a change
+in how cost grows with session size shows up against the stored baseline.
+"""
+import json
+import math
+import statistics
+import time
+import tracemalloc
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test.utils import override_settings
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from agents.models import Agent
+from core.providers import MockProvider
+from core.querybudget import QueryCounter
+from vault.models import Credential
+from .context import ConversationContext
+from .memory import embed_missing
+from .models import Session, Turn
+from .serializers import SessionSerializer
+from .stats import rebuild_session_stats
+from .utils import generate_session_report
+from .views import ExportSessionView, GenerateSummaryView, SessionTurnListView, session_queryset
+
+DEFAULT_SIZES = (10, 100, 1000, 10000)
+BATCH_SIZE = 1000
+
+# Pads mock responses to the length of a typical agent reply
+FILLER = (
+    "I see the point, but the evidence cuts the other way once you account for "
+    "how the costs are distributed over time and who ends up carrying them. "
+) * 3
+
+
+def build_session(turn_count, embed=True):
+    """
+    Creates a user with two mock agents and an ACTIVE session holding
+    ``turn_count`` turns, embedded for retrieval unless ``embed`` is false.
+    Returns the session.
+    """
+    user = get_user_model().objects.create_user(f'bench-{turn_count}-{time.time_ns()}', password='bench')
+    # Providers without a client of their own (CLAUDE) are served by MockProvider
+    agents = [
+        Agent.objects.create(user=user, name=name, provider='CLAUDE', model='mock', system_message='You debate.')
+        for name in ('Alice', 'Bob')
+    ]
+    credential = Credential(user=user, provider='CLAUDE', name='bench')
+    credential.set_key('bench-key')
+    credential.save()
+    session = Session.objects.create(user=user, topic='Benchmark debate', max_turns=turn_count + 10, status='ACTIVE')
+    session.agents.set(agents)
+
+    provider = MockProvider()
+    turns = []
+    for i in range(turn_count):
+        agent = agents[i % len(agents)]
+        prompt = f"Turn {i}: {FILLER}"
+        response = provider.generate_response(agent.system_message, prompt, 'bench-key', agent.model)
+        turns.append(Turn(
+            session=session, agent=agent, prompt=prompt, response=response,
+            prompt_tokens=len(prompt) // 4, completion_tokens=len(response) // 4,
+            token_count=(len(prompt) + len(response)) // 4,
+        ))
+        # Written a batch at a time so a million turns fit in memory
+        if len(turns) == BATCH_SIZE:
+            Turn.objects.bulk_create(turns)
+            turns = []
+    Turn.objects.bulk_create(turns)
+
+    # bulk_create bypasses append_turn, so build the counters and embeddings it keeps
+    rebuild_session_stats(session)
+    if embed:
+        embed_missing(session)
+    return session
+
+
+def _consume(response):
+    if response.streaming:
+        return sum(len(chunk) for chunk in response.streaming_content)
+    return len(response.content)
+
+
+def _call_view(view_class, method, session, **kwargs):
+    factory = APIRequestFactory()
+    request = getattr(factory, method)(f'/api/sessions/{session.pk}/')
+    force_authenticate(request, user=session.user)
+    response = view_class.as_view()(request, pk=session.pk, **kwargs)
+    if hasattr(response, 'render'):
+        response.render()
+    return _consume(response)
+
+
+def bench_context(session):
+    return len(ConversationContext.load(session).prompt)
+
+
+def bench_turn_page(session):
+    # A page from the middle of the session, as a client catching up would fetch
+    first = session.turns.order_by('id').values_list('id', flat=True).first()
+    factory = APIRequestFactory()
+    request = factory.get(f'/api/sessions/{session.pk}/turns/', {'after': first + session.turn_count // 2})
+    force_authenticate(request, user=session.user)
+    response = SessionTurnListView.as_view()(request, pk=session.pk)
+    response.render()
+    return _consume(response)
+
+
+def bench_serializer(session):
+    session = session_queryset(session.user).get(pk=session.pk)
+    return len(json.dumps(SessionSerializer(session).data, default=str))
+
+
+def bench_report(session):
+    session = Session.objects.get(pk=session.pk)
+    return len(generate_session_report(session))
+
+
+def bench_export(session):
+    return _call_view(ExportSessionView, 'get', session, fmt='txt')
+
+
+def bench_export_pdf(session):
+    return _call_view(ExportSessionView, 'get', session, fmt='pdf')
+
+
+def _reset_summary(session, keep_chunks):
+    if not keep_chunks:
+        session.summary_chunks.all().delete()
+    Session.objects.filter(pk=session.pk).update(summary='', summary_turn_id=None)
+
+
+def bench_summary(session):
+    # Summarize every block, without help from the response cache
+    _reset_summary(session, keep_chunks=False)
+    with override_settings(LLM_RESPONSE_CACHE={'BACKEND': 'none'}):
+        return _call_view(GenerateSummaryView, 'post', session)
+
+
+def bench_summary_refresh(session):
+    # Stored block summaries are reused; only the right edge is summarized again
+    if not session.summary_chunks.exists():
+        _call_view(GenerateSummaryView, 'post', session)
+    _reset_summary(session, keep_chunks=True)
+    with override_settings(LLM_RESPONSE_CACHE={'BACKEND': 'none'}):
+        return _call_view(GenerateSummaryView, 'post', session)
+
+
+CASES = {
+    'context': bench_context,
+    'turn_page': bench_turn_page,
+    'serializer': bench_serializer,
+    'report': bench_report,
+    'export': bench_export,
+    'export_pdf': bench_export_pdf,
+    'summary': bench_summary,
+    'summary_refresh': bench_summary_refresh,
+}
+
+
+def measure(fn, session, repeat=3):
+    """
+    Runs ``fn(session)`` once under tracemalloc for queries and peak memory,
+    then ``repeat`` more times for the median wall time.
+    """
+    # Unlike CaptureQueriesContext, not capped at the 9000 queries Django logs
+    queries = QueryCounter()
+    tracemalloc.start()
+    try:
+        with connection.execute_wrapper(queries):
+            fn(session)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(session)
+        timings.append(time.perf_counter() - start)
+    return {
+        'ms': round(statistics.median(timings) * 1000, 3),
+        'queries': len(queries),
+        'peak_kb': round(peak / 1024, 1),
+    }
+
+
+def run(sizes=DEFAULT_SIZES, cases=None, repeat=3):
+    """
+    Returns ``{'<case>/<turns>': result}`` for every case and size.
+    """
+    cases = cases or list(CASES)
+    results = {}
+    for size in sizes:
+        session = build_session(size, embed='context' in cases)
+        for name in cases:
+            results[f'{name}/{size}'] = measure(CASES[name], session, repeat=repeat)
+    return results
+
+
+def growth(results, name, size, sizes):
+    """
+    Empirical exponent of wall time between ``size`` and the next smaller
+    size: ~1 is linear, ~2 quadratic.
+    """
+    smaller = [s for s in sizes if s < size]
+    if not smaller:
+        return None
+    previous = results.get(f'{name}/{max(smaller)}')
+    current = results.get(f'{name}/{size}')
+    if not previous or not current or previous['ms'] <= 0 or current['ms'] <= 0:
+        return None
+    return math.log(current['ms'] / previous['ms']) / math.log(size / max(smaller))
+
+
+def compare(result, baseline, tolerance):
+    """
+    Returns a list of regressions of ``result`` against its ``baseline``
+    entry. Times must also be at least 5 ms slower to count, since the
+    smallest sessions are mostly noise.
+    """
+    problems = []
+    if result['ms'] > baseline['ms'] * (1 + tolerance) and result['ms'] - baseline['ms'] > 5:
+        problems.append(f"time {baseline['ms']:.1f} -> {result['ms']:.1f} ms")
+    if result['queries'] > baseline['queries']:
+        problems.append(f"queries {baseline['queries']} -> {result['queries']}")
+    if result['peak_kb'] > baseline['peak_kb'] * (1 + tolerance) and result['peak_kb'] - baseline['peak_kb'] > 64:
+        problems.append(f"memory {baseline['peak_kb']:.0f} -> {result['peak_kb']:.0f} KB")
+    return problems
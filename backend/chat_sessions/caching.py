@@ -0,0 +1,58 @@
+"""
+Conditional GETs and cached responses for session reads.
+
+A cached view derives a version of what it serves from Session rows in one
+cheap query: ``updated_at`` and ``turn_count``, which append_turn bumps with
+every turn. The version, with the user, URL and format, makes the ETag, so
+a poll with a matching If-None-Match gets a 304. The ETag is also the cache
+key of the serialized payload, so a new turn or a change to a session makes
+the old entry unreachable and it expires after SESSION_READ_CACHE_TTL. On a
+hit no serializer runs and the database is only asked for the version.
+"""
+import abc
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.cache import get_conditional_response, patch_cache_control, quote_etag
+from rest_framework.response import Response
+
+KEY_PREFIX = 'session-read'
+
+
+class CachedReadMixin(abc.ABC):
+    """
+    For views whose GET serializes sessions. ``get_version()`` returns the
+    version of what would be served, or None when it can't be served, and
+    the request is then handled as usual.
+    """
+
+    @abc.abstractmethod
+    def get_version(self):
+        pass
+
+    def get_etag(self, request, version):
+        identity = f'{request.user.pk}:{request.build_absolute_uri()}:{request.accepted_renderer.format}:{version}'
+        return quote_etag(hashlib.sha1(identity.encode()).hexdigest())
+
+    def get(self, request, *args, **kwargs):
+        version = self.get_version()
+        if version is None:
+            return super().get(request, *args, **kwargs)
+        etag = self.get_etag(request, version)
+
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            key = f'{KEY_PREFIX}:{etag}'
+            data = cache.get(key)
+            if data is not None:
+                response = Response(data)
+            else:
+                response = super().get(request, *args, **kwargs)
+                if response.status_code == 200:
+                    cache.set(key, response.data, settings.SESSION_READ_CACHE_TTL)
+        if response.status_code in (200, 304):
+            response['ETag'] = etag
+            # Clients may keep the response but have to revalidate it on every poll
+            patch_cache_control(response, private=True, no_cache=True)
+        return response
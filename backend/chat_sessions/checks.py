@@ -0,0 +1,31 @@
+from django.core.checks import Error, Tags, register
+from django.db import connections
+from django.db.migrations.recorder import MigrationRecorder
+
+from . import search
+
+SEARCH_MIGRATION = ('chat_sessions', '0012_turn_search_index')
+
+
+@register(Tags.database)
+def check_search_triggers(app_configs, databases=None, **kwargs):
+    """
+    Fails when the search index's triggers are missing, e.g. after a
+    migration rebuilt the turns table on SQLite; new turns would not be
+    indexed. Runs with ``manage.py check --database default`` and migrate.
+    """
+    errors = []
+    for alias in databases or []:
+        conn = connections[alias]
+        if conn.vendor not in search.TRIGGERS:
+            continue
+        if SEARCH_MIGRATION not in MigrationRecorder(conn).applied_migrations():
+            continue
+        missing = search.missing_triggers(conn)
+        if missing:
+            errors.append(Error(
+                f"Search index triggers missing from database '{alias}': {', '.join(missing)}. New turns are not indexed.",
+                hint='Run manage.py search_index --rebuild.',
+                id='chat_sessions.E001',
+            ))
+    return errors
@@ -0,0 +1,148 @@
+"""
+Cold storage for the turns of old completed sessions.
+
+Moving a session to cold storage compresses its turns' prompts and
+responses into ColdTurnBlock rows of up to BLOCK_TURNS turns and empties
+them in the turns table, which keeps the ids, agents, token counts and
+timestamps that counters, pagination and stats work from. Turn querysets
+read the bodies back transparently (see TurnIterable), a block at a time.
+"""
+import datetime
+import json
+import zlib
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Q
+from django.utils import timezone
+
+from .models import ColdTurnBlock, Session, Turn
+
+BLOCK_TURNS = 500
+
+
+def _compress(rows):
+    return zlib.compress(json.dumps(rows, separators=(',', ':')).encode(), 9)
+
+
+def _decompress(data):
+    return json.loads(zlib.decompress(bytes(data)))
+
+
+class ColdBodies:
+    """
+    Looks up the prompt and response of cold turns. A miss reads the block
+    holding the turn and the next few, so turns read in order cost one
+    query per READ_AHEAD blocks.
+
+    ``blocks`` may instead be an iterator over a session's blocks in
+    ``last_turn_id`` order, such as a streamed queryset; turns looked up in
+    id order are then read from it with no further queries.
+    """
+    READ_AHEAD = 4
+
+    def __init__(self, blocks=None):
+        self.bodies = {}
+        self.blocks = blocks
+        self.streamed_up_to = None
+
+    def _advance(self, turn_id):
+        if self.streamed_up_to is not None and turn_id <= self.streamed_up_to:
+            return
+        for block in self.blocks:
+            self.bodies = {row[0]: (row[1], row[2]) for row in _decompress(block.data)}
+            self.streamed_up_to = block.last_turn_id
+            if block.last_turn_id >= turn_id:
+                return
+        self.blocks = None
+
+    def get(self, session_id, turn_id):
+        if turn_id not in self.bodies and self.blocks is not None:
+            self._advance(turn_id)
+        if turn_id not in self.bodies:
+            blocks = ColdTurnBlock.objects.filter(
+                session_id=session_id, last_turn_id__gte=turn_id,
+            ).order_by('last_turn_id').only('data')[:self.READ_AHEAD]
+            self.bodies = {
+                row[0]: (row[1], row[2]) for block in blocks for row in _decompress(block.data)
+            }
+        return self.bodies.get(turn_id, ('', ''))
+
+    def load(self, turns):
+        """Reads the blocks holding the given (session id, turn id) pairs in one query."""
+        match = Q()
+        for session_id, turn_id in turns:
+            match |= Q(session_id=session_id, first_turn_id__lte=turn_id, last_turn_id__gte=turn_id)
+        if not match:
+            return
+        for block in ColdTurnBlock.objects.filter(match).only('data'):
+            self.bodies.update((row[0], (row[1], row[2])) for row in _decompress(block.data))
+
+
+def cold_candidates(older_than=None):
+    """
+    Completed sessions left alone for ``older_than`` that still have hot
+    turns, the longest untouched first.
+    """
+    if older_than is None:
+        older_than = datetime.timedelta(days=settings.TURN_COLD_STORAGE_DAYS)
+    cutoff = timezone.now() - older_than
+    hot = Turn.objects.filter(session=OuterRef('pk'), cold=False)
+    return Session.objects.filter(status='COMPLETED', updated_at__lt=cutoff).filter(Exists(hot)).order_by('updated_at', 'id')
+
+
+def _block(session, rows):
+    return ColdTurnBlock(
+        session=session,
+        first_turn_id=rows[0][0],
+        last_turn_id=rows[-1][0],
+        turn_count=len(rows),
+        data=_compress([list(row) for row in rows]),
+        raw_bytes=sum(len(prompt.encode()) + len(response.encode()) for _, prompt, response in rows),
+    )
+
+
+@transaction.atomic
+def freeze_session(session):
+    """
+    Moves the session's hot turns to cold storage. Returns how many turns
+    were moved and their uncompressed and compressed sizes in bytes.
+    """
+    turns = (
+        Turn.objects.filter(session=session, cold=False)
+        .select_for_update()
+        .order_by('id')
+        .values_list('id', 'prompt', 'response')
+    )
+    blocks, rows = [], []
+    for row in turns.iterator(chunk_size=BLOCK_TURNS):
+        rows.append(row)
+        if len(rows) == BLOCK_TURNS:
+            blocks.append(_block(session, rows))
+            rows = []
+    if rows:
+        blocks.append(_block(session, rows))
+    if not blocks:
+        return 0, 0, 0
+
+    ColdTurnBlock.objects.bulk_create(blocks)
+    Turn.objects.filter(session=session, cold=False, id__lte=blocks[-1].last_turn_id).update(
+        prompt='', response='', cold=True,
+    )
+    return (
+        sum(block.turn_count for block in blocks),
+        sum(block.raw_bytes for block in blocks),
+        sum(len(block.data) for block in blocks),
+    )
+
+
+@transaction.atomic
+def thaw_session(session):
+    """Moves the session's cold turns back into the turns table."""
+    turns = []
+    for block in ColdTurnBlock.objects.filter(session=session):
+        for turn_id, prompt, response in _decompress(block.data):
+            turns.append(Turn(id=turn_id, prompt=prompt, response=response, cold=False))
+    Turn.objects.bulk_update(turns, ['prompt', 'response', 'cold'], batch_size=BLOCK_TURNS)
+    ColdTurnBlock.objects.filter(session=session).delete()
+    return len(turns)
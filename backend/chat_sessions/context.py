@@ -0,0 +1,85 @@
+from collections import deque
+
+import numpy as np
+from django.conf import settings
+
+from .memory import SessionMemory
+from .models import Turn
+
+
+def _line(turn):
+    return f"{turn.agent.name}: {turn.response}\n\n"
+
+
+class ConversationContext:
+    """
+    The conversation as sent to providers, in the "Agent: response" form.
+
+    Long sessions are not sent in full: the prompt holds the last
+    MEMORY_RECENT_TURNS turns, preceded by the MEMORY_RETRIEVED_TURNS older
+    turns most related to them (see memory.py), so its size stays the same
+    however long the debate runs. Sessions short enough to fit are sent
+    whole.
+    """
+
+    def __init__(self, session, memory, recent):
+        self.session = session
+        self.memory = memory
+        # (turn id, line) of the most recent turns, oldest first
+        self.recent = deque(recent, maxlen=settings.MEMORY_RECENT_TURNS)
+        self.retrieved_turns = settings.MEMORY_RETRIEVED_TURNS
+        # Lines of the older turns in the prompt by turn id, so a turn that
+        # stays in it, or has just left the recent ones, isn't read again
+        self.earlier = {}
+        self.prompt = ''
+
+    @classmethod
+    def load(cls, session):
+        memory = SessionMemory.load(session)
+        recent = (
+            session.turns.select_related('agent')
+            .only('id', 'session', 'response', 'created_at', 'agent', 'agent__name')
+            .order_by('-created_at', '-id')[:settings.MEMORY_RECENT_TURNS]
+        )
+        context = cls(session, memory, reversed([(turn.id, _line(turn)) for turn in recent]))
+        context.refresh()
+        return context
+
+    @property
+    def is_empty(self):
+        return not self.recent
+
+    def append(self, turn):
+        # append_turn stores the embedding along with the turn
+        self.memory.add(turn.id, np.frombuffer(turn.embedding.vector, dtype=np.float32))
+        if self.recent and len(self.recent) == self.recent.maxlen:
+            turn_id, line = self.recent[0]
+            self.earlier[turn_id] = line
+        self.recent.append((turn.id, _line(turn)))
+        self.refresh()
+
+    def refresh(self):
+        recent_ids = [turn_id for turn_id, _ in self.recent]
+        older = len(self.memory) - len(self.recent)
+        if older > self.retrieved_turns:
+            earlier_ids = self.memory.related(recent_ids, self.retrieved_turns)
+        else:
+            earlier_ids = set(self.memory.turn_ids) - set(recent_ids)
+
+        missing = [turn_id for turn_id in earlier_ids if turn_id not in self.earlier]
+        if missing:
+            turns = (
+                Turn.objects.filter(id__in=missing).select_related('agent')
+                .only('id', 'session', 'response', 'created_at', 'agent', 'agent__name')
+            )
+            for turn in turns:
+                self.earlier[turn.id] = _line(turn)
+        # Only the lines in the prompt are kept, in the order of the turns
+        self.earlier = {
+            turn_id: self.earlier[turn_id]
+            for turn_id in sorted(earlier_ids, key=self.memory.rows.get) if turn_id in self.earlier
+        }
+        lines = list(self.earlier.values())
+        if older > self.retrieved_turns:
+            lines = ["[Earlier turns related to the discussion]\n\n", *lines, "[Most recent turns]\n\n"]
+        self.prompt = ''.join(lines + [line for _, line in self.recent])
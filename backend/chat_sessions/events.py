@@ -0,0 +1,17 @@
+import json
+
+from .serializers import TurnSerializer
+
+
+def event_payload(event, data):
+    if event == 'turn_start':
+        return {'agent': data.id, 'agent_name': data.name}
+    if event == 'token':
+        return {'text': data}
+    if event == 'turn_end':
+        return TurnSerializer(data).data
+    return {'turn': data.id}
+
+
+def format_event(event, payload):
+    return f"event: {event}\ndata: {json.dumps(payload, default=str)}\n\n"
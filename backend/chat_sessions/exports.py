@@ -0,0 +1,247 @@
+"""
+Streaming transcript exports.
+
+Each writer is a generator over the session's turns that yields the file in
+pieces, so an export starts sending as soon as the first turns are read and
+holds only one chunk of turns in memory however long the session is.
+"""
+import textwrap
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+# Turns fetched per database round trip
+CHUNK_SIZE = 500
+# Text is buffered up to this many characters before it is sent
+FLUSH_SIZE = 64 * 1024
+
+RULE = '=' * 50
+
+
+def iter_turns(session):
+    return (
+        session.turns.select_related('agent')
+        .only(
+            'id', 'session', 'prompt', 'response', 'created_at', 'prompt_tokens', 'completion_tokens',
+            'latency_ms', 'agent', 'agent__name',
+        )
+        .order_by('created_at', 'id')
+        .iterator(chunk_size=CHUNK_SIZE)
+    )
+
+
+def buffered(chunks, size=FLUSH_SIZE):
+    """Joins small chunks so the response is written in blocks of ``size``."""
+    buffer, length = [], 0
+    for chunk in chunks:
+        buffer.append(chunk)
+        length += len(chunk)
+        if length >= size:
+            yield ''.join(buffer)
+            buffer, length = [], 0
+    if buffer:
+        yield ''.join(buffer)
+
+
+def _timestamp(value):
+    return value.strftime('%Y-%m-%d %H:%M:%S')
+
+
+def text_export(session, participants):
+    yield "AgentVerse Session Transcript\n"
+    yield f"{RULE}\n\n"
+    yield f"Session ID: {session.id}\n"
+    yield f"Topic: {session.topic}\n"
+    yield f"Created: {_timestamp(session.created_at)}\n"
+    yield f"Participants: {', '.join(participants)}\n"
+    yield f"\n{RULE}\n\n"
+
+    for i, turn in enumerate(iter_turns(session), 1):
+        yield (
+            f"Turn {i} - {turn.agent.name}\n"
+            f"{'-' * 50}\n"
+            f"Time: {_timestamp(turn.created_at)}\n\n"
+            f"{turn.response}\n\n"
+            f"{RULE}\n\n"
+        )
+
+
+def markdown_export(session, participants):
+    yield f"# {session.topic}\n\n"
+    yield f"- **Session ID:** {session.id}\n"
+    yield f"- **Created:** {_timestamp(session.created_at)}\n"
+    yield f"- **Participants:** {', '.join(participants)}\n\n"
+
+    for i, turn in enumerate(iter_turns(session), 1):
+        yield (
+            f"## Turn {i} - {turn.agent.name}\n\n"
+            f"*{_timestamp(turn.created_at)}*\n\n"
+            f"{turn.response}\n\n"
+        )
+
+
+def jsonl_export(session, participants):
+    """One JSON object per line: the session first, then each turn."""
+    encoder = DjangoJSONEncoder()
+    yield encoder.encode({
+        'type': 'session',
+        'id': session.id,
+        'topic': session.topic,
+        'status': session.status,
+        'mode': session.mode,
+        'created_at': session.created_at,
+        'participants': participants,
+    }) + '\n'
+
+    for turn in iter_turns(session):
+        yield encoder.encode({
+            'type': 'turn',
+            'id': turn.id,
+            'agent': turn.agent.id,
+            'agent_name': turn.agent.name,
+            'prompt': turn.prompt,
+            'response': turn.response,
+            'prompt_tokens': turn.prompt_tokens,
+            'completion_tokens': turn.completion_tokens,
+            'latency_ms': turn.latency_ms,
+            'created_at': turn.created_at,
+        }) + '\n'
+
+
+class PDFWriter:
+    """
+    Minimal PDF 1.4 writer that emits each page as soon as it is full.
+
+    Text is set in the standard Helvetica fonts, which every PDF reader has,
+    so nothing is embedded; characters outside Windows-1252 print as ``?``.
+    The page tree is written last, once the page objects are known.
+    """
+    page_width = 612
+    page_height = 792
+    margin = 54
+    font_size = 10
+    leading = 13
+    # Helvetica averages about half an em per character
+    wrap_width = 90
+
+    CATALOG, PAGES, FONT, BOLD_FONT = 1, 2, 3, 4
+
+    def __init__(self):
+        self.offset = 0
+        self.offsets = {}
+        self.next_id = 5
+        self.page_ids = []
+        self.lines = []
+        self.lines_per_page = (self.page_height - 2 * self.margin) // self.leading
+
+    def _object(self, number, body):
+        self.offsets[number] = self.offset
+        data = f"{number} 0 obj\n".encode() + body + b"\nendobj\n"
+        self.offset += len(data)
+        return data
+
+    def _write(self, data):
+        self.offset += len(data)
+        return data
+
+    def start(self):
+        return b''.join([
+            self._write(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n"),
+            self._object(self.CATALOG, f"<< /Type /Catalog /Pages {self.PAGES} 0 R >>".encode()),
+            self._object(self.FONT, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>"),
+            self._object(self.BOLD_FONT, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica-Bold /Encoding /WinAnsiEncoding >>"),
+        ])
+
+    @staticmethod
+    def _escape(text):
+        encoded = text.encode('cp1252', 'replace')
+        return encoded.replace(b'\\', b'\\\\').replace(b'(', b'\\(').replace(b')', b'\\)')
+
+    def add(self, text, bold=False):
+        """Queues a paragraph, wrapped to the page; returns any pages that filled up."""
+        pages = []
+        for paragraph_line in text.splitlines() or ['']:
+            wrapped = textwrap.wrap(paragraph_line.expandtabs(4), self.wrap_width) or ['']
+            for line in wrapped:
+                self.lines.append((line, bold))
+                if len(self.lines) == self.lines_per_page:
+                    pages.append(self._page())
+        return b''.join(pages)
+
+    def _page(self):
+        content = [
+            b"BT",
+            f"{self.leading} TL".encode(),
+            f"{self.margin} {self.page_height - self.margin - self.font_size} Td".encode(),
+        ]
+        font = None
+        for line, bold in self.lines:
+            if bold != font:
+                font = bold
+                content.append(f"/{'F2' if bold else 'F1'} {self.font_size} Tf".encode())
+            content.append(b"(" + self._escape(line) + b") Tj T*")
+        content.append(b"ET")
+        stream = b"\n".join(content)
+        self.lines = []
+
+        content_id, page_id = self.next_id, self.next_id + 1
+        self.next_id += 2
+        self.page_ids.append(page_id)
+        return self._object(
+            content_id, f"<< /Length {len(stream)} >>\nstream\n".encode() + stream + b"\nendstream",
+        ) + self._object(page_id, (
+            f"<< /Type /Page /Parent {self.PAGES} 0 R "
+            f"/MediaBox [0 0 {self.page_width} {self.page_height}] "
+            f"/Resources << /Font << /F1 {self.FONT} 0 R /F2 {self.BOLD_FONT} 0 R >> >> "
+            f"/Contents {content_id} 0 R >>"
+        ).encode())
+
+    def finish(self):
+        data = [self._page()] if self.lines or not self.page_ids else []
+        kids = ' '.join(f"{page_id} 0 R" for page_id in self.page_ids)
+        data.append(self._object(
+            self.PAGES, f"<< /Type /Pages /Kids [{kids}] /Count {len(self.page_ids)} >>".encode(),
+        ))
+
+        xref_offset = self.offset
+        xref = [f"xref\n0 {self.next_id}\n", "0000000000 65535 f \n"]
+        for number in range(1, self.next_id):
+            xref.append(f"{self.offsets[number]:010d} 00000 n \n")
+        xref.append(
+            f"trailer\n<< /Size {self.next_id} /Root {self.CATALOG} 0 R >>\n"
+            f"startxref\n{xref_offset}\n%%EOF\n"
+        )
+        data.append(''.join(xref).encode())
+        return b''.join(data)
+
+
+def pdf_export(session, participants):
+    pdf = PDFWriter()
+    yield pdf.start() + pdf.add("AgentVerse Session Transcript", bold=True) + pdf.add(
+        f"Session ID: {session.id}\n"
+        f"Topic: {session.topic}\n"
+        f"Created: {_timestamp(session.created_at)}\n"
+        f"Participants: {', '.join(participants)}\n"
+    )
+
+    for i, turn in enumerate(iter_turns(session), 1):
+        page = pdf.add(f"Turn {i} - {turn.agent.name}", bold=True)
+        page += pdf.add(f"{_timestamp(turn.created_at)}\n\n{turn.response}\n")
+        if page:
+            yield page
+    yield pdf.finish()
+
+
+# format -> (writer, content type, file extension)
+EXPORT_FORMATS = {
+    'txt': (text_export, 'text/plain; charset=utf-8', 'txt'),
+    'md': (markdown_export, 'text/markdown; charset=utf-8', 'md'),
+    'jsonl': (jsonl_export, 'application/x-ndjson', 'jsonl'),
+    'pdf': (pdf_export, 'application/pdf', 'pdf'),
+}
+
+
+def export_stream(session, fmt, participants):
+    writer = EXPORT_FORMATS[fmt][0]
+    if fmt == 'pdf':
+        return writer(session, participants)
+    return buffered(writer(session, participants))
@@ -0,0 +1,195 @@
+import os
+import socket
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Exists, F, OuterRef, Q
+from django.utils import timezone
+
+from .models import OrchestrationJob
+from .orchestration import OrchestrationError, run_conversation, arun_conversation
+from .serializers import OrchestrationJobSerializer
+
+DEFAULT_LEASE_SECONDS = 300
+
+
+def default_worker_id():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+class SessionBusy(Exception):
+    """
+    Raised when a job is added for a session that already has a PENDING or
+    RUNNING one; ``payload`` is the 409 response body.
+    """
+
+    def __init__(self, session):
+        super().__init__('A conversation is already running for this session')
+        self.payload = busy_payload(active_job_for(session))
+
+
+def busy_payload(job):
+    return {
+        'error': 'A conversation is already running for this session',
+        'job': OrchestrationJobSerializer(job).data if job else None,
+    }
+
+
+def _create_job(session, **fields):
+    # The one_active_job_per_session constraint settles concurrent requests
+    # that both passed conversation_blocker
+    try:
+        with transaction.atomic():
+            return OrchestrationJob.objects.create(session=session, **fields)
+    except IntegrityError:
+        raise SessionBusy(session)
+
+
+def enqueue_job(session, prompt):
+    """Queues a conversation for the workers; raises SessionBusy if one is active."""
+    return _create_job(session, prompt=prompt)
+
+
+def start_inline_job(session, prompt, worker_id, lease_seconds=DEFAULT_LEASE_SECONDS):
+    """
+    Records a conversation that runs inside the current process (e.g. a
+    streaming request) so that queued workers and other requests see the
+    session as busy. Raises SessionBusy if a job is already active.
+    """
+    now = timezone.now()
+    return _create_job(
+        session,
+        prompt=prompt,
+        status='RUNNING',
+        attempts=1,
+        locked_by=worker_id,
+        locked_until=now + timedelta(seconds=lease_seconds),
+        started_at=now,
+    )
+
+
+def active_job_for(session):
+    return session.jobs.filter(status__in=['PENDING', 'RUNNING']).order_by('created_at').first()
+
+
+def conversation_blocker(session, prompt):
+    """
+    Returns an ``(error payload, HTTP status)`` pair when a conversation
+    cannot be started for the session, or None.
+    """
+    if not prompt:
+        return {'error': 'Prompt is required'}, 400
+
+    if session.status != 'ACTIVE':
+        return {'error': 'Session is not active'}, 400
+
+    # Check if max turns reached
+    if session.turn_count >= session.max_turns:
+        session.status = 'COMPLETED'
+        session.save(update_fields=['status', 'updated_at'])
+        return {'error': 'Max turns reached'}, 400
+
+    if not session.agents.exists():
+        return {'error': 'No agents in session'}, 400
+
+    # Only one conversation may run per session at a time
+    running = active_job_for(session)
+    if running:
+        return busy_payload(running), 409
+
+    return None
+
+
+def lease_job(worker_id, lease_seconds=DEFAULT_LEASE_SECONDS):
+    """
+    Claims the oldest runnable job for ``worker_id``.
+
+    A job is runnable when it is PENDING, or RUNNING with an expired lease
+    (its worker died) and fewer than JOB_MAX_ATTEMPTS attempts; a job whose
+    lease expired on its last attempt is marked FAILED. Jobs of a session
+    with a live RUNNING job are skipped. The claim is a conditional UPDATE
+    so that several worker processes can poll the same table without
+    running a job twice.
+    """
+    now = timezone.now()
+    max_attempts = settings.JOB_MAX_ATTEMPTS
+    runnable = Q(status='PENDING') | Q(status='RUNNING', locked_until__lt=now, attempts__lt=max_attempts)
+
+    OrchestrationJob.objects.filter(status='RUNNING', locked_until__lt=now, attempts__gte=max_attempts).update(
+        status='FAILED',
+        error=f'Gave up after {max_attempts} attempts',
+        locked_until=None,
+        finished_at=now,
+    )
+    busy = OrchestrationJob.objects.filter(session=OuterRef('session'), status='RUNNING', locked_until__gte=now)
+
+    with transaction.atomic():
+        candidates = (
+            OrchestrationJob.objects
+            .select_for_update(skip_locked=True)
+            .filter(runnable)
+            .exclude(Exists(busy))
+            .order_by('created_at')
+            .values_list('id', flat=True)[:10]
+        )
+        for job_id in list(candidates):
+            claimed = OrchestrationJob.objects.filter(runnable, pk=job_id).update(
+                status='RUNNING',
+                locked_by=worker_id,
+                locked_until=now + timedelta(seconds=lease_seconds),
+                started_at=now,
+                attempts=F('attempts') + 1,
+            )
+            if claimed:
+                return OrchestrationJob.objects.select_related('session', 'session__user').get(pk=job_id)
+    return None
+
+
+def extend_lease(job, lease_seconds=DEFAULT_LEASE_SECONDS):
+    job.locked_until = timezone.now() + timedelta(seconds=lease_seconds)
+    OrchestrationJob.objects.filter(pk=job.pk, locked_by=job.locked_by).update(locked_until=job.locked_until)
+
+
+def run_job(job, lease_seconds=DEFAULT_LEASE_SECONDS):
+    session = job.session
+    status, error = 'SUCCEEDED', ''
+
+    if session.status != 'ACTIVE':
+        status, error = 'FAILED', 'Session is not active'
+    else:
+        try:
+            run_conversation(session, job.prompt, on_turn=lambda turn: extend_lease(job, lease_seconds))
+        except OrchestrationError as e:
+            status, error = 'FAILED', str(e)
+        except Exception as e:
+            status, error = 'FAILED', f'Unexpected error: {str(e)}'
+
+    return finish_job(job, status, error)
+
+
+async def arun_job(job, lease_seconds=DEFAULT_LEASE_SECONDS):
+    session = job.session
+    status, error = 'SUCCEEDED', ''
+
+    if session.status != 'ACTIVE':
+        status, error = 'FAILED', 'Session is not active'
+    else:
+        try:
+            await arun_conversation(session, job.prompt, on_turn=sync_to_async(lambda turn: extend_lease(job, lease_seconds)))
+        except OrchestrationError as e:
+            status, error = 'FAILED', str(e)
+        except Exception as e:
+            status, error = 'FAILED', f'Unexpected error: {str(e)}'
+
+    return await sync_to_async(finish_job)(job, status, error)
+
+
+def finish_job(job, status, error=''):
+    job.status = status
+    job.error = error
+    job.locked_until = None
+    job.finished_at = timezone.now()
+    job.save(update_fields=['status', 'error', 'locked_until', 'finished_at'])
+    return job
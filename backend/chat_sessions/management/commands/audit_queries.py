@@ -0,0 +1,41 @@
+import logging
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from chat_sessions import audit
+
+
+class Command(BaseCommand):
+    help = 'Runs EXPLAIN on the queries the API issues and flags full scans and sorts'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--turns', type=int, default=1000, help='Turns in the audited session')
+        parser.add_argument('--all', action='store_true', help='Show every query, not only the flagged ones')
+        parser.add_argument('--check', action='store_true', help='Exit with an error if any query is flagged')
+
+    def handle(self, *args, **options):
+        if connection.vendor not in audit.VENDORS:
+            raise CommandError(f'Query plans can only be read on SQLite and PostgreSQL, not {connection.vendor}.')
+        # Like benchmark_sessions, the fixtures go into a throwaway test database
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        logging.disable(logging.WARNING)
+        try:
+            results = audit.run(options['turns'])
+        finally:
+            logging.disable(logging.NOTSET)
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        flagged = [result for result in results if result['issues']]
+        for result in results if options['all'] else flagged:
+            heading = f"[{result['probe']}] {', '.join(result['issues']) or 'ok'}"
+            if result['accepted']:
+                heading += f"; accepted: {', '.join(result['accepted'])}"
+            self.stdout.write(self.style.ERROR(heading) if result['issues'] else heading)
+            self.stdout.write(f"  {result['sql']}")
+            for line in result['plan']:
+                self.stdout.write(f"    {line}")
+        self.stdout.write(f"{len(results)} queries explained, {len(flagged)} flagged")
+        if flagged and options['check']:
+            raise CommandError(f'{len(flagged)} queries need an index')
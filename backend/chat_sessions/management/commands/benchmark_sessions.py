@@ -0,0 +1,72 @@
+import json
+import logging
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from chat_sessions import benchmarks
+
+BASELINE_PATH = Path(benchmarks.__file__).with_name('benchmark_baseline.json')
+
+
+class Command(BaseCommand):
+    help = 'Benchmarks the session read paths at increasing session sizes against a stored baseline'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=list(benchmarks.DEFAULT_SIZES),
+                            help='Session sizes (turns) to benchmark')
+        parser.add_argument('--cases', nargs='+', choices=list(benchmarks.CASES), help='Only run these cases')
+        parser.add_argument('--repeat', type=int, default=3, help='Timed runs per case; the median is reported')
+        parser.add_argument('--baseline', default=str(BASELINE_PATH), help='Baseline file to compare against')
+        parser.add_argument('--save-baseline', action='store_true', help='Write the results as the new baseline')
+        parser.add_argument('--tolerance', type=float, default=0.5,
+                            help='Allowed slowdown / memory growth over the baseline, as a fraction')
+        parser.add_argument('--check', action='store_true', help='Exit with an error if anything regressed')
+        parser.add_argument('--test-db', help='Test database name; a file path on SQLite, for sessions too large for memory')
+
+    def handle(self, *args, **options):
+        # The fixtures go into a throwaway test database, never the real one
+        old_name = connection.settings_dict['NAME']
+        if options['test_db']:
+            connection.settings_dict['TEST']['NAME'] = options['test_db']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        # Provider calls log retries and waits; keep the table readable
+        logging.disable(logging.WARNING)
+        try:
+            results = benchmarks.run(options['sizes'], options['cases'], repeat=options['repeat'])
+        finally:
+            logging.disable(logging.NOTSET)
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        baseline_path = Path(options['baseline'])
+        baseline = {}
+        if baseline_path.exists():
+            baseline = json.loads(baseline_path.read_text())['results']
+
+        regressions = self.report(results, baseline, options['sizes'], options['tolerance'])
+
+        if options['save_baseline']:
+            baseline_path.write_text(json.dumps({'results': results}, indent=2, sort_keys=True) + '\n')
+            self.stdout.write(f'Baseline written to {baseline_path}')
+        if regressions and options['check']:
+            raise CommandError(f'{len(regressions)} benchmark regression(s)')
+
+    def report(self, results, baseline, sizes, tolerance):
+        self.stdout.write(f"{'case':<12}{'turns':>8}{'ms':>12}{'queries':>9}{'peak KB':>11}{'growth':>8}  vs baseline")
+        regressions = []
+        for key, result in results.items():
+            name, size = key.split('/')
+            exponent = benchmarks.growth(results, name, int(size), sizes)
+            growth = f'{exponent:.2f}' if exponent is not None else '-'
+            problems = []
+            if key in baseline:
+                problems = benchmarks.compare(result, baseline[key], tolerance)
+                regressions.extend(problems)
+                change = (result['ms'] / baseline[key]['ms'] - 1) * 100 if baseline[key]['ms'] else 0
+                verdict = f'{change:+.0f}%' + (f"  REGRESSED: {', '.join(problems)}" if problems else '')
+            else:
+                verdict = 'new'
+            line = f"{name:<12}{size:>8}{result['ms']:>12.2f}{result['queries']:>9}{result['peak_kb']:>11.0f}{growth:>8}  {verdict}"
+            self.stdout.write(self.style.ERROR(line) if problems else line)
+        return regressions
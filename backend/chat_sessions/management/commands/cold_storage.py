@@ -0,0 +1,38 @@
+import datetime
+
+from django.core.management.base import BaseCommand
+
+from chat_sessions.coldstorage import cold_candidates, freeze_session, thaw_session
+from chat_sessions.models import Session
+
+
+class Command(BaseCommand):
+    help = 'Compresses the turns of old completed sessions into cold storage'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, help='Only sessions completed at least this many days ago (default: TURN_COLD_STORAGE_DAYS)')
+        parser.add_argument('--limit', type=int, default=100, help='Most sessions to move in this run')
+        parser.add_argument('--dry-run', action='store_true', help='List the sessions that would be moved')
+        parser.add_argument('--thaw', type=int, nargs='+', metavar='SESSION', help='Move these sessions back out of cold storage')
+
+    def handle(self, *args, **options):
+        if options['thaw']:
+            for session in Session.objects.filter(pk__in=options['thaw']):
+                self.stdout.write(f"Session {session.pk}: {thaw_session(session)} turns restored")
+            return
+
+        older_than = datetime.timedelta(days=options['days']) if options['days'] is not None else None
+        sessions = cold_candidates(older_than)[:options['limit']]
+        moved = raw = stored = 0
+        # Each session is moved in its own transaction, so an interrupted run loses nothing
+        for session in sessions:
+            if options['dry_run']:
+                self.stdout.write(f"Session {session.pk}: {session.turn_count} turns")
+                continue
+            turns, raw_bytes, stored_bytes = freeze_session(session)
+            moved += turns
+            raw += raw_bytes
+            stored += stored_bytes
+            self.stdout.write(f"Session {session.pk}: {turns} turns, {raw_bytes} -> {stored_bytes} bytes")
+        if not options['dry_run']:
+            self.stdout.write(f"Moved {moved} turns to cold storage, {raw} -> {stored} bytes")
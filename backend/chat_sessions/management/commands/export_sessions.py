@@ -0,0 +1,34 @@
+import sys
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from chat_sessions.archive import COMPRESSIONS, ArchiveError, export_archive
+
+
+class Command(BaseCommand):
+    help = "Writes a user's sessions, agents and turns to an archive"
+
+    def add_arguments(self, parser):
+        parser.add_argument('username')
+        parser.add_argument('-o', '--output', default='-', help='Archive file to write, or - for stdout')
+        parser.add_argument('--session', type=int, action='append', dest='sessions', help='Only this session (repeatable)')
+        parser.add_argument('--compress', choices=COMPRESSIONS, help='Compress the JSON Lines archive')
+        parser.add_argument('--zip', action='store_true', help='Write a zip archive instead')
+
+    def handle(self, *args, **options):
+        try:
+            user = get_user_model().objects.get(username=options['username'])
+        except get_user_model().DoesNotExist:
+            raise CommandError(f"No user named {options['username']}")
+
+        chunks = export_archive(user, options['sessions'], compression=options['compress'], as_zip=options['zip'])
+        output = sys.stdout.buffer if options['output'] == '-' else open(options['output'], 'wb')
+        try:
+            for chunk in chunks:
+                output.write(chunk)
+        except ArchiveError as e:
+            raise CommandError(str(e))
+        finally:
+            if output is not sys.stdout.buffer:
+                output.close()
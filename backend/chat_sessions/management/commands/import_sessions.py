@@ -0,0 +1,31 @@
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from chat_sessions.archive import ArchiveError, import_archive
+
+
+class Command(BaseCommand):
+    help = 'Imports an archive written by export_sessions for a user'
+
+    def add_arguments(self, parser):
+        parser.add_argument('username')
+        parser.add_argument('archive', help='Archive file to read: JSON Lines, gzip, zstd or zip')
+
+    def handle(self, *args, **options):
+        try:
+            user = get_user_model().objects.get(username=options['username'])
+        except get_user_model().DoesNotExist:
+            raise CommandError(f"No user named {options['username']}")
+
+        started = time.monotonic()
+        try:
+            with open(options['archive'], 'rb') as archive:
+                counts = import_archive(user, archive)
+        except (ArchiveError, OSError) as e:
+            raise CommandError(str(e))
+        self.stdout.write(
+            f"Imported {counts['agents']} agents, {counts['sessions']} sessions and {counts['turns']} turns "
+            f"in {time.monotonic() - started:.1f}s"
+        )
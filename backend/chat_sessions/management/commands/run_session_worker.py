@@ -0,0 +1,106 @@
+import asyncio
+import multiprocessing
+import time
+
+from asgiref.sync import sync_to_async
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from chat_sessions.jobs import DEFAULT_LEASE_SECONDS, default_worker_id, lease_job, run_job, arun_job
+from core import llm_cache, ratelimit
+
+
+class StatsReporter:
+    """
+    Logs the rate limiter's and the response cache's stats at most every
+    ``interval`` seconds; 0 turns it off.
+    """
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.due = time.monotonic() + interval
+
+    def tick(self):
+        if self.interval and time.monotonic() >= self.due:
+            ratelimit.log_stats()
+            llm_cache.log_stats()
+            self.due = time.monotonic() + self.interval
+
+
+def work_loop(poll_interval, lease_seconds, once=False, stats_interval=0):
+    worker_id = default_worker_id()
+    reporter = StatsReporter(stats_interval)
+    while True:
+        reporter.tick()
+        job = lease_job(worker_id, lease_seconds=lease_seconds)
+        if job:
+            run_job(job, lease_seconds=lease_seconds)
+            continue
+        if once:
+            return
+        time.sleep(poll_interval)
+
+
+def async_work_loop(poll_interval, lease_seconds, once=False, concurrency=1, stats_interval=0):
+    """
+    Runs up to ``concurrency`` conversations at once on one event loop, each
+    suspended while its provider call is in flight.
+    """
+    reporter = StatsReporter(stats_interval)
+
+    async def runner():
+        worker_id = default_worker_id()
+        while True:
+            reporter.tick()
+            job = await sync_to_async(lease_job)(worker_id, lease_seconds=lease_seconds)
+            if job:
+                await arun_job(job, lease_seconds=lease_seconds)
+                continue
+            if once:
+                return
+            await asyncio.sleep(poll_interval)
+
+    async def main():
+        await asyncio.gather(*(runner() for _ in range(concurrency)))
+
+    asyncio.run(main())
+
+
+class Command(BaseCommand):
+    help = 'Runs queued session orchestration jobs'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=1, help='Number of worker processes to run')
+        parser.add_argument('--poll-interval', type=float, default=1.0, help='Seconds to wait when the queue is empty')
+        parser.add_argument('--lease-seconds', type=int, default=DEFAULT_LEASE_SECONDS,
+                            help='How long a job stays leased without progress before another worker may take it')
+        parser.add_argument('--concurrency', type=int, default=1,
+                            help='Conversations each process runs concurrently on an asyncio event loop')
+        parser.add_argument('--once', action='store_true', help='Drain the queue and exit')
+        parser.add_argument('--stats-interval', type=int, default=300,
+                            help="Seconds between logging the process's rate limiter and response cache stats (0 to turn off)")
+
+    def handle(self, *args, **options):
+        args = (options['poll_interval'], options['lease_seconds'], options['once'])
+        kwargs = {'stats_interval': options['stats_interval']}
+        processes = max(1, options['processes'])
+        concurrency = max(1, options['concurrency'])
+        target = work_loop
+        if concurrency > 1:
+            target = async_work_loop
+            args += (concurrency,)
+
+        if processes == 1:
+            self.stdout.write('Session worker started')
+            target(*args, **kwargs)
+            return
+
+        # Forked children must not share the parent's database connections
+        connections.close_all()
+        workers = [multiprocessing.Process(target=target, args=args, kwargs=kwargs) for _ in range(processes)]
+        for worker in workers:
+            worker.start()
+        self.stdout.write(f'Session worker started with {processes} processes')
+        for worker in workers:
+            worker.join()
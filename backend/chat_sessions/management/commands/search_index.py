@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from chat_sessions import search
+
+
+class Command(BaseCommand):
+    help = 'Creates or rebuilds the full-text search index over turns'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rebuild', action='store_true', help='Drop the index and index every turn again')
+        parser.add_argument('--check', action='store_true', help='Fail if the triggers that index new turns are missing')
+
+    def handle(self, *args, **options):
+        if options['check']:
+            missing = search.missing_triggers()
+            if missing:
+                raise CommandError(f"Search index triggers are missing: {', '.join(missing)}. Run search_index --rebuild.")
+            self.stdout.write('Search index triggers are in place')
+        elif options['rebuild']:
+            self.stdout.write(f"Indexed {search.rebuild()} turns")
+        else:
+            search.install()
+            self.stdout.write('Search index and triggers are in place')
@@ -0,0 +1,136 @@
+"""
+Per-session retrieval memory over turns.
+
+Each turn is embedded as it is written (see turns.py) with a hashing
+vectorizer: its words are hashed into DIMENSIONS signed buckets, counted with
+sublinear weighting and normalized, and the vector is stored as float32 bytes
+in TurnEmbedding. It runs locally with no model to download. When turns are
+retrieved the vectors are weighted by inverse document frequency across the
+session, so words every turn uses count for little, and the older turns are
+ranked by cosine similarity to the recent ones in one matrix product.
+"""
+import re
+import zlib
+
+import numpy as np
+
+from .models import TurnEmbedding
+
+DIMENSIONS = 512
+# Turns embedded per insert when filling in missing embeddings
+BATCH_SIZE = 1000
+# Rows scored at a time, which bounds the temporary arrays of a search
+SCORE_ROWS = 4096
+
+WORD_RE = re.compile(r'\w\w+')
+
+
+def turn_text(prompt, response):
+    return f'{prompt}\n{response}' if prompt else response
+
+
+def embed(text):
+    """Hashing-vectorizer embedding of ``text`` as a unit float32 vector."""
+    vector = np.zeros(DIMENSIONS, dtype=np.float32)
+    words = WORD_RE.findall(text.lower())
+    if not words:
+        return vector
+    hashes = np.fromiter((zlib.crc32(word.encode()) for word in words), dtype=np.uint32, count=len(words))
+    # The low bits pick the bucket and the top bit the sign, so collisions tend to cancel out
+    np.add.at(vector, hashes % DIMENSIONS, np.where(hashes >> 31, -1.0, 1.0).astype(np.float32))
+    vector = np.sign(vector) * np.log1p(np.abs(vector))
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+def embedding_for(turn):
+    return TurnEmbedding(
+        turn=turn, session_id=turn.session_id, vector=embed(turn_text(turn.prompt, turn.response)).tobytes(),
+    )
+
+
+def embed_missing(session):
+    """
+    Embeds the session's turns that have no embedding yet, such as turns
+    from archive imports or bulk inserts. Returns how many were embedded.
+    """
+    turns = session.turns.filter(embedding__isnull=True).only('id', 'session', 'prompt', 'response').order_by('id')
+    batch, count = [], 0
+    for turn in turns.iterator(chunk_size=BATCH_SIZE):
+        batch.append(embedding_for(turn))
+        if len(batch) == BATCH_SIZE:
+            TurnEmbedding.objects.bulk_create(batch)
+            count += len(batch)
+            batch = []
+    TurnEmbedding.objects.bulk_create(batch)
+    return count + len(batch)
+
+
+class SessionMemory:
+    """
+    The embeddings of a session's turns as one matrix, held for the length
+    of a conversation run. ``add`` appends a row as each turn is written.
+    """
+
+    def __init__(self, turn_ids=(), vectors=None):
+        self.rows = {turn_id: row for row, turn_id in enumerate(turn_ids)}
+        self.turn_ids = list(turn_ids)
+        if vectors is None:
+            vectors = np.zeros((0, DIMENSIONS), dtype=np.float32)
+        # Rows beyond len(self) are spare room for turns added later
+        self.vectors = vectors
+        # How many turns use each bucket, for the IDF weights
+        self.document_counts = np.count_nonzero(vectors, axis=0)
+
+    @classmethod
+    def load(cls, session):
+        embed_missing(session)
+        rows = TurnEmbedding.objects.filter(session=session).order_by('turn_id').values_list('turn_id', 'vector')
+        turn_ids, data = [], bytearray()
+        for turn_id, vector in rows.iterator(chunk_size=BATCH_SIZE):
+            turn_ids.append(turn_id)
+            data += vector
+        return cls(turn_ids, np.frombuffer(data, dtype=np.float32).reshape(-1, DIMENSIONS))
+
+    def __len__(self):
+        return len(self.turn_ids)
+
+    def add(self, turn_id, vector):
+        count = len(self.turn_ids)
+        if count == len(self.vectors):
+            # Grown by half again when full, so adding turns is amortized O(1)
+            grown = np.zeros((count + count // 2 + 16, DIMENSIONS), dtype=np.float32)
+            grown[:count] = self.vectors
+            self.vectors = grown
+        self.vectors[count] = vector
+        self.rows[turn_id] = count
+        self.turn_ids.append(turn_id)
+        self.document_counts += vector != 0
+
+    def related(self, query_ids, limit):
+        """
+        Ids of up to ``limit`` turns, other than ``query_ids``, most similar
+        to the turns ``query_ids`` taken together, best first.
+        """
+        count = len(self.turn_ids)
+        query_rows = [self.rows[turn_id] for turn_id in query_ids if turn_id in self.rows]
+        limit = min(limit, count - len(query_rows))
+        if limit <= 0:
+            return []
+
+        idf = np.log((1 + count) / (1 + self.document_counts)).astype(np.float32) + 1
+        query = self.vectors[query_rows].sum(axis=0) * idf
+        # Cosine similarity of the IDF-weighted vectors, with the weights
+        # folded into the query so no weighted copy of the matrix is made
+        direction = query * idf / (np.linalg.norm(query) or 1)
+        squared_idf = idf * idf
+        scores = np.empty(count, dtype=np.float32)
+        for start in range(0, count, SCORE_ROWS):
+            block = self.vectors[start:min(start + SCORE_ROWS, count)]
+            norms = np.sqrt((block * block) @ squared_idf)
+            scores[start:start + len(block)] = block @ direction / np.where(norms > 0, norms, 1)
+        scores[query_rows] = -np.inf
+
+        best = np.argpartition(-scores, limit - 1)[:limit]
+        best = best[np.argsort(-scores[best])]
+        return [self.turn_ids[row] for row in best]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.6 on 2026-10-18 16:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat_sessions', '0003_orchestrationjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='session',
+            name='context_transcript',
+            field=models.TextField(blank=True, default=''),
+        ),
+        migrations.AddField(
+            model_name='session',
+            name='context_turn_id',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.6 on 2026-10-18 16:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat_sessions', '0004_session_context_cache'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='session',
+            name='completion_tokens',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='session',
+            name='prompt_tokens',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='turn',
+            name='completion_tokens',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='turn',
+            name='prompt_tokens',
+            field=models.IntegerField(default=0),
+        ),
+    ]
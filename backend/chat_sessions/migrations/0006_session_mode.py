@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-18 16:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat_sessions', '0005_token_usage'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='session',
+            name='mode',
+            field=models.CharField(choices=[('SEQUENTIAL', 'Sequential'), ('PANEL', 'Panel')], default='SEQUENTIAL', max_length=20),
+        ),
+    ]
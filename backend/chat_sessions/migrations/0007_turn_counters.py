@@ -0,0 +1,60 @@
+# Generated by Django 5.2.6 on 2026-10-18 16:59
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Max
+
+
+def backfill_counters(apps, schema_editor):
+    Session = apps.get_model('chat_sessions', 'Session')
+    Turn = apps.get_model('chat_sessions', 'Turn')
+    SessionAgentStats = apps.get_model('chat_sessions', 'SessionAgentStats')
+
+    rows = Turn.objects.values('session_id', 'agent_id').annotate(turns=Count('id'), last=Max('created_at'))
+    stats = []
+    totals = {}
+    for row in rows.iterator():
+        stats.append(SessionAgentStats(
+            session_id=row['session_id'], agent_id=row['agent_id'],
+            turn_count=row['turns'], last_turn_at=row['last'],
+        ))
+        count, last = totals.get(row['session_id'], (0, None))
+        totals[row['session_id']] = (count + row['turns'], max(filter(None, (last, row['last']))))
+    SessionAgentStats.objects.bulk_create(stats, batch_size=1000)
+    for session_id, (count, last) in totals.items():
+        Session.objects.filter(pk=session_id).update(turn_count=count, last_turn_at=last)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('agents', '0003_agent_cache_responses'),
+        ('chat_sessions', '0006_session_mode'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='session',
+            name='last_turn_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='session',
+            name='turn_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.CreateModel(
+            name='SessionAgentStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('turn_count', models.IntegerField(default=0)),
+                ('last_turn_at', models.DateTimeField(blank=True, null=True)),
+                ('agent', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='session_stats', to='agents.agent')),
+                ('session', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='agent_stats', to='chat_sessions.session')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('session', 'agent'), name='unique_session_agent_stats')],
+            },
+        ),
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,81 @@
+# Generated by Django 5.2.6 on 2026-10-18 17:01
+
+from django.db import migrations, models
+from django.db.models import Count, Max, Sum
+from django.db.models.functions import Length
+
+LENGTH_BUCKET = 50
+
+
+def backfill_report_stats(apps, schema_editor):
+    Turn = apps.get_model('chat_sessions', 'Turn')
+    SessionAgentStats = apps.get_model('chat_sessions', 'SessionAgentStats')
+
+    rows = (
+        Turn.objects.order_by()
+        .annotate(bucket=Length('response') / LENGTH_BUCKET)
+        .values('session_id', 'agent_id', 'bucket')
+        .annotate(
+            turns=Count('id'),
+            chars=Sum(Length('response')),
+            prompt=Sum('prompt_tokens'),
+            completion=Sum('completion_tokens'),
+        )
+    )
+    stats = {}
+    for row in rows.iterator():
+        entry = stats.setdefault((row['session_id'], row['agent_id']), {
+            'response_chars': 0, 'length_histogram': {}, 'prompt_tokens': 0, 'completion_tokens': 0,
+        })
+        entry['response_chars'] += row['chars'] or 0
+        entry['length_histogram'][str(row['bucket'] or 0)] = row['turns']
+        entry['prompt_tokens'] += row['prompt']
+        entry['completion_tokens'] += row['completion']
+    for (session_id, agent_id), values in stats.items():
+        SessionAgentStats.objects.filter(session_id=session_id, agent_id=agent_id).update(**values)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat_sessions', '0007_turn_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='sessionagentstats',
+            name='completion_tokens',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='sessionagentstats',
+            name='latency_ms_total',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='sessionagentstats',
+            name='latency_turns',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='sessionagentstats',
+            name='length_histogram',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.AddField(
+            model_name='sessionagentstats',
+            name='prompt_tokens',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='sessionagentstats',
+            name='response_chars',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='turn',
+            name='latency_ms',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.RunPython(backfill_report_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.2.6 on 2026-10-18 17:14
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat_sessions', '0008_report_stats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='session',
+            name='summary',
+            field=models.TextField(blank=True, default=''),
+        ),
+        migrations.AddField(
+            model_name='session',
+            name='summary_turn_id',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+        migrations.CreateModel(
+            name='SummaryChunk',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('level', models.IntegerField()),
+                ('index', models.IntegerField()),
+                ('summary', models.TextField()),
+                ('last_turn_id', models.BigIntegerField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('session', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='summary_chunks', to='chat_sessions.session')),
+            ],
+            options={
+                'ordering': ['level', 'index'],
+                'constraints': [models.UniqueConstraint(fields=('session', 'level', 'index'), name='unique_summary_chunk')],
+            },
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.6 on 2026-10-18 17:23
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat_sessions', '0009_summary_chunks'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='session',
+            name='created_at',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False),
+        ),
+        migrations.AlterField(
+            model_name='turn',
+            name='created_at',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False),
+        ),
+    ]
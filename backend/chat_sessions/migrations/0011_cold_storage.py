@@ -0,0 +1,36 @@
+# Generated by Django 5.2.6 on 2026-10-18 17:26
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat_sessions', '0010_created_at_default'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='turn',
+            name='cold',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.CreateModel(
+            name='ColdTurnBlock',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('first_turn_id', models.BigIntegerField()),
+                ('last_turn_id', models.BigIntegerField()),
+                ('turn_count', models.IntegerField()),
+                ('data', models.BinaryField()),
+                ('raw_bytes', models.IntegerField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('session', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='cold_blocks', to='chat_sessions.session')),
+            ],
+            options={
+                'ordering': ['session', 'first_turn_id'],
+                'indexes': [models.Index(fields=['session', 'last_turn_id'], name='cold_block_session_last')],
+            },
+        ),
+    ]
@@ -0,0 +1,137 @@
+# Generated by Django 5.2.6 on 2026-10-18 18:02
+
+import json
+import zlib
+
+from django.db import migrations
+
+# The schema as it was when this migration was written; chat_sessions.search
+# may change, but this migration must keep building the same index
+
+SQLITE_SCHEMA = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS chat_sessions_turn_fts
+        USING fts5(prompt, response, scope, content='', tokenize='porter unicode61')""",
+    """CREATE TRIGGER IF NOT EXISTS chat_sessions_turn_fts_insert AFTER INSERT ON chat_sessions_turn BEGIN
+        INSERT INTO chat_sessions_turn_fts(rowid, prompt, response, scope)
+        SELECT new.id, new.prompt, new.response, 'u' || user_id || ' s' || id
+        FROM chat_sessions_session WHERE id = new.session_id;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS chat_sessions_turn_fts_delete AFTER DELETE ON chat_sessions_turn WHEN NOT old.cold BEGIN
+        INSERT INTO chat_sessions_turn_fts(chat_sessions_turn_fts, rowid, prompt, response, scope)
+        SELECT 'delete', old.id, old.prompt, old.response, 'u' || user_id || ' s' || id
+        FROM chat_sessions_session WHERE id = old.session_id;
+    END""",
+]
+
+SQLITE_DROP = [
+    'DROP TRIGGER IF EXISTS chat_sessions_turn_fts_insert',
+    'DROP TRIGGER IF EXISTS chat_sessions_turn_fts_delete',
+    'DROP TABLE IF EXISTS chat_sessions_turn_fts',
+]
+
+SQLITE_INSERT_HOT = (
+    'INSERT INTO chat_sessions_turn_fts(rowid, prompt, response, scope) '
+    "SELECT t.id, t.prompt, t.response, 'u' || s.user_id || ' s' || s.id "
+    'FROM chat_sessions_turn t JOIN chat_sessions_session s ON s.id = t.session_id WHERE NOT t.cold'
+)
+
+SQLITE_INSERT_ROW = (
+    'INSERT INTO chat_sessions_turn_fts(rowid, prompt, response, scope) '
+    "VALUES (%s, %s, %s, 'u' || %s || ' s' || %s)"
+)
+
+POSTGRES_SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS chat_sessions_turn_search (
+        turn_id bigint PRIMARY KEY REFERENCES chat_sessions_turn (id) ON DELETE CASCADE DEFERRABLE INITIALLY DEFERRED,
+        user_id bigint NOT NULL,
+        session_id bigint NOT NULL,
+        document tsvector NOT NULL
+    )""",
+    'CREATE INDEX IF NOT EXISTS chat_sessions_turn_search_document ON chat_sessions_turn_search USING GIN (document)',
+    'CREATE INDEX IF NOT EXISTS chat_sessions_turn_search_user ON chat_sessions_turn_search (user_id, turn_id)',
+    """CREATE OR REPLACE FUNCTION chat_sessions_turn_search_insert() RETURNS trigger AS $$
+    BEGIN
+        INSERT INTO chat_sessions_turn_search (turn_id, user_id, session_id, document)
+        SELECT NEW.id, s.user_id, s.id,
+            setweight(to_tsvector('english', coalesce(NEW.response, '')), 'A') ||
+            setweight(to_tsvector('english', coalesce(NEW.prompt, '')), 'B')
+        FROM chat_sessions_session s WHERE s.id = NEW.session_id
+        ON CONFLICT (turn_id) DO NOTHING;
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql""",
+    'DROP TRIGGER IF EXISTS chat_sessions_turn_search_insert ON chat_sessions_turn',
+    """CREATE TRIGGER chat_sessions_turn_search_insert AFTER INSERT ON chat_sessions_turn
+        FOR EACH ROW EXECUTE FUNCTION chat_sessions_turn_search_insert()""",
+]
+
+POSTGRES_DROP = [
+    'DROP TRIGGER IF EXISTS chat_sessions_turn_search_insert ON chat_sessions_turn',
+    'DROP FUNCTION IF EXISTS chat_sessions_turn_search_insert()',
+    'DROP TABLE IF EXISTS chat_sessions_turn_search',
+]
+
+POSTGRES_INSERT_HOT = (
+    'INSERT INTO chat_sessions_turn_search (turn_id, user_id, session_id, document) '
+    'SELECT t.id, s.user_id, s.id, '
+    "setweight(to_tsvector('english', coalesce(t.response, '')), 'A') || "
+    "setweight(to_tsvector('english', coalesce(t.prompt, '')), 'B') "
+    'FROM chat_sessions_turn t JOIN chat_sessions_session s ON s.id = t.session_id WHERE NOT t.cold'
+)
+
+POSTGRES_INSERT_ROW = (
+    'INSERT INTO chat_sessions_turn_search (turn_id, user_id, session_id, document) '
+    'VALUES (%s, %s, %s, '
+    "setweight(to_tsvector('english', coalesce(%s::text, '')), 'A') || "
+    "setweight(to_tsvector('english', coalesce(%s::text, '')), 'B'))"
+)
+
+
+def create_search_index(apps, schema_editor):
+    conn = schema_editor.connection
+    if conn.vendor not in ('sqlite', 'postgresql'):
+        raise RuntimeError(f'Full-text search is not supported on {conn.vendor}.')
+    sqlite = conn.vendor == 'sqlite'
+    with conn.cursor() as cursor, conn.cursor() as blocks:
+        for statement in (SQLITE_DROP + SQLITE_SCHEMA) if sqlite else (POSTGRES_DROP + POSTGRES_SCHEMA):
+            cursor.execute(statement)
+        cursor.execute(SQLITE_INSERT_HOT if sqlite else POSTGRES_INSERT_HOT)
+
+        # Cold turns are indexed from their compressed blocks
+        blocks.execute(
+            'SELECT b.data, s.user_id, s.id FROM chat_sessions_coldturnblock b '
+            'JOIN chat_sessions_session s ON s.id = b.session_id ORDER BY b.id'
+        )
+        rows = []
+        for batch in iter(lambda: blocks.fetchmany(50), []):
+            for data, user_id, session_id in batch:
+                for turn_id, prompt, response in json.loads(zlib.decompress(bytes(data))):
+                    if sqlite:
+                        rows.append((turn_id, prompt, response, user_id, session_id))
+                    else:
+                        rows.append((turn_id, user_id, session_id, response, prompt))
+            if len(rows) >= 2000:
+                cursor.executemany(SQLITE_INSERT_ROW if sqlite else POSTGRES_INSERT_ROW, rows)
+                rows = []
+        if rows:
+            cursor.executemany(SQLITE_INSERT_ROW if sqlite else POSTGRES_INSERT_ROW, rows)
+
+
+def drop_search_index(apps, schema_editor):
+    conn = schema_editor.connection
+    if conn.vendor not in ('sqlite', 'postgresql'):
+        raise RuntimeError(f'Full-text search is not supported on {conn.vendor}.')
+    with conn.cursor() as cursor:
+        for statement in SQLITE_DROP if conn.vendor == 'sqlite' else POSTGRES_DROP:
+            cursor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat_sessions', '0011_cold_storage'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
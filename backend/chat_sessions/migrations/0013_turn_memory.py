@@ -0,0 +1,50 @@
+# Generated by Django 5.2.6 on 2026-10-18 17:40
+
+from importlib import import_module
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+search_index = import_module('chat_sessions.migrations.0012_turn_search_index')
+
+
+def drop_search_triggers(apps, schema_editor):
+    # Unapplying rebuilds the sessions table on SQLite, which fails while a
+    # trigger reads from it
+    if schema_editor.connection.vendor == 'sqlite':
+        for statement in search_index.SQLITE_DROP[:2]:
+            schema_editor.execute(statement)
+
+
+def create_search_triggers(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        for statement in search_index.SQLITE_SCHEMA[1:]:
+            schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat_sessions', '0012_turn_search_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(migrations.RunPython.noop, create_search_triggers),
+        migrations.RemoveField(
+            model_name='session',
+            name='context_transcript',
+        ),
+        migrations.RemoveField(
+            model_name='session',
+            name='context_turn_id',
+        ),
+        migrations.CreateModel(
+            name='TurnEmbedding',
+            fields=[
+                ('turn', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='embedding', serialize=False, to='chat_sessions.turn')),
+                ('vector', models.BinaryField()),
+                ('session', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='turn_embeddings', to='chat_sessions.session')),
+            ],
+        ),
+        migrations.RunPython(migrations.RunPython.noop, drop_search_triggers),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.6 on 2026-10-18 18:39
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('agents', '0003_agent_cache_responses'),
+        ('chat_sessions', '0013_turn_memory'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='orchestrationjob',
+            index=models.Index(fields=['status', 'locked_until'], name='job_status_lease'),
+        ),
+        migrations.AddIndex(
+            model_name='session',
+            index=models.Index(fields=['user', 'created_at', 'id'], name='session_user_created'),
+        ),
+        migrations.AddIndex(
+            model_name='session',
+            index=models.Index(fields=['status', 'updated_at'], name='session_status_updated'),
+        ),
+        migrations.AddIndex(
+            model_name='turn',
+            index=models.Index(fields=['session', 'created_at', 'id'], name='turn_session_created'),
+        ),
+        migrations.AddIndex(
+            model_name='turnembedding',
+            index=models.Index(fields=['session', 'turn'], name='turn_embedding_session'),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.6 on 2026-10-18 19:13
+
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def fail_duplicate_jobs(apps, schema_editor):
+    # Keeps the oldest active job of each session, which a worker would have run first
+    OrchestrationJob = apps.get_model('chat_sessions', 'OrchestrationJob')
+    seen = set()
+    duplicates = []
+    active = OrchestrationJob.objects.filter(status__in=['PENDING', 'RUNNING']).order_by('created_at', 'id')
+    for job_id, session_id in active.values_list('id', 'session_id').iterator():
+        if session_id in seen:
+            duplicates.append(job_id)
+        seen.add(session_id)
+    OrchestrationJob.objects.filter(id__in=duplicates).update(
+        status='FAILED',
+        error='Another conversation was already queued for this session',
+        locked_until=None,
+        finished_at=timezone.now(),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat_sessions', '0014_composite_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(fail_duplicate_jobs, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='orchestrationjob',
+            constraint=models.UniqueConstraint(condition=models.Q(('status__in', ['PENDING', 'RUNNING'])), fields=('session',), name='one_active_job_per_session'),
+        ),
+    ]
@@ -1,5 +1,7 @@
 from django.db import models
 from django.conf import settings
+from django.db.models.query import ModelIterable
+from django.utils import timezone
 from agents.models import Agent
 
 class Session(models.Model):
@@ -8,28 +10,232 @@ class Session(models.Model):
         ('COMPLETED', 'Completed'),
         ('ERROR', 'Error'),
     ]
+    MODE_CHOICES = [
+        ('SEQUENTIAL', 'Sequential'),
+        ('PANEL', 'Panel'),
+    ]
 
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='sessions')
     agents = models.ManyToManyField(Agent, related_name='sessions')
     topic = models.CharField(max_length=255, default="General Discussion")
     max_turns = models.IntegerField(default=10)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='ACTIVE')
-    created_at = models.DateTimeField(auto_now_add=True)
+    # PANEL: every agent in a round answers the same context concurrently
+    mode = models.CharField(max_length=20, choices=MODE_CHOICES, default='SEQUENTIAL')
+    # Token usage rolled up from turns as they are appended (see turns.py)
+    prompt_tokens = models.BigIntegerField(default=0)
+    completion_tokens = models.BigIntegerField(default=0)
+    # Maintained by append_turn so reads never COUNT(*) the turns table
+    turn_count = models.IntegerField(default=0)
+    last_turn_at = models.DateTimeField(null=True, blank=True)
+    # Latest generated summary and the last turn it covers (see summaries.py)
+    summary = models.TextField(blank=True, default='')
+    summary_turn_id = models.BigIntegerField(null=True, blank=True)
+    # A default rather than auto_now_add, so archive imports keep the original time
+    created_at = models.DateTimeField(default=timezone.now, editable=False)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            # A user's sessions, newest first
+            models.Index(fields=['user', 'created_at', 'id'], name='session_user_created'),
+            # Cold storage candidates
+            models.Index(fields=['status', 'updated_at'], name='session_status_updated'),
+        ]
+
     def __str__(self):
         return f"Session {self.id} - {self.status}"
 
+class TurnIterable(ModelIterable):
+    """
+    Yields turns with the bodies of cold turns (see coldstorage.py) read
+    back from their compressed blocks, so callers never see the difference.
+    """
+
+    def __iter__(self):
+        from .coldstorage import ColdBodies
+
+        bodies = None
+        for turn in super().__iter__():
+            if turn.cold:
+                if bodies is None:
+                    bodies = ColdBodies()
+                turn.prompt, turn.response = bodies.get(turn.session_id, turn.id)
+            yield turn
+
+class TurnQuerySet(models.QuerySet):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._iterable_class = TurnIterable
+
+    def only(self, *fields):
+        # The cold flag decides whether the bodies have to be read back
+        return super().only(*fields, 'cold')
+
 class Turn(models.Model):
     session = models.ForeignKey(Session, on_delete=models.CASCADE, related_name='turns')
     agent = models.ForeignKey(Agent, on_delete=models.CASCADE, related_name='turns')
     prompt = models.TextField()
     response = models.TextField()
+    prompt_tokens = models.IntegerField(default=0)
+    completion_tokens = models.IntegerField(default=0)
     token_count = models.IntegerField(default=0)
-    created_at = models.DateTimeField(auto_now_add=True)
+    # Wall time of the provider call that produced the response
+    latency_ms = models.IntegerField(null=True, blank=True)
+    # Prompt and response have moved to a ColdTurnBlock (see coldstorage.py)
+    cold = models.BooleanField(default=False)
+    created_at = models.DateTimeField(default=timezone.now, editable=False)
+
+    objects = TurnQuerySet.as_manager()
 
     class Meta:
         ordering = ['created_at']
+        indexes = [
+            # A session's turns in order, which every transcript read walks
+            models.Index(fields=['session', 'created_at', 'id'], name='turn_session_created'),
+        ]
 
     def __str__(self):
         return f"Turn {self.id} - {self.agent.name}"
+
+class SessionAgentStats(models.Model):
+    """
+    Per-agent report statistics for a session, maintained by append_turn
+    (see stats.py) so the report never has to scan the session's turns.
+    """
+    # Response lengths are kept as a histogram of buckets this many characters wide
+    LENGTH_BUCKET = 50
+
+    session = models.ForeignKey(Session, on_delete=models.CASCADE, related_name='agent_stats')
+    agent = models.ForeignKey(Agent, on_delete=models.CASCADE, related_name='session_stats')
+    turn_count = models.IntegerField(default=0)
+    last_turn_at = models.DateTimeField(null=True, blank=True)
+    response_chars = models.BigIntegerField(default=0)
+    length_histogram = models.JSONField(default=dict, blank=True)
+    prompt_tokens = models.BigIntegerField(default=0)
+    completion_tokens = models.BigIntegerField(default=0)
+    latency_ms_total = models.BigIntegerField(default=0)
+    # Turns with a recorded latency; imported turns may not have one
+    latency_turns = models.IntegerField(default=0)
+
+    def add_turn(self, turn):
+        self.turn_count += 1
+        self.last_turn_at = turn.created_at
+        self.response_chars += len(turn.response)
+        bucket = str(len(turn.response) // self.LENGTH_BUCKET)
+        self.length_histogram[bucket] = self.length_histogram.get(bucket, 0) + 1
+        self.prompt_tokens += turn.prompt_tokens
+        self.completion_tokens += turn.completion_tokens
+        if turn.latency_ms is not None:
+            self.latency_ms_total += turn.latency_ms
+            self.latency_turns += 1
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['session', 'agent'], name='unique_session_agent_stats'),
+        ]
+
+    def __str__(self):
+        return f"Session {self.session_id} - Agent {self.agent_id}: {self.turn_count} turns"
+
+class SummaryChunk(models.Model):
+    """
+    Cached summary of one block of a session: a block of turns at level 0,
+    or a block of level ``level - 1`` summaries above that (see
+    summaries.py). Only full blocks are stored, so a stored summary never
+    goes stale.
+    """
+    session = models.ForeignKey(Session, on_delete=models.CASCADE, related_name='summary_chunks')
+    level = models.IntegerField()
+    index = models.IntegerField()
+    summary = models.TextField()
+    # Last turn covered by the block
+    last_turn_id = models.BigIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['level', 'index']
+        constraints = [
+            models.UniqueConstraint(fields=['session', 'level', 'index'], name='unique_summary_chunk'),
+        ]
+
+    def __str__(self):
+        return f"Session {self.session_id} - Summary {self.level}.{self.index}"
+
+class ColdTurnBlock(models.Model):
+    """
+    Compressed prompts and responses of a run of cold turns of a completed
+    session, covering turn ids ``first_turn_id`` to ``last_turn_id``.
+    """
+    session = models.ForeignKey(Session, on_delete=models.CASCADE, related_name='cold_blocks')
+    first_turn_id = models.BigIntegerField()
+    last_turn_id = models.BigIntegerField()
+    turn_count = models.IntegerField()
+    # zlib-compressed JSON list of [turn id, prompt, response]
+    data = models.BinaryField()
+    raw_bytes = models.IntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['session', 'first_turn_id']
+        indexes = [
+            models.Index(fields=['session', 'last_turn_id'], name='cold_block_session_last'),
+        ]
+
+    def __str__(self):
+        return f"Session {self.session_id} - Turns {self.first_turn_id}-{self.last_turn_id}"
+
+class TurnEmbedding(models.Model):
+    """
+    Hashing-vectorizer embedding of a turn, used to pick the older turns
+    sent to providers (see memory.py).
+    """
+    turn = models.OneToOneField(Turn, on_delete=models.CASCADE, primary_key=True, related_name='embedding')
+    session = models.ForeignKey(Session, on_delete=models.CASCADE, related_name='turn_embeddings')
+    # float32 array of memory.DIMENSIONS values
+    vector = models.BinaryField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['session', 'turn'], name='turn_embedding_session'),
+        ]
+
+    def __str__(self):
+        return f"Session {self.session_id} - Turn {self.turn_id} embedding"
+
+class OrchestrationJob(models.Model):
+    STATUS_CHOICES = [
+        ('PENDING', 'Pending'),
+        ('RUNNING', 'Running'),
+        ('SUCCEEDED', 'Succeeded'),
+        ('FAILED', 'Failed'),
+    ]
+
+    session = models.ForeignKey(Session, on_delete=models.CASCADE, related_name='jobs')
+    prompt = models.TextField()
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='PENDING')
+    error = models.TextField(blank=True, default='')
+    attempts = models.IntegerField(default=0)
+    locked_by = models.CharField(max_length=100, blank=True, default='')
+    locked_until = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['created_at']
+        indexes = [
+            # Runnable jobs: PENDING, or RUNNING with an expired lease (see lease_job)
+            models.Index(fields=['status', 'locked_until'], name='job_status_lease'),
+        ]
+        constraints = [
+            # One conversation at a time per session (see jobs.py)
+            models.UniqueConstraint(
+                fields=['session'],
+                condition=models.Q(status__in=['PENDING', 'RUNNING']),
+                name='one_active_job_per_session',
+            ),
+        ]
+
+    def __str__(self):
+        return f"Job {self.id} - Session {self.session_id} - {self.status}"
@@ -0,0 +1,365 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from django.db import connections
+
+from .turns import append_turn
+from .context import ConversationContext
+from vault.resolver import CredentialResolver
+from core.providers import ProviderFactory
+from core.llm_cache import cached_provider
+from core.ratelimit import rate_limited_provider
+from core.usage import Usage
+
+
+CONCLUSION_MARKER = "[CONVERSATION_CONCLUDED]"
+
+
+class OrchestrationError(Exception):
+    pass
+
+
+def build_system_message(agent, agents):
+    return f"""{agent.system_message}
+
+IMPORTANT INSTRUCTIONS FOR MULTI-AGENT CONVERSATION:
+- You are in a conversation with other agents: {', '.join([a.name for a in agents if a.id != agent.id])}
+- Respond naturally to the previous messages in the conversation
+- Build upon what others have said
+- If you feel the discussion has reached a natural conclusion, end your response with the phrase: "[CONVERSATION_CONCLUDED]"
+- If there's more to discuss, continue the dialogue
+- Be concise but meaningful in your responses
+"""
+
+
+class MarkerFilter:
+    """
+    Drops the conclusion marker from a stream of text chunks, holding back
+    any tail that could be the start of a marker split across chunks.
+    """
+
+    def __init__(self):
+        self.buffer = ""
+
+    def feed(self, chunk):
+        self.buffer = (self.buffer + chunk).replace(CONCLUSION_MARKER, "")
+        hold = 0
+        for size in range(min(len(self.buffer), len(CONCLUSION_MARKER) - 1), 0, -1):
+            if CONCLUSION_MARKER.startswith(self.buffer[-size:]):
+                hold = size
+                break
+        ready, self.buffer = self.buffer[:len(self.buffer) - hold], self.buffer[len(self.buffer) - hold:]
+        return ready
+
+    def flush(self):
+        ready, self.buffer = self.buffer, ""
+        return ready
+
+
+def strip_marker_stream(chunks):
+    marker_filter = MarkerFilter()
+    for chunk in chunks:
+        ready = marker_filter.feed(chunk)
+        if ready:
+            yield ready
+    rest = marker_filter.flush()
+    if rest:
+        yield rest
+
+
+def run_conversation(session, prompt, on_turn=None):
+    """
+    Runs the multi-agent conversation loop for a session until an agent
+    concludes, three full rounds pass or max_turns is reached.
+
+    ``on_turn`` is called with each Turn after it is written.
+    """
+    for event, data in iter_conversation(session, prompt):
+        if event == 'turn_end' and on_turn:
+            on_turn(data)
+
+
+async def arun_conversation(session, prompt, on_turn=None):
+    """
+    Async counterpart of run_conversation. ``on_turn`` may be a coroutine
+    function.
+    """
+    async for event, data in aiter_conversation(session, prompt):
+        if event == 'turn_end' and on_turn:
+            result = on_turn(data)
+            if hasattr(result, '__await__'):
+                await result
+
+
+def _provider_for(agent):
+    provider = rate_limited_provider(ProviderFactory.get_provider(agent.provider), agent.provider)
+    if agent.cache_responses:
+        provider = cached_provider(provider, agent.provider)
+    return provider
+
+
+def _prompt_for(context, initial_prompt):
+    # For the first turn, use the user's prompt
+    # For subsequent turns, use the conversation context
+    if context.is_empty:
+        return f"User: {initial_prompt}"
+    return context.prompt
+
+
+def _request_for(agent, agents, context, initial_prompt, credentials):
+    # Calls are spread across every key the user has for this provider
+    api_key = credentials.get_keys(agent.provider)
+    if api_key is None:
+        raise OrchestrationError(f'No API key found for {agent.provider}. Please add one in the Vault.')
+    return dict(
+        system_message=build_system_message(agent, agents),
+        prompt=_prompt_for(context, initial_prompt),
+        api_key=api_key,
+        model=agent.model
+    )
+
+
+def _write_turn(session, agent, context, initial_prompt, response_text, usage, latency_ms=None):
+    """
+    Appends the turn to the session and the running context. Returns the
+    turn and whether the agent concluded the conversation.
+    """
+    # Check if agent concluded the conversation
+    concluded = CONCLUSION_MARKER in response_text
+    if concluded:
+        # Remove the marker before the turn is written
+        response_text = response_text.replace(CONCLUSION_MARKER, "").strip()
+
+    turn = append_turn(
+        session=session,
+        agent=agent,
+        # The user's prompt is recorded on the first turn only
+        prompt=initial_prompt if context.is_empty else "",
+        response=response_text,
+        usage=usage,
+        latency_ms=latency_ms
+    )
+    context.append(turn)
+    return turn, concluded
+
+
+def _elapsed_ms(started):
+    return int((time.monotonic() - started) * 1000)
+
+
+def _complete_in_thread(provider, request):
+    # Returns the completion and how long it took
+    started = time.monotonic()
+    try:
+        return provider.complete(**request), _elapsed_ms(started)
+    finally:
+        # Worker threads get their own connections if a provider touches the DB
+        connections.close_all()
+
+
+async def _timed(coroutine):
+    started = time.monotonic()
+    return await coroutine, _elapsed_ms(started)
+
+
+def _panel_round_agents(session, agents):
+    # A panel round only seats as many agents as there are turns left
+    round_agents = agents[:session.max_turns - session.turn_count]
+    if len(round_agents) < len(agents):
+        session.status = 'COMPLETED'
+        session.save(update_fields=['status', 'updated_at'])
+    return round_agents
+
+
+def iter_conversation(session, prompt, stream=False):
+    """
+    Generator behind run_conversation. Yields ``(event, data)`` pairs:
+    ``('turn_start', agent)``, ``('token', text)`` when ``stream`` is set,
+    ``('turn_end', turn)`` and finally ``('concluded', turn)`` if an agent
+    ended the conversation.
+
+    In PANEL mode every agent of a round answers the same context and the
+    provider calls run concurrently; turns are still written in agent
+    order, and tokens are not streamed.
+    """
+    agents = list(session.agents.all())
+    if not agents:
+        raise OrchestrationError('No agents in session')
+
+    # Continue conversation until conclusion or max turns
+    conversation_active = True
+    initial_prompt = prompt
+    context = ConversationContext.load(session)
+    credentials = CredentialResolver.for_agents(session.user_id, agents)
+
+    while conversation_active and session.turn_count < session.max_turns:
+        if session.mode == 'PANEL':
+            round_agents = _panel_round_agents(session, agents)
+            requests = []
+            for agent in round_agents:
+                yield 'turn_start', agent
+                requests.append((_provider_for(agent), _request_for(agent, agents, context, initial_prompt, credentials)))
+
+            with ThreadPoolExecutor(max_workers=len(requests)) as executor:
+                futures = [executor.submit(_complete_in_thread, provider, request) for provider, request in requests]
+
+            concluding_turn = None
+            for agent, future in zip(round_agents, futures):
+                try:
+                    completion, latency_ms = future.result()
+                except Exception as e:
+                    raise OrchestrationError(f'Failed to generate response from {agent.name}: {str(e)}') from e
+                turn, concluded = _write_turn(session, agent, context, initial_prompt, completion.text, completion.usage, latency_ms)
+                yield 'turn_end', turn
+                if concluded and concluding_turn is None:
+                    concluding_turn = turn
+
+            if concluding_turn:
+                conversation_active = False
+                yield 'concluded', concluding_turn
+            elif len(round_agents) < len(agents):
+                conversation_active = False
+        else:
+            # For each agent, generate a response
+            for agent in agents:
+                # Check turn limit
+                if session.turn_count >= session.max_turns:
+                    session.status = 'COMPLETED'
+                    session.save(update_fields=['status', 'updated_at'])
+                    conversation_active = False
+                    break
+
+                yield 'turn_start', agent
+                request = _request_for(agent, agents, context, initial_prompt, credentials)
+
+                started = time.monotonic()
+                try:
+                    provider = _provider_for(agent)
+
+                    # Generate response
+                    if stream:
+                        chunks = []
+                        usage = Usage()
+                        for chunk in strip_marker_stream(_tee(provider.stream_response(**request, usage=usage), chunks)):
+                            yield 'token', chunk
+                        response_text = "".join(chunks)
+                    else:
+                        completion = provider.complete(**request)
+                        response_text, usage = completion.text, completion.usage
+                except Exception as e:
+                    raise OrchestrationError(f'Failed to generate response from {agent.name}: {str(e)}') from e
+
+                turn, concluded = _write_turn(session, agent, context, initial_prompt, response_text, usage, _elapsed_ms(started))
+                yield 'turn_end', turn
+
+                if concluded:
+                    conversation_active = False
+                    yield 'concluded', turn
+                    break
+
+        # After one full round, check if we should continue
+        # If no agent concluded, continue for another round
+        if conversation_active and session.turn_count < session.max_turns:
+            # Check if we've had at least 2 rounds (all agents spoke twice)
+            turns_per_agent = session.turn_count / len(agents)
+            if turns_per_agent >= 3:  # After 3 rounds, stop automatically
+                conversation_active = False
+
+
+async def aiter_conversation(session, prompt, stream=False):
+    """
+    Async counterpart of iter_conversation, using the async ORM and the
+    providers' coroutine API so that waiting on a provider does not hold a
+    thread. Yields the same events; PANEL rounds are gathered on the event
+    loop.
+    """
+    agents = [agent async for agent in session.agents.all()]
+    if not agents:
+        raise OrchestrationError('No agents in session')
+
+    conversation_active = True
+    initial_prompt = prompt
+    context = await sync_to_async(ConversationContext.load)(session)
+    credentials = await sync_to_async(CredentialResolver.for_agents)(session.user_id, agents)
+    write_turn = sync_to_async(_write_turn)
+
+    while conversation_active and session.turn_count < session.max_turns:
+        if session.mode == 'PANEL':
+            round_agents = await sync_to_async(_panel_round_agents)(session, agents)
+            calls = []
+            for agent in round_agents:
+                yield 'turn_start', agent
+                request = _request_for(agent, agents, context, initial_prompt, credentials)
+                calls.append(_timed(_provider_for(agent).acomplete(**request)))
+
+            results = await asyncio.gather(*calls, return_exceptions=True)
+
+            concluding_turn = None
+            for agent, result in zip(round_agents, results):
+                if isinstance(result, Exception):
+                    raise OrchestrationError(f'Failed to generate response from {agent.name}: {str(result)}') from result
+                completion, latency_ms = result
+                turn, concluded = await write_turn(session, agent, context, initial_prompt, completion.text, completion.usage, latency_ms)
+                yield 'turn_end', turn
+                if concluded and concluding_turn is None:
+                    concluding_turn = turn
+
+            if concluding_turn:
+                conversation_active = False
+                yield 'concluded', concluding_turn
+            elif len(round_agents) < len(agents):
+                conversation_active = False
+        else:
+            for agent in agents:
+                if session.turn_count >= session.max_turns:
+                    session.status = 'COMPLETED'
+                    await session.asave(update_fields=['status', 'updated_at'])
+                    conversation_active = False
+                    break
+
+                yield 'turn_start', agent
+                request = _request_for(agent, agents, context, initial_prompt, credentials)
+
+                started = time.monotonic()
+                try:
+                    provider = _provider_for(agent)
+
+                    if stream:
+                        chunks = []
+                        usage = Usage()
+                        marker_filter = MarkerFilter()
+                        async for chunk in provider.astream_response(**request, usage=usage):
+                            chunks.append(chunk)
+                            ready = marker_filter.feed(chunk)
+                            if ready:
+                                yield 'token', ready
+                        rest = marker_filter.flush()
+                        if rest:
+                            yield 'token', rest
+                        response_text = "".join(chunks)
+                    else:
+                        completion = await provider.acomplete(**request)
+                        response_text, usage = completion.text, completion.usage
+                except Exception as e:
+                    raise OrchestrationError(f'Failed to generate response from {agent.name}: {str(e)}') from e
+
+                turn, concluded = await write_turn(session, agent, context, initial_prompt, response_text, usage, _elapsed_ms(started))
+                yield 'turn_end', turn
+
+                if concluded:
+                    conversation_active = False
+                    yield 'concluded', turn
+                    break
+
+        if conversation_active and session.turn_count < session.max_turns:
+            turns_per_agent = session.turn_count / len(agents)
+            if turns_per_agent >= 3:
+                conversation_active = False
+
+
+def _tee(chunks, collected):
+    for chunk in chunks:
+        collected.append(chunk)
+        yield chunk
@@ -0,0 +1,88 @@
+from django.db.models import Q
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class TurnKeysetPagination(BasePagination):
+    """
+    Keyset pagination over turns ordered by (created_at, id).
+
+    ``?after=<turn id>`` returns the turns that follow that turn, so the cost
+    of a page doesn't grow with how deep into the session it is, and a client
+    that remembers the last turn it has seen only downloads new ones. The
+    ``next`` link is the same query with ``after`` moved to the last turn of
+    the page.
+    """
+    page_size = 100
+    max_page_size = 500
+    after_query_param = 'after'
+    limit_query_param = 'limit'
+
+    def get_limit(self, request):
+        try:
+            limit = int(request.query_params.get(self.limit_query_param, self.page_size))
+        except ValueError:
+            raise ValidationError({self.limit_query_param: 'Must be an integer.'})
+        return max(1, min(limit, self.max_page_size))
+
+    def get_after(self, request):
+        after = request.query_params.get(self.after_query_param)
+        if after in (None, ''):
+            return None
+        try:
+            return int(after)
+        except ValueError:
+            raise ValidationError({self.after_query_param: 'Must be a turn id.'})
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.limit = self.get_limit(request)
+        self.after = self.get_after(request)
+
+        if self.after is not None:
+            anchor = queryset.filter(pk=self.after).values_list('created_at', flat=True).first()
+            if anchor is None:
+                raise NotFound('Turn not found in this session.')
+            # The created_at__gte range lets the (session, created_at, id) index seek to the anchor
+            queryset = queryset.filter(created_at__gte=anchor).filter(Q(created_at__gt=anchor) | Q(id__gt=self.after))
+
+        # Fetch one extra row to learn whether there is a next page without a COUNT
+        page = list(queryset.order_by('created_at', 'id')[:self.limit + 1])
+        self.has_next = len(page) > self.limit
+        self.page = page[:self.limit]
+        return self.page
+
+    def last_turn_id(self):
+        return self.page[-1].id if self.page else self.after
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.after_query_param, self.last_turn_id())
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'last_turn_id': self.last_turn_id(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'last_turn_id': {'type': 'integer', 'nullable': True},
+                'results': schema,
+            },
+        }
+
+
+class SessionPagination(PageNumberPagination):
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
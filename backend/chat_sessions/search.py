@@ -0,0 +1,293 @@
+"""
+Full-text search over turns.
+
+The index lives beside the turns table and is filled by a trigger on insert,
+so every way turns are written (conversations, archive imports, bulk
+inserts) is indexed. On SQLite it is a contentless FTS5 table, on PostgreSQL
+a table of tsvectors with a GIN index. Neither holds a copy of the text, so
+turns moved to cold storage stay searchable after their bodies are emptied;
+snippets are cut in Python from the turns of the page being returned.
+
+Each entry carries its owner and session, so scoping is done by the index
+itself. Ranking scores every candidate, so for words found in a large part
+of a user's history only the newest SEARCH_RANK_WINDOW matches are ranked.
+
+SQLite drops a table's triggers when Django rebuilds the table for a schema
+change, so a migration that alters Turn on SQLite should be followed by
+``manage.py search_index --rebuild``. Until then the chat_sessions.E001
+system check (see checks.py) fails.
+"""
+import re
+
+from django.conf import settings
+from django.db import connection
+from django.utils.html import escape
+
+from .coldstorage import ColdBodies, _decompress
+from .models import Turn
+
+FTS_TABLE = 'chat_sessions_turn_fts'
+SEARCH_TABLE = 'chat_sessions_turn_search'
+TEXT_SEARCH_CONFIG = 'english'
+
+# Query words beyond this are ignored
+MAX_TERMS = 16
+# Words of context shown around the first match
+SNIPPET_WORDS = 30
+# Rows per insert when the index is rebuilt
+REBUILD_BATCH = 2000
+
+# The FTS5 scope column holds "u<user id> s<session id>" and is only ever
+# searched by the query itself
+SQLITE_SCOPE = "'u' || {user} || ' s' || {session}"
+
+SQLITE_SCHEMA = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE}
+        USING fts5(prompt, response, scope, content='', tokenize='porter unicode61')""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_insert AFTER INSERT ON chat_sessions_turn BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, prompt, response, scope)
+        SELECT new.id, new.prompt, new.response, {SQLITE_SCOPE.format(user='user_id', session='id')}
+        FROM chat_sessions_session WHERE id = new.session_id;
+    END""",
+    # A contentless index can only forget a row given the text it indexed, which
+    # cold turns no longer have; their entries stay until the next rebuild and
+    # are never returned, since results are joined back to the turns table
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_delete AFTER DELETE ON chat_sessions_turn WHEN NOT old.cold BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, prompt, response, scope)
+        SELECT 'delete', old.id, old.prompt, old.response, {SQLITE_SCOPE.format(user='user_id', session='id')}
+        FROM chat_sessions_session WHERE id = old.session_id;
+    END""",
+]
+
+POSTGRES_DOCUMENT = (
+    f"setweight(to_tsvector('{TEXT_SEARCH_CONFIG}', coalesce({{response}}, '')), 'A') || "
+    f"setweight(to_tsvector('{TEXT_SEARCH_CONFIG}', coalesce({{prompt}}, '')), 'B')"
+)
+
+POSTGRES_SCHEMA = [
+    f"""CREATE TABLE IF NOT EXISTS {SEARCH_TABLE} (
+        turn_id bigint PRIMARY KEY REFERENCES chat_sessions_turn (id) ON DELETE CASCADE DEFERRABLE INITIALLY DEFERRED,
+        user_id bigint NOT NULL,
+        session_id bigint NOT NULL,
+        document tsvector NOT NULL
+    )""",
+    f"CREATE INDEX IF NOT EXISTS {SEARCH_TABLE}_document ON {SEARCH_TABLE} USING GIN (document)",
+    f"CREATE INDEX IF NOT EXISTS {SEARCH_TABLE}_user ON {SEARCH_TABLE} (user_id, turn_id)",
+    f"""CREATE OR REPLACE FUNCTION {SEARCH_TABLE}_insert() RETURNS trigger AS $$
+    BEGIN
+        INSERT INTO {SEARCH_TABLE} (turn_id, user_id, session_id, document)
+        SELECT NEW.id, s.user_id, s.id, {POSTGRES_DOCUMENT.format(prompt='NEW.prompt', response='NEW.response')}
+        FROM chat_sessions_session s WHERE s.id = NEW.session_id
+        ON CONFLICT (turn_id) DO NOTHING;
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql""",
+    f"DROP TRIGGER IF EXISTS {SEARCH_TABLE}_insert ON chat_sessions_turn",
+    f"""CREATE TRIGGER {SEARCH_TABLE}_insert AFTER INSERT ON chat_sessions_turn
+        FOR EACH ROW EXECUTE FUNCTION {SEARCH_TABLE}_insert()""",
+]
+
+
+# Triggers that keep the index up to date
+TRIGGERS = {
+    'sqlite': [f'{FTS_TABLE}_insert', f'{FTS_TABLE}_delete'],
+    'postgresql': [f'{SEARCH_TABLE}_insert'],
+}
+
+
+class SearchUnavailable(Exception):
+    pass
+
+
+def _vendor(conn):
+    if conn.vendor not in ('sqlite', 'postgresql'):
+        raise SearchUnavailable(f'Full-text search is not supported on {conn.vendor}.')
+    return conn.vendor
+
+
+def install(conn=connection):
+    """Creates the index and its triggers if they are missing."""
+    schema = SQLITE_SCHEMA if _vendor(conn) == 'sqlite' else POSTGRES_SCHEMA
+    with conn.cursor() as cursor:
+        for statement in schema:
+            cursor.execute(statement)
+
+
+def uninstall(conn=connection):
+    with conn.cursor() as cursor:
+        if _vendor(conn) == 'sqlite':
+            cursor.execute(f'DROP TRIGGER IF EXISTS {FTS_TABLE}_insert')
+            cursor.execute(f'DROP TRIGGER IF EXISTS {FTS_TABLE}_delete')
+            cursor.execute(f'DROP TABLE IF EXISTS {FTS_TABLE}')
+        else:
+            cursor.execute(f'DROP TRIGGER IF EXISTS {SEARCH_TABLE}_insert ON chat_sessions_turn')
+            cursor.execute(f'DROP FUNCTION IF EXISTS {SEARCH_TABLE}_insert()')
+            cursor.execute(f'DROP TABLE IF EXISTS {SEARCH_TABLE}')
+
+
+def missing_triggers(conn=connection):
+    """Names of the index's triggers that are missing from the database."""
+    with conn.cursor() as cursor:
+        if _vendor(conn) == 'sqlite':
+            cursor.execute("SELECT name FROM sqlite_master WHERE type = 'trigger' AND tbl_name = 'chat_sessions_turn'")
+        else:
+            cursor.execute("SELECT tgname FROM pg_trigger WHERE tgrelid = 'chat_sessions_turn'::regclass")
+        present = {row[0] for row in cursor.fetchall()}
+    return [name for name in TRIGGERS[conn.vendor] if name not in present]
+
+
+def rebuild(conn=connection):
+    """
+    Recreates the index from every turn, reading the bodies of cold turns
+    back from their blocks. Returns how many turns were indexed.
+    """
+    uninstall(conn)
+    install(conn)
+    sqlite = conn.vendor == 'sqlite'
+    if sqlite:
+        insert_hot = (
+            f'INSERT INTO {FTS_TABLE}(rowid, prompt, response, scope) '
+            f"SELECT t.id, t.prompt, t.response, {SQLITE_SCOPE.format(user='s.user_id', session='s.id')} "
+            'FROM chat_sessions_turn t JOIN chat_sessions_session s ON s.id = t.session_id WHERE NOT t.cold'
+        )
+        insert_row = f"INSERT INTO {FTS_TABLE}(rowid, prompt, response, scope) VALUES (%s, %s, %s, 'u' || %s || ' s' || %s)"
+    else:
+        insert_hot = (
+            f'INSERT INTO {SEARCH_TABLE} (turn_id, user_id, session_id, document) '
+            f"SELECT t.id, s.user_id, s.id, {POSTGRES_DOCUMENT.format(prompt='t.prompt', response='t.response')} "
+            'FROM chat_sessions_turn t JOIN chat_sessions_session s ON s.id = t.session_id WHERE NOT t.cold'
+        )
+        insert_row = (
+            f'INSERT INTO {SEARCH_TABLE} (turn_id, user_id, session_id, document) '
+            f"VALUES (%s, %s, %s, {POSTGRES_DOCUMENT.format(prompt='%s::text', response='%s::text')})"
+        )
+
+    with conn.cursor() as cursor, conn.cursor() as blocks:
+        cursor.execute(insert_hot)
+        indexed = cursor.rowcount
+        blocks.execute(
+            'SELECT b.data, s.user_id, s.id FROM chat_sessions_coldturnblock b '
+            'JOIN chat_sessions_session s ON s.id = b.session_id ORDER BY b.id'
+        )
+        rows = []
+        for batch in iter(lambda: blocks.fetchmany(50), []):
+            for data, user_id, session_id in batch:
+                for turn_id, prompt, response in _decompress(data):
+                    if sqlite:
+                        rows.append((turn_id, prompt, response, user_id, session_id))
+                    else:
+                        # The Postgres document names the response before the prompt
+                        rows.append((turn_id, user_id, session_id, response, prompt))
+            if len(rows) >= REBUILD_BATCH:
+                cursor.executemany(insert_row, rows)
+                indexed += len(rows)
+                rows = []
+        if rows:
+            cursor.executemany(insert_row, rows)
+            indexed += len(rows)
+    return indexed
+
+
+def query_terms(text):
+    return re.findall(r'\w+', text.lower())[:MAX_TERMS]
+
+
+def _sqlite_search(cursor, user_id, terms, session_id, limit, offset):
+    scope = f'"u{user_id}"' + (f' AND "s{session_id}"' if session_id is not None else '')
+    words = ' AND '.join(f'"{term}"' for term in terms)
+    match = f'scope : ({scope}) AND {{prompt response}} : ({words})'
+    # Newest matches come cheaply in rowid order; only those are ranked
+    cursor.execute(f"""
+        SELECT t.id, -bm25({FTS_TABLE}, 0.5, 1.0, 0.0) AS rank
+        FROM {FTS_TABLE} CROSS JOIN chat_sessions_turn t ON t.id = {FTS_TABLE}.rowid
+        WHERE {FTS_TABLE} MATCH %s AND {FTS_TABLE}.rowid >= (
+            SELECT coalesce(min(rowid), 0) FROM (
+                SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s ORDER BY rowid DESC LIMIT %s
+            )
+        )
+        ORDER BY rank DESC, t.id DESC
+        LIMIT %s OFFSET %s
+    """, [match, match, settings.SEARCH_RANK_WINDOW, limit, offset])
+
+
+def _postgres_search(cursor, user_id, terms, session_id, limit, offset):
+    session_filter = 'AND session_id = %s' if session_id is not None else ''
+    cursor.execute(f"""
+        SELECT turn_id, ts_rank_cd(document, plainto_tsquery('{TEXT_SEARCH_CONFIG}', %s)) AS rank
+        FROM (
+            SELECT turn_id, document FROM {SEARCH_TABLE}
+            WHERE document @@ plainto_tsquery('{TEXT_SEARCH_CONFIG}', %s) AND user_id = %s {session_filter}
+            ORDER BY turn_id DESC LIMIT %s
+        ) matches
+        ORDER BY rank DESC, turn_id DESC
+        LIMIT %s OFFSET %s
+    """, [
+        ' '.join(terms), ' '.join(terms), user_id,
+        *([session_id] if session_id is not None else []),
+        settings.SEARCH_RANK_WINDOW, limit, offset,
+    ])
+
+
+def search_turns(user, text, session_id=None, limit=20, offset=0):
+    """
+    Returns up to ``limit`` of the user's turns matching every word of
+    ``text``, best first, as dicts with an HTML ``snippet`` in which the
+    matches are wrapped in ``<mark>``.
+    """
+    terms = query_terms(text)
+    if not terms:
+        return []
+    search = _sqlite_search if _vendor(connection) == 'sqlite' else _postgres_search
+    with connection.cursor() as cursor:
+        search(cursor, user.pk, terms, session_id, limit, offset)
+        ranks = dict(cursor.fetchall())
+    if not ranks:
+        return []
+
+    turns = {
+        turn['id']: turn for turn in Turn.objects.filter(id__in=ranks).values(
+            'id', 'session_id', 'session__topic', 'agent_id', 'agent__name', 'prompt', 'response', 'cold', 'created_at',
+        )
+    }
+    cold = ColdBodies()
+    cold.load((turn['session_id'], turn['id']) for turn in turns.values() if turn['cold'])
+
+    results = []
+    for turn_id, rank in ranks.items():
+        turn = turns[turn_id]
+        prompt, response = cold.get(turn['session_id'], turn_id) if turn['cold'] else (turn['prompt'], turn['response'])
+        results.append({
+            'turn': turn_id,
+            'session': turn['session_id'],
+            'session_topic': turn['session__topic'],
+            'agent': turn['agent_id'],
+            'agent_name': turn['agent__name'],
+            'created_at': turn['created_at'],
+            'rank': rank,
+            'snippet': snippet(response, terms) or snippet(prompt, terms, require_match=False),
+        })
+    return results
+
+
+def _matcher(terms):
+    # The index stems words; matching on a shortened prefix highlights most
+    # of the forms it found ("discussed" for "discussion")
+    stems = tuple(term[:max(4, len(term) - 3)] for term in terms)
+    return lambda word: re.sub(r'\W', '', word.lower()).startswith(stems)
+
+
+def snippet(text, terms, words=SNIPPET_WORDS, require_match=True):
+    """
+    About ``words`` words of ``text`` around the first match of ``terms``,
+    HTML-escaped, with the matching words in ``<mark>``. Returns '' when
+    nothing matches and ``require_match`` is set.
+    """
+    tokens = text.split()
+    matches = _matcher(terms)
+    first = next((i for i, token in enumerate(tokens) if matches(token)), None)
+    if first is None and require_match:
+        return ''
+    start = max(0, (first or 0) - words // 3)
+    end = start + words
+    shown = [f'<mark>{escape(token)}</mark>' if matches(token) else escape(token) for token in tokens[start:end]]
+    return ('… ' if start else '') + ' '.join(shown) + (' …' if end < len(tokens) else '')
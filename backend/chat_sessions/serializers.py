@@ -1,5 +1,5 @@
 from rest_framework import serializers
-from .models import Session, Turn
+from .models import Session, Turn, OrchestrationJob
 from agents.serializers import AgentSerializer
 
 class TurnSerializer(serializers.ModelSerializer):
@@ -7,7 +7,7 @@ class TurnSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Turn
-        fields = ('id', 'agent', 'agent_name', 'prompt', 'response', 'created_at')
+        fields = ('id', 'agent', 'agent_name', 'prompt', 'response', 'prompt_tokens', 'completion_tokens', 'token_count', 'created_at')
 
 class SessionSerializer(serializers.ModelSerializer):
     turns = TurnSerializer(many=True, read_only=True)
@@ -18,11 +18,33 @@ class SessionSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Session
-        fields = ('id', 'status', 'agents', 'agent_ids', 'turns', 'created_at', 'topic', 'max_turns')
-        read_only_fields = ('status', 'created_at')
+        fields = ('id', 'status', 'agents', 'agent_ids', 'turns', 'created_at', 'topic', 'max_turns', 'mode', 'turn_count', 'last_turn_at', 'prompt_tokens', 'completion_tokens')
+        read_only_fields = ('status', 'created_at', 'turn_count', 'last_turn_at', 'prompt_tokens', 'completion_tokens')
 
     def create(self, validated_data):
         agent_ids = validated_data.pop('agent_ids')
         session = Session.objects.create(**validated_data)
         session.agents.set(agent_ids)
         return session
+
+class SessionListSerializer(serializers.ModelSerializer):
+    """
+    Summary of a session for lists, built from the session's counters;
+    turn bodies are only served by the detail and turns endpoints.
+    """
+    agent_names = serializers.SerializerMethodField()
+    last_activity = serializers.DateTimeField(read_only=True)
+
+    class Meta:
+        model = Session
+        fields = ('id', 'topic', 'status', 'mode', 'max_turns', 'agent_names', 'turn_count', 'last_activity', 'prompt_tokens', 'completion_tokens', 'created_at')
+        read_only_fields = fields
+
+    def get_agent_names(self, session):
+        return [agent.name for agent in session.agents.all()]
+
+class OrchestrationJobSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = OrchestrationJob
+        fields = ('id', 'session', 'prompt', 'status', 'error', 'attempts', 'created_at', 'started_at', 'finished_at')
+        read_only_fields = fields
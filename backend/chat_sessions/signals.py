@@ -0,0 +1,43 @@
+from django.contrib.auth import get_user_model
+from django.db.models import Count, F, OuterRef, Subquery, Sum
+from django.db.models.signals import post_save, pre_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from agents.models import Agent
+from .models import Session, Turn
+
+
+@receiver(post_save, sender=Agent)
+@receiver(pre_delete, sender=Agent)
+def touch_agent_sessions(sender, instance, created=False, **kwargs):
+    # Sessions serialize their agents, so a changed or deleted agent has to
+    # give their cached reads (see caching.py) a new version
+    if not created:
+        Session.objects.filter(agents=instance).update(updated_at=timezone.now())
+
+
+@receiver(pre_delete, sender=Agent)
+def remove_agent_turns_from_counters(sender, instance, **kwargs):
+    # The agent's turns are deleted with it, so they come off the counters
+    # append_turn added them to; its SessionAgentStats rows go too
+    rows = (
+        Turn.objects.filter(agent=instance).order_by().values('session_id')
+        .annotate(turns=Count('id'), prompt=Sum('prompt_tokens'), completion=Sum('completion_tokens'))
+    )
+    prompt_tokens = completion_tokens = 0
+    for row in rows:
+        last_turn = Turn.objects.filter(session=OuterRef('pk')).exclude(agent=instance).order_by('-created_at', '-id')
+        Session.objects.filter(pk=row['session_id']).update(
+            turn_count=F('turn_count') - row['turns'],
+            prompt_tokens=F('prompt_tokens') - row['prompt'],
+            completion_tokens=F('completion_tokens') - row['completion'],
+            last_turn_at=Subquery(last_turn.values('created_at')[:1]),
+        )
+        prompt_tokens += row['prompt']
+        completion_tokens += row['completion']
+    if prompt_tokens or completion_tokens:
+        get_user_model().objects.filter(pk=instance.user_id).update(
+            prompt_tokens=F('prompt_tokens') - prompt_tokens,
+            completion_tokens=F('completion_tokens') - completion_tokens,
+        )
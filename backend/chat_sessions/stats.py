@@ -0,0 +1,177 @@
+"""
+Materialized report statistics.
+
+Each (session, agent) pair has a SessionAgentStats row that append_turn
+updates as turns are written, so a report is a single query over those rows
+however long the session is.
+"""
+from collections import defaultdict
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import Count, F, FilteredRelation, Max, Q, Sum
+from django.db.models.functions import Length
+
+from .models import Session, SessionAgentStats, Turn
+
+LENGTH_BUCKET = SessionAgentStats.LENGTH_BUCKET
+
+
+def record_turn(session, agent, turn):
+    """
+    Adds ``turn`` to the agent's statistics for the session. Runs inside the
+    transaction that writes the turn.
+    """
+    stats, _ = SessionAgentStats.objects.select_for_update().get_or_create(session=session, agent=agent)
+    stats.add_turn(turn)
+    stats.save()
+
+
+def rebuild_session_stats(session):
+    """
+    Recomputes the session's counters and per-agent statistics from its
+    turns. For turns written without append_turn, such as bulk imports.
+    """
+    rebuild_stats([session])
+
+
+@transaction.atomic
+def rebuild_stats(sessions):
+    """
+    rebuild_session_stats for many sessions at once, in a fixed number of
+    queries: one aggregate over their turns, then bulk writes. The change in
+    each session's token totals is added to its user's, so turns written
+    without append_turn, such as imported ones, count towards the user too.
+    Response lengths are measured in the turns table, so sessions in cold
+    storage have to be thawed first (see coldstorage.py).
+    """
+    sessions = {session.pk: session for session in sessions}
+    counted = Session.objects.filter(pk__in=sessions.keys()).values_list(
+        'user_id', 'prompt_tokens', 'completion_tokens',
+    )
+    user_tokens = defaultdict(lambda: [0, 0])
+    for user_id, prompt_tokens, completion_tokens in counted:
+        user_tokens[user_id][0] -= prompt_tokens
+        user_tokens[user_id][1] -= completion_tokens
+    rows = (
+        Turn.objects.filter(session__in=sessions.keys()).order_by()
+        .annotate(bucket=Length('response') / LENGTH_BUCKET)
+        .values('session_id', 'agent_id', 'bucket')
+        .annotate(
+            turns=Count('id'),
+            chars=Sum(Length('response')),
+            prompt=Sum('prompt_tokens'),
+            completion=Sum('completion_tokens'),
+            latency=Sum('latency_ms'),
+            timed=Count('latency_ms'),
+            last=Max('created_at'),
+        )
+    )
+
+    stats = {}
+    for row in rows.iterator():
+        key = (row['session_id'], row['agent_id'])
+        agent_stats = stats.setdefault(key, SessionAgentStats(session_id=key[0], agent_id=key[1]))
+        agent_stats.turn_count += row['turns']
+        agent_stats.response_chars += row['chars'] or 0
+        agent_stats.length_histogram[str(row['bucket'] or 0)] = row['turns']
+        agent_stats.prompt_tokens += row['prompt']
+        agent_stats.completion_tokens += row['completion']
+        agent_stats.latency_ms_total += row['latency'] or 0
+        agent_stats.latency_turns += row['timed']
+        if agent_stats.last_turn_at is None or row['last'] > agent_stats.last_turn_at:
+            agent_stats.last_turn_at = row['last']
+
+    SessionAgentStats.objects.filter(session__in=sessions.keys()).delete()
+    SessionAgentStats.objects.bulk_create(stats.values(), batch_size=1000)
+
+    for session in sessions.values():
+        session.turn_count = 0
+        session.last_turn_at = None
+        session.prompt_tokens = 0
+        session.completion_tokens = 0
+    for (session_id, _), agent_stats in stats.items():
+        session = sessions[session_id]
+        session.turn_count += agent_stats.turn_count
+        session.prompt_tokens += agent_stats.prompt_tokens
+        session.completion_tokens += agent_stats.completion_tokens
+        if session.last_turn_at is None or agent_stats.last_turn_at > session.last_turn_at:
+            session.last_turn_at = agent_stats.last_turn_at
+    Session.objects.bulk_update(
+        sessions.values(), ['turn_count', 'last_turn_at', 'prompt_tokens', 'completion_tokens'], batch_size=500,
+    )
+
+    for session in sessions.values():
+        user_tokens[session.user_id][0] += session.prompt_tokens
+        user_tokens[session.user_id][1] += session.completion_tokens
+    for user_id, (prompt_tokens, completion_tokens) in user_tokens.items():
+        if prompt_tokens or completion_tokens:
+            get_user_model().objects.filter(pk=user_id).update(
+                prompt_tokens=F('prompt_tokens') + prompt_tokens,
+                completion_tokens=F('completion_tokens') + completion_tokens,
+            )
+
+
+def histogram_median(histogram, count):
+    """
+    Median response length from a length histogram, interpolated within
+    its bucket, so accurate to a fraction of LENGTH_BUCKET characters.
+    """
+    if not count:
+        return 0
+    middle = count / 2
+    seen = 0
+    for bucket, turns in sorted((int(b), n) for b, n in histogram.items()):
+        if seen + turns >= middle:
+            return int(bucket * LENGTH_BUCKET + LENGTH_BUCKET * (middle - seen) / turns)
+        seen += turns
+    return 0
+
+
+def session_report_stats(session):
+    """
+    Structured report statistics for the session: the session's counters
+    and one entry per agent, read in a single query.
+    """
+    agents = session.agents.annotate(
+        stats=FilteredRelation('session_stats', condition=Q(session_stats__session=session)),
+    ).values(
+        'id', 'name', 'provider', 'model',
+        'stats__turn_count', 'stats__response_chars', 'stats__length_histogram',
+        'stats__prompt_tokens', 'stats__completion_tokens',
+        'stats__latency_ms_total', 'stats__latency_turns', 'stats__last_turn_at',
+    ).order_by('id')
+
+    agent_stats = []
+    for agent in agents:
+        turns = agent['stats__turn_count'] or 0
+        latency_turns = agent['stats__latency_turns'] or 0
+        agent_stats.append({
+            'id': agent['id'],
+            'name': agent['name'],
+            'provider': agent['provider'],
+            'model': agent['model'],
+            'turns': turns,
+            'avg_length': round(agent['stats__response_chars'] / turns) if turns else 0,
+            'median_length': histogram_median(agent['stats__length_histogram'] or {}, turns),
+            'prompt_tokens': agent['stats__prompt_tokens'] or 0,
+            'completion_tokens': agent['stats__completion_tokens'] or 0,
+            'avg_latency_ms': round(agent['stats__latency_ms_total'] / latency_turns) if latency_turns else None,
+            'last_turn_at': agent['stats__last_turn_at'],
+        })
+
+    return {
+        'session': {
+            'id': session.id,
+            'topic': session.topic,
+            'status': session.status,
+            'mode': session.mode,
+            'turn_count': session.turn_count,
+            'max_turns': session.max_turns,
+            'prompt_tokens': session.prompt_tokens,
+            'completion_tokens': session.completion_tokens,
+            'created_at': session.created_at,
+            'last_turn_at': session.last_turn_at,
+        },
+        'agents': agent_stats,
+    }
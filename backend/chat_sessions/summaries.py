@@ -0,0 +1,195 @@
+"""
+Hierarchical session summaries.
+
+The turns are cut into fixed blocks of SUMMARY_CHUNK_TURNS; each block is
+summarized on its own, and the block summaries are combined SUMMARY_FANOUT
+at a time, level by level, until one summary is left. Summaries of full
+blocks are stored as SummaryChunk rows, so a later call only summarizes the
+turns added since, plus the partial blocks along the right edge. The calls
+of each level run concurrently.
+"""
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connection, connections
+
+from core.usage import Usage
+from .coldstorage import ColdBodies
+from .models import ColdTurnBlock, Session, SummaryChunk
+
+SYSTEM_MESSAGE = "You are a helpful assistant that creates concise summaries."
+
+# A summary is cut to this many characters before it is combined with others,
+# so a rambling model can't push the next level past its context window
+MAX_SUMMARY_CHARS = 4000
+
+
+def _chunk_prompt(session, start, text):
+    return (
+        f'Summarize this part of a conversation about "{session.topic}" (from turn {start + 1}). '
+        f"Keep who said what, the main points and any conclusions.\n\n{text}"
+    )
+
+
+def _reduce_prompt(session, summaries):
+    parts = "\n\n".join(f"Part {i}:\n{summary[:MAX_SUMMARY_CHARS]}" for i, summary in enumerate(summaries, 1))
+    return (
+        f'These are summaries of consecutive parts of a conversation about "{session.topic}". '
+        f"Combine them into one concise summary that keeps the main points, who made them "
+        f"and how the discussion developed.\n\n{parts}"
+    )
+
+
+class SessionSummarizer:
+    """
+    Summarizes a session with ``provider``, reusing the stored block
+    summaries. Token usage of every call made is added up in ``usage``.
+    """
+
+    def __init__(self, session, provider, api_key, model):
+        self.session = session
+        self.provider = provider
+        self.api_key = api_key
+        self.model = model
+        self.chunk_turns = settings.SUMMARY_CHUNK_TURNS
+        self.fanout = settings.SUMMARY_FANOUT
+        self.concurrency = settings.SUMMARY_CONCURRENCY
+        self.usage = Usage()
+        self.new_chunks = []
+        # INSERTs run to store the new block summaries
+        self.insert_batches = 0
+
+    def summarize(self):
+        session = self.session
+        last_turn_id = session.turns.order_by('-created_at', '-id').values_list('id', flat=True).first()
+        if last_turn_id is None:
+            return ''
+        if session.summary and session.summary_turn_id == last_turn_id:
+            return session.summary
+
+        stored = {(chunk.level, chunk.index): chunk for chunk in session.summary_chunks.all()}
+        # Each item is (summary, last turn id, whether it covers a full block)
+        items = self._summarize_turns(stored)
+        level = 0
+        while len(items) > 1:
+            if len(items) <= self.fanout:
+                summary = self._complete_all([_reduce_prompt(session, [item[0] for item in items])])[0]
+                break
+            level += 1
+            items = self._reduce_level(level, items, stored)
+        else:
+            summary = items[0][0]
+
+        # New full blocks are written together once the summary is done, in
+        # as few INSERTs as the database's parameter limit allows. A
+        # concurrent call may have stored the same blocks already; they are
+        # identical in effect, so those rows are skipped
+        fields = [field for field in SummaryChunk._meta.concrete_fields if not field.primary_key]
+        batch_size = connection.ops.bulk_batch_size(fields, self.new_chunks)
+        SummaryChunk.objects.bulk_create(self.new_chunks, batch_size=batch_size, ignore_conflicts=True)
+        self.insert_batches = -(-len(self.new_chunks) // batch_size) if self.new_chunks else 0
+        Session.objects.filter(pk=session.pk).update(summary=summary, summary_turn_id=last_turn_id)
+        session.summary = summary
+        session.summary_turn_id = last_turn_id
+        return summary
+
+    def _summarize_turns(self, stored):
+        blocks = sorted((chunk for (level, _), chunk in stored.items() if level == 0), key=lambda chunk: chunk.index)
+        items = [(chunk.summary, chunk.last_turn_id, True) for chunk in blocks]
+
+        # The turns and the cold blocks holding their bodies are each read in
+        # one streamed query, so the query count doesn't grow with the session
+        turns = self.session.turns.values_list('id', 'cold', 'response', 'agent__name')
+        cold_blocks = ColdTurnBlock.objects.filter(session=self.session).order_by('last_turn_id').only('last_turn_id', 'data')
+        if blocks:
+            turns = turns.filter(id__gt=blocks[-1].last_turn_id)
+            cold_blocks = cold_blocks.filter(last_turn_id__gt=blocks[-1].last_turn_id)
+        cold = ColdBodies(cold_blocks.iterator())
+
+        # Blocks are sent in batches as the turns are read, so only a few are held at once
+        batch, lines, last_id = [], [], None
+        for turn_id, is_cold, response, agent_name in turns.order_by('created_at', 'id').iterator():
+            if is_cold:
+                _, response = cold.get(self.session.pk, turn_id)
+            lines.append(f"{agent_name}: {response}")
+            last_id = turn_id
+            if len(lines) == self.chunk_turns:
+                batch.append(("\n\n".join(lines), last_id))
+                lines = []
+                if len(batch) == self.concurrency * 4:
+                    self._summarize_blocks(batch, items, full=True)
+                    batch = []
+        self._summarize_blocks(batch, items, full=True)
+        if lines:
+            self._summarize_blocks([("\n\n".join(lines), last_id)], items, full=False)
+        return items
+
+    def _summarize_blocks(self, blocks, items, full):
+        """Summarizes consecutive blocks of turns and appends them to ``items``."""
+        if not blocks:
+            return
+        start = len(items)
+        summaries = self._complete_all([
+            _chunk_prompt(self.session, (start + i) * self.chunk_turns, text) for i, (text, _) in enumerate(blocks)
+        ])
+        for i, (summary, (_, last_id)) in enumerate(zip(summaries, blocks)):
+            items.append((summary, last_id, full))
+            if full:
+                self._store(0, [(start + i, summary, last_id)])
+
+    def _reduce_level(self, level, items, stored):
+        groups = [items[i:i + self.fanout] for i in range(0, len(items), self.fanout)]
+        reduced = [None] * len(groups)
+        pending = []
+        for index, group in enumerate(groups):
+            chunk = stored.get((level, index))
+            if chunk is not None:
+                reduced[index] = (chunk.summary, chunk.last_turn_id, True)
+            else:
+                pending.append(index)
+
+        summaries = self._complete_all([
+            _reduce_prompt(self.session, [item[0] for item in groups[index]]) for index in pending
+        ])
+        new_chunks = []
+        for index, summary in zip(pending, summaries):
+            group = groups[index]
+            # A group can be stored once none of its parts will change
+            full = len(group) == self.fanout and all(item[2] for item in group)
+            reduced[index] = (summary, group[-1][1], full)
+            if full:
+                new_chunks.append((index, summary, group[-1][1]))
+        self._store(level, new_chunks)
+        return reduced
+
+    def _store(self, level, chunks):
+        self.new_chunks += [
+            SummaryChunk(session=self.session, level=level, index=index, summary=summary, last_turn_id=last_turn_id)
+            for index, summary, last_turn_id in chunks
+        ]
+
+    def _complete(self, prompt):
+        return self.provider.complete(
+            system_message=SYSTEM_MESSAGE,
+            prompt=prompt,
+            api_key=self.api_key,
+            model=self.model
+        )
+
+    def _complete_in_thread(self, prompt):
+        try:
+            return self._complete(prompt)
+        finally:
+            # Worker threads get their own connections if a provider touches the DB
+            connections.close_all()
+
+    def _complete_all(self, prompts):
+        if len(prompts) <= 1:
+            completions = [self._complete(prompt) for prompt in prompts]
+        else:
+            with ThreadPoolExecutor(max_workers=min(self.concurrency, len(prompts))) as executor:
+                completions = list(executor.map(self._complete_in_thread, prompts))
+        for completion in completions:
+            self.usage.prompt_tokens += completion.usage.prompt_tokens
+            self.usage.completion_tokens += completion.usage.completion_tokens
+        return [completion.text for completion in completions]
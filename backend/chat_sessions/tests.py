@@ -1,3 +1,934 @@
-from django.test import TestCase
+import gzip
+import io
+import json
+import re
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+from asgiref.sync import async_to_sync
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.db.models import Sum
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from django.urls import URLPattern, URLResolver, get_resolver
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from . import coldstorage, search
+from .archive import export_archive, import_archive
+from .benchmarks import FILLER, build_session
+from .checks import check_search_triggers
+from .context import ConversationContext
+from .exports import PDFWriter, jsonl_export, markdown_export, pdf_export, text_export
+from .jobs import SessionBusy, enqueue_job, lease_job, start_inline_job
+from .memory import SessionMemory, embed, turn_text
+from agents.models import Agent
+from core.providers import MockProvider
+from core.usage import Usage
+from .models import OrchestrationJob, Session, SessionAgentStats, Turn, TurnEmbedding
+from .orchestration import CONCLUSION_MARKER, arun_conversation, iter_conversation, run_conversation
+from .pagination import TurnKeysetPagination
+from .stats import histogram_median, rebuild_session_stats
+from .summaries import SessionSummarizer
+from .turns import append_turn
+from .views import GenerateSummaryView
+
+
+def token_client(user):
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION=f'Token {Token.objects.create(user=user).key}')
+    return client
+
+
+@override_settings(LLM_RESPONSE_CACHE={'BACKEND': 'none'})
+class SummaryQueryTests(TestCase):
+    def summarize(self, session):
+        response = token_client(session.user).post(f'/api/sessions/{session.pk}/generate-summary/')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.data['summary'])
+        return int(response['X-Query-Count'])
+
+    @override_settings(DEBUG=True)
+    def test_query_count_does_not_grow_with_the_session(self):
+        counts = [self.summarize(build_session(size, embed=False)) for size in (100, 1000)]
+        self.assertEqual(counts[0], counts[1])
+        self.assertLessEqual(counts[1], GenerateSummaryView.query_budget)
+
+    @override_settings(DEBUG=True)
+    def test_cold_turns_are_streamed(self):
+        session = build_session(300, embed=False)
+        with mock.patch.object(coldstorage, 'BLOCK_TURNS', 20):
+            coldstorage.freeze_session(session)
+        self.assertEqual(session.cold_blocks.count(), 15)
+        self.assertLessEqual(self.summarize(session), GenerateSummaryView.query_budget)
+        session.refresh_from_db()
+        self.assertEqual(session.summary_turn_id, session.turns.order_by('id').last().id)
+
+    @override_settings(DEBUG=True)
+    def test_long_first_summary_stores_every_block(self):
+        session = build_session(1000, embed=False)
+        # Four chunks to an INSERT, as if the database took few parameters
+        with mock.patch.object(connection.ops, 'bulk_batch_size', return_value=4):
+            self.summarize(session)
+        # 50 blocks of turns and the 5 groups of 10 above them
+        self.assertEqual(session.summary_chunks.filter(level=0).count(), 50)
+        self.assertEqual(session.summary_chunks.count(), 55)
+
+
+class RecordingProvider(MockProvider):
+    def __init__(self, before_call=None):
+        self.prompts = []
+        self.before_call = before_call
+
+    def complete(self, system_message, prompt, api_key, model):
+        if self.before_call:
+            before_call, self.before_call = self.before_call, None
+            before_call()
+        self.prompts.append(prompt)
+        return super().complete(system_message, prompt, api_key, model)
+
+    def block_starts(self):
+        # Block prompts, not the summaries of them being combined
+        blocks = [prompt for prompt in self.prompts if prompt.startswith('Summarize this part')]
+        return sorted(int(re.search(r'\(from turn (\d+)\)', prompt)[1]) for prompt in blocks)
+
+
+class SessionSummarizerTests(TestCase):
+    def summarizer(self, session, provider):
+        return SessionSummarizer(Session.objects.get(pk=session.pk), provider, 'key', 'mock')
+
+    def test_later_summaries_send_only_new_blocks(self):
+        session = build_session(100, embed=False)
+        first = RecordingProvider()
+        self.summarizer(session, first).summarize()
+        self.assertEqual(first.block_starts(), [1, 21, 41, 61, 81])
+
+        agent = session.agents.first()
+        for i in range(25):
+            append_turn(session, agent, '', f'Point {i}.', Usage(5, 5))
+        second = RecordingProvider()
+        self.summarizer(session, second).summarize()
+        self.assertEqual(second.block_starts(), [101, 121])
+        self.assertEqual(session.summary_chunks.count(), 6)
+
+    def test_concurrent_summaries_store_each_block_once(self):
+        session = build_session(30, embed=False)
+        # The other call finishes while this one is waiting on the provider
+        other = self.summarizer(session, RecordingProvider())
+        summarizer = self.summarizer(session, RecordingProvider(before_call=other.summarize))
+        self.assertTrue(summarizer.summarize())
+        self.assertEqual(session.summary_chunks.count(), 1)
+
+
+def budgeted_views(patterns=None):
+    """Yields (url name, view class) for every view declaring a query_budget."""
+    for pattern in get_resolver().url_patterns if patterns is None else patterns:
+        if isinstance(pattern, URLResolver):
+            yield from budgeted_views(pattern.url_patterns)
+        elif isinstance(pattern, URLPattern):
+            view_class = getattr(pattern.callback, 'view_class', None)
+            if getattr(view_class, 'query_budget', None) is not None:
+                yield pattern.name, view_class
+
+
+@override_settings(LLM_RESPONSE_CACHE={'BACKEND': 'none'})
+class QueryBudgetTests(TestCase):
+    """
+    Calls every view with a query budget on a session of a few hundred
+    turns. The test runner enforces budgets, so a view over its budget
+    raises QueryBudgetExceeded here.
+    """
+
+    def setUp(self):
+        self.session = build_session(300, embed=False)
+        self.user = self.session.user
+        self.agent = self.session.agents.first()
+        self.credential = self.user.credentials.get()
+        self.job = OrchestrationJob.objects.create(session=self.session, prompt='Go on', status='SUCCEEDED')
+        self.idle = Session.objects.create(user=self.user, topic='Idle', max_turns=10, status='ACTIVE')
+        self.idle.agents.set(self.session.agents.all())
+        self.client = token_client(self.user)
+
+    def requests(self):
+        pk = self.session.pk
+        archive = b''.join(export_archive(self.user, [pk]))
+        # (url name, method, path, data, expected status)
+        return [
+            ('agent-list-create', 'get', '/api/agents/', None, 200),
+            ('agent-list-create', 'post', '/api/agents/', {
+                'name': 'Carol', 'provider': 'CLAUDE', 'model': 'mock', 'system_message': 'You judge.',
+            }, 201),
+            ('agent-detail', 'get', f'/api/agents/{self.agent.pk}/', None, 200),
+            ('agent-detail', 'patch', f'/api/agents/{self.agent.pk}/', {'name': 'Alicia'}, 200),
+            ('credential-list-create', 'get', '/api/vault/credentials/', None, 200),
+            ('credential-detail', 'get', f'/api/vault/credentials/{self.credential.pk}/', None, 200),
+            ('session-list-create', 'get', '/api/sessions/', None, 200),
+            ('session-list-create', 'post', '/api/sessions/', {
+                'topic': 'New debate', 'max_turns': 5, 'agent_ids': [self.agent.pk],
+            }, 201),
+            ('session-detail', 'get', f'/api/sessions/{pk}/', None, 200),
+            ('session-turn-list', 'get', f'/api/sessions/{pk}/turns/', None, 200),
+            ('session-search', 'get', '/api/sessions/search/?q=evidence', None, 200),
+            ('session-archive', 'get', '/api/sessions/archive/', None, 200),
+            ('session-archive', 'post', '/api/sessions/archive/', {
+                'file': SimpleUploadedFile('sessions.jsonl', archive),
+            }, 201),
+            ('session-job-detail', 'get', f'/api/sessions/{pk}/jobs/{self.job.pk}/', None, 200),
+            ('session-inject', 'post', f'/api/sessions/{pk}/inject/', {'prompt': 'And now?'}, 202),
+            ('session-stream', 'post', f'/api/sessions/{self.idle.pk}/stream/', {'prompt': 'Begin'}, 200),
+            ('session-generate-summary', 'post', f'/api/sessions/{pk}/generate-summary/', None, 200),
+            ('session-generate-report', 'post', f'/api/sessions/{pk}/generate-report/', None, 200),
+            ('session-export', 'get', f'/api/sessions/{pk}/export/md/', None, 200),
+            ('session-export-pdf', 'get', f'/api/sessions/{pk}/export-pdf/', None, 200),
+            ('session-stop', 'post', f'/api/sessions/{pk}/stop/', None, 200),
+            ('session-start', 'post', f'/api/sessions/{pk}/start/', None, 200),
+        ]
+
+    def test_every_budgeted_view_is_called(self):
+        called = {name for name, *_ in self.requests()}
+        self.assertEqual(called, {name for name, _ in budgeted_views()})
+
+    def test_views_stay_within_budget(self):
+        for name, method, path, data, expected in self.requests():
+            with self.subTest(name=name, method=method):
+                if method == 'post' and data and 'file' in data:
+                    response = self.client.post(path, data, format='multipart')
+                else:
+                    response = getattr(self.client, method)(path, data, format='json')
+                self.assertEqual(response.status_code, expected, getattr(response, 'data', None))
+
+
+def transcript(user):
+    return [
+        (turn.session.topic, turn.agent.name, turn.prompt, turn.response, turn.created_at, turn.prompt_tokens)
+        for turn in Turn.objects.filter(session__user=user).select_related('session', 'agent').order_by('created_at', 'id')
+    ]
+
+
+class ArchiveTests(TestCase):
+    def setUp(self):
+        self.source = build_session(120, embed=False)
+        self.user = get_user_model().objects.create_user('importer', password='importer')
+        self.archive = b''.join(export_archive(self.source.user))
+
+    def test_round_trip(self):
+        for number, options in enumerate(({}, {'compression': 'gzip'}, {'as_zip': True})):
+            with self.subTest(**options):
+                user = get_user_model().objects.create_user(f'importer-{number}')
+                data = b''.join(export_archive(self.source.user, **options))
+                counts = import_archive(user, io.BytesIO(data))
+                self.assertEqual(counts, {'agents': 2, 'sessions': 1, 'turns': 120})
+                self.assertEqual(transcript(user), transcript(self.source.user))
+                session = Session.objects.get(user=user)
+                self.assertEqual(session.turn_count, 120)
+                self.assertEqual(session.prompt_tokens, self.source.turns.aggregate(Sum('prompt_tokens'))['prompt_tokens__sum'])
+
+    def test_import_reuses_matching_agents(self):
+        import_archive(self.user, io.BytesIO(self.archive))
+        counts = import_archive(self.user, io.BytesIO(self.archive))
+        self.assertEqual(counts['agents'], 0)
+        self.assertEqual(Agent.objects.filter(user=self.user).count(), 2)
+        self.assertEqual(Session.objects.filter(user=self.user).count(), 2)
+
+    def edit_records(self, edit):
+        records = [json.loads(line) for line in self.archive.decode().splitlines()]
+        edit(records)
+        return ''.join(json.dumps(record) + '\n' for record in records).encode()
+
+    def bad_uploads(self):
+        def drop_agent_id(records):
+            del next(record for record in records if record['type'] == 'agent')['id']
+
+        def bad_turn_date(records):
+            records[-1]['created_at'] = 'yesterday'
+
+        def null_tokens(records):
+            records[-1]['prompt_tokens'] = None
+
+        zipped = bytearray(b''.join(export_archive(self.source.user, as_zip=True)))
+        zipped[200:260] = bytes(60)
+        return {
+            'not utf-8': b'\xff\xfe' + self.archive,
+            'truncated gzip': b''.join(export_archive(self.source.user, compression='gzip'))[:-100],
+            'corrupt zip': bytes(zipped),
+            'agent without id': self.edit_records(drop_agent_id),
+            'unparseable turn date': self.edit_records(bad_turn_date),
+            'null turn tokens': self.edit_records(null_tokens),
+            'not an archive': b'{"type": "turn"}\n',
+        }
+
+    def test_bad_uploads_are_rejected(self):
+        client = token_client(self.user)
+        for name, data in self.bad_uploads().items():
+            with self.subTest(name):
+                response = client.post('/api/sessions/archive/', {'file': SimpleUploadedFile('a.jsonl', data)}, format='multipart')
+                self.assertEqual(response.status_code, 400, response.content)
+                self.assertIn('error', response.data)
+                # Whatever was written before the bad record is rolled back
+                self.assertFalse(Agent.objects.filter(user=self.user).exists())
+                self.assertFalse(Session.objects.filter(user=self.user).exists())
+
+
+class JobTests(TestCase):
+    def setUp(self):
+        self.session = build_session(4, embed=False)
+        self.client = token_client(self.session.user)
+
+    def inject(self, prompt='Carry on'):
+        return self.client.post(f'/api/sessions/{self.session.pk}/inject/', {'prompt': prompt}, format='json')
+
+    def expire(self, job):
+        OrchestrationJob.objects.filter(pk=job.pk).update(locked_until=timezone.now() - timezone.timedelta(seconds=1))
+
+    def test_inject_queues_a_job(self):
+        response = self.inject()
+        self.assertEqual(response.status_code, 202)
+        job = OrchestrationJob.objects.get(pk=response.data['id'])
+        self.assertEqual((job.status, job.prompt, job.attempts), ('PENDING', 'Carry on', 0))
+
+    def test_second_inject_conflicts(self):
+        first = self.inject()
+        response = self.inject('Another')
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.data['job']['id'], first.data['id'])
+        self.assertEqual(self.session.jobs.count(), 1)
+
+    def test_concurrent_enqueue_is_refused_by_the_database(self):
+        # Both requests passed conversation_blocker before either wrote its job
+        job = enqueue_job(self.session, 'First')
+        with self.assertRaises(SessionBusy) as raised:
+            enqueue_job(self.session, 'Second')
+        self.assertEqual(raised.exception.payload['job']['id'], job.id)
+        with self.assertRaises(SessionBusy):
+            start_inline_job(self.session, 'Third', worker_id='stream:test')
+        self.assertEqual(self.session.jobs.count(), 1)
+
+    def test_lease_claims_the_oldest_job(self):
+        other = build_session(2, embed=False)
+        first = enqueue_job(self.session, 'First')
+        second = enqueue_job(other, 'Second')
+        job = lease_job('worker-1')
+        self.assertEqual(job.pk, first.pk)
+        self.assertEqual((job.status, job.locked_by, job.attempts), ('RUNNING', 'worker-1', 1))
+        self.assertEqual(lease_job('worker-2').pk, second.pk)
+        self.assertIsNone(lease_job('worker-3'))
+
+    def test_lease_leaves_live_jobs_alone(self):
+        start_inline_job(self.session, 'Streaming', worker_id='stream:test')
+        self.assertIsNone(lease_job('worker-1'))
+
+    def test_expired_lease_is_run_again(self):
+        enqueue_job(self.session, 'First')
+        job = lease_job('worker-1')
+        self.expire(job)
+        again = lease_job('worker-2')
+        self.assertEqual((again.pk, again.locked_by, again.attempts), (job.pk, 'worker-2', 2))
+
+    @override_settings(JOB_MAX_ATTEMPTS=2)
+    def test_job_fails_after_max_attempts(self):
+        job = enqueue_job(self.session, 'First')
+        for _ in range(2):
+            self.expire(lease_job('worker'))
+        self.assertIsNone(lease_job('worker'))
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'FAILED')
+        self.assertIsNone(job.locked_until)
+        self.assertIn('2 attempts', job.error)
+        # The session is free for a new conversation
+        self.assertEqual(self.inject().status_code, 202)
+
+
+class SearchTests(TestCase):
+    def setUp(self):
+        self.session = build_session(60, embed=False)
+        self.client = token_client(self.session.user)
+
+    def search(self, query, client=None):
+        response = (client or self.client).get('/api/sessions/search/', {'q': query})
+        self.assertEqual(response.status_code, 200)
+        return response.data['results']
+
+    def test_finds_and_highlights_turns(self):
+        results = self.search('turn 17 evidence')
+        self.assertEqual(len(results), 1)
+        turn = self.session.turns.get(prompt__startswith='Turn 17:')
+        self.assertEqual((results[0]['turn'], results[0]['session']), (turn.id, self.session.id))
+        self.assertIn('<mark>', results[0]['snippet'])
+
+    def test_other_users_turns_are_not_found(self):
+        other = build_session(5, embed=False)
+        self.assertEqual(self.search('turn 17 evidence', token_client(other.user)), [])
+
+    def test_cold_turns_are_found(self):
+        with mock.patch.object(coldstorage, 'BLOCK_TURNS', 25):
+            coldstorage.freeze_session(self.session)
+        results = self.search('turn 17 evidence')
+        self.assertEqual(len(results), 1)
+        self.assertIn('evidence', results[0]['snippet'])
+
+        # A rebuild indexes cold turns again from their blocks
+        search.rebuild()
+        self.assertEqual(len(self.search('turn 17 evidence')), 1)
+        self.assertEqual(len(self.search('evidence')), 20)
+
+    def test_new_turns_are_indexed(self):
+        agent = self.session.agents.first()
+        append_turn(self.session, agent, 'What about zeppelins?', 'Zeppelins are slow.', Usage(3, 4))
+        self.assertEqual(len(self.search('zeppelins')), 1)
+
+    def test_check_fails_without_triggers(self):
+        self.assertEqual(check_search_triggers(None, databases=['default']), [])
+        with connection.cursor() as cursor:
+            cursor.execute(f'DROP TRIGGER {search.FTS_TABLE}_insert')
+        errors = check_search_triggers(None, databases=['default'])
+        self.assertEqual([error.id for error in errors], ['chat_sessions.E001'])
+        search.rebuild()
+        self.assertEqual(check_search_triggers(None, databases=['default']), [])
+
+
+@override_settings(LLM_RESPONSE_CACHE={'BACKEND': 'none'})
+class ConversationTests(TestCase):
+    def setUp(self):
+        self.session = build_session(0, embed=False)
+        self.alice, self.bob = self.session.agents.order_by('id')
+
+    def run_session(self, prompt='Open the debate', **fields):
+        Session.objects.filter(pk=self.session.pk).update(**fields)
+        self.session.refresh_from_db()
+        run_conversation(self.session, prompt)
+        self.session.refresh_from_db()
+        return list(self.session.turns.order_by('created_at', 'id').select_related('agent'))
+
+    def test_sequential_stops_after_three_rounds(self):
+        turns = self.run_session()
+        self.assertEqual([turn.agent.name for turn in turns], ['Alice', 'Bob'] * 3)
+        self.assertEqual([turn.prompt for turn in turns], ['Open the debate'] + [''] * 5)
+        self.assertIn('User: Open the debate', turns[0].response)
+        # Every later agent answers the conversation so far
+        self.assertIn(turns[0].response, turns[1].response)
+        self.assertEqual(self.session.status, 'ACTIVE')
+
+    def test_sequential_stops_at_max_turns(self):
+        turns = self.run_session(max_turns=3)
+        self.assertEqual([turn.agent.name for turn in turns], ['Alice', 'Bob', 'Alice'])
+        self.assertEqual(self.session.status, 'COMPLETED')
+
+    def test_conclusion_marker_ends_the_conversation(self):
+        # MockProvider echoes the prompt, so the first agent concludes
+        events = list(iter_conversation(self.session, f'Wrap up {CONCLUSION_MARKER}'))
+        self.assertEqual([event for event, _ in events], ['turn_start', 'turn_end', 'concluded'])
+        turn = events[-1][1]
+        self.assertNotIn(CONCLUSION_MARKER, turn.response)
+        self.assertEqual(self.session.turns.count(), 1)
+
+    def test_streamed_tokens_make_up_the_turns(self):
+        tokens, turns = [], []
+        for event, data in iter_conversation(self.session, 'Open the debate', stream=True):
+            if event == 'token':
+                tokens.append(data)
+            elif event == 'turn_end':
+                turns.append(data)
+        self.assertEqual(len(turns), 6)
+        self.assertEqual(''.join(tokens), ''.join(turn.response for turn in turns))
+
+    def test_panel_agents_answer_the_same_context(self):
+        turns = self.run_session(mode='PANEL')
+        self.assertEqual([turn.agent.name for turn in turns], ['Alice', 'Bob'] * 3)
+        for first, second in zip(turns[::2], turns[1::2]):
+            self.assertEqual(first.response, second.response)
+        self.assertNotEqual(turns[0].response, turns[2].response)
+        self.assertEqual([turn.prompt for turn in turns], ['Open the debate'] + [''] * 5)
+
+    def test_panel_round_is_trimmed_to_max_turns(self):
+        turns = self.run_session(mode='PANEL', max_turns=3)
+        self.assertEqual([turn.agent.name for turn in turns], ['Alice', 'Bob', 'Alice'])
+        self.assertEqual(self.session.status, 'COMPLETED')
+
+    def test_async_loop_matches_the_sync_loop(self):
+        async_to_sync(arun_conversation)(self.session, 'Open the debate')
+        self.session.refresh_from_db()
+        self.assertEqual(self.session.turn_count, 6)
+        self.assertEqual(
+            list(self.session.turns.order_by('created_at', 'id').values_list('agent__name', flat=True)),
+            ['Alice', 'Bob'] * 3,
+        )
+
+
+@override_settings(LLM_RESPONSE_CACHE={'BACKEND': 'none'})
+class CounterTests(TestCase):
+    def setUp(self):
+        self.session = build_session(0, embed=False)
+        run_conversation(self.session, 'Open the debate')
+
+    def counters(self):
+        session = Session.objects.get(pk=self.session.pk)
+        stats = sorted(
+            (row.agent_id, row.turn_count, row.last_turn_at, row.response_chars, row.length_histogram, row.prompt_tokens, row.completion_tokens)
+            for row in session.agent_stats.all()
+        )
+        return (session.turn_count, session.last_turn_at, session.prompt_tokens, session.completion_tokens), stats
+
+    def test_append_turn_keeps_the_counters(self):
+        turns = list(self.session.turns.order_by('created_at', 'id'))
+        session = Session.objects.get(pk=self.session.pk)
+        self.assertEqual((session.turn_count, session.last_turn_at), (6, turns[-1].created_at))
+        self.assertEqual((self.session.turn_count, self.session.last_turn_at), (6, turns[-1].created_at))
+
+        for row in session.agent_stats.all():
+            agent_turns = [turn for turn in turns if turn.agent_id == row.agent_id]
+            self.assertEqual(row.turn_count, 3)
+            self.assertEqual(row.last_turn_at, agent_turns[-1].created_at)
+            self.assertEqual(row.response_chars, sum(len(turn.response) for turn in agent_turns))
+            self.assertEqual(sum(row.length_histogram.values()), 3)
+
+    def test_rebuild_matches_the_running_counters(self):
+        counters = self.counters()
+        rebuild_session_stats(Session.objects.get(pk=self.session.pk))
+        self.assertEqual(self.counters(), counters)
+
+    def test_deleting_an_agent_takes_its_turns_off_the_counters(self):
+        self.session.agents.order_by('id').last().delete()
+        session = Session.objects.get(pk=self.session.pk)
+        turns = session.turns.order_by('created_at', 'id')
+        totals = turns.aggregate(Sum('prompt_tokens'), Sum('completion_tokens'))
+        self.assertEqual(
+            (session.turn_count, session.last_turn_at, session.prompt_tokens, session.completion_tokens),
+            (3, turns.last().created_at, totals['prompt_tokens__sum'], totals['completion_tokens__sum']),
+        )
+        user = get_user_model().objects.get(pk=session.user_id)
+        self.assertEqual(
+            (user.prompt_tokens, user.completion_tokens),
+            (totals['prompt_tokens__sum'], totals['completion_tokens__sum']),
+        )
+
+        counters = self.counters()
+        rebuild_session_stats(session)
+        self.assertEqual(self.counters(), counters)
+
+        # With every agent gone the session is empty again
+        self.session.agents.get().delete()
+        session.refresh_from_db()
+        self.assertEqual((session.turn_count, session.last_turn_at, session.prompt_tokens), (0, None, 0))
+
+    def test_api_serves_the_counters(self):
+        client = token_client(self.session.user)
+        detail = client.get(f'/api/sessions/{self.session.pk}/').data
+        listed = client.get('/api/sessions/').data['results'][0]
+        last_turn = self.session.turns.latest('created_at', 'id')
+        self.assertEqual((detail['turn_count'], listed['turn_count']), (6, 6))
+        self.assertEqual(parse_datetime(detail['last_turn_at']), last_turn.created_at)
+
+
+@override_settings(LLM_RESPONSE_CACHE={'BACKEND': 'none'})
+class TokenUsageTests(TestCase):
+    def setUp(self):
+        self.session = build_session(0, embed=False)
+        self.client = token_client(self.session.user)
+
+    def me(self):
+        data = self.client.get('/api/users/me/').data
+        return data['prompt_tokens'], data['completion_tokens']
+
+    def totals(self, turns):
+        totals = turns.aggregate(Sum('prompt_tokens'), Sum('completion_tokens'))
+        return totals['prompt_tokens__sum'], totals['completion_tokens__sum']
+
+    def test_turn_usage_rolls_up_to_the_session_and_user(self):
+        run_conversation(self.session, 'Open the debate')
+        for turn in self.session.turns.all():
+            self.assertGreater(turn.prompt_tokens, 0)
+            self.assertGreater(turn.completion_tokens, 0)
+            self.assertEqual(turn.token_count, turn.prompt_tokens + turn.completion_tokens)
+
+        session = Session.objects.get(pk=self.session.pk)
+        totals = self.totals(session.turns.all())
+        self.assertEqual((session.prompt_tokens, session.completion_tokens), totals)
+        self.assertEqual(self.me(), totals)
+        detail = self.client.get(f'/api/sessions/{session.pk}/').data
+        self.assertEqual((detail['prompt_tokens'], detail['completion_tokens']), totals)
+
+    def test_user_totals_cover_every_session(self):
+        other = Session.objects.create(user=self.session.user, topic='Second debate', max_turns=10, status='ACTIVE')
+        other.agents.set(self.session.agents.all())
+        run_conversation(self.session, 'Open the debate')
+        run_conversation(other, 'Open another debate')
+        self.assertEqual(self.me(), self.totals(Turn.objects.filter(session__user=self.session.user)))
+
+    def test_summaries_count_towards_the_user_only(self):
+        run_conversation(self.session, 'Open the debate')
+        before = self.me()
+        response = self.client.post(f'/api/sessions/{self.session.pk}/generate-summary/')
+        self.assertEqual(response.status_code, 200)
+        prompt_tokens, completion_tokens = self.me()
+        self.assertGreater(prompt_tokens, before[0])
+        self.assertGreater(completion_tokens, before[1])
+        session = Session.objects.get(pk=self.session.pk)
+        self.assertEqual((session.prompt_tokens, session.completion_tokens), self.totals(session.turns.all()))
+
+
+@override_settings(DEBUG=True)
+class ConditionalReadTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.session = build_session(10, embed=False)
+        self.client = token_client(self.session.user)
+        self.detail_url = f'/api/sessions/{self.session.pk}/'
+
+    def get(self, url, etag=None):
+        headers = {'HTTP_IF_NONE_MATCH': etag} if etag else {}
+        return self.client.get(url, **headers)
+
+    def add_turn(self):
+        append_turn(self.session, self.session.agents.first(), '', 'One more point.', Usage(5, 5))
+
+    def test_detail_answers_a_matching_poll_with_304(self):
+        first = self.get(self.detail_url)
+        self.assertEqual(first.status_code, 200)
+        self.assertIn('no-cache', first['Cache-Control'])
+        self.assertIn('private', first['Cache-Control'])
+
+        poll = self.get(self.detail_url, first['ETag'])
+        self.assertEqual(poll.status_code, 304)
+        self.assertEqual(poll['ETag'], first['ETag'])
+        # The token lookup and the version
+        self.assertEqual(poll['X-Query-Count'], '2')
+
+        # Without If-None-Match the payload comes from the cache
+        cached = self.get(self.detail_url)
+        self.assertEqual(cached.data, first.data)
+        self.assertEqual(cached['X-Query-Count'], '2')
+
+    def test_new_turn_changes_the_etag(self):
+        first = self.get(self.detail_url)
+        self.add_turn()
+        response = self.get(self.detail_url, first['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], first['ETag'])
+        self.assertEqual(len(response.data['turns']), 11)
+
+    def test_list_answers_a_matching_poll_with_304(self):
+        first = self.get('/api/sessions/')
+        self.assertEqual(self.get('/api/sessions/', first['ETag']).status_code, 304)
+
+        self.add_turn()
+        response = self.get('/api/sessions/', first['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['results'][0]['turn_count'], 11)
+
+        Session.objects.create(user=self.session.user, topic='Another debate', max_turns=5)
+        self.assertEqual(self.get('/api/sessions/', response['ETag']).data['count'], 2)
+
+    def test_etags_are_per_user_and_query(self):
+        first = self.get('/api/sessions/')
+        filtered = self.get('/api/sessions/?status=COMPLETED')
+        self.assertNotEqual(filtered['ETag'], first['ETag'])
+        self.assertEqual(filtered.data['count'], 0)
+
+        other = token_client(build_session(0, embed=False).user)
+        self.assertEqual(other.get('/api/sessions/', HTTP_IF_NONE_MATCH=first['ETag']).status_code, 200)
+        response = other.get(self.detail_url)
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(response.has_header('ETag'))
+
+
+class TurnPaginationTests(TestCase):
+    def setUp(self):
+        self.session = build_session(100, embed=False)
+        self.client = token_client(self.session.user)
+        self.url = f'/api/sessions/{self.session.pk}/turns/'
+        self.turn_ids = list(self.session.turns.order_by('created_at', 'id').values_list('id', flat=True))
+
+    def get(self, url=None, **params):
+        response = self.client.get(url or self.url, params)
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.data
+
+    def walk(self, **params):
+        seen = []
+        page = self.get(**params)
+        while True:
+            seen += [turn['id'] for turn in page['results']]
+            if page['next'] is None:
+                return seen, page
+            page = self.get(page['next'])
+
+    def test_next_links_cover_every_turn_once(self):
+        seen, last_page = self.walk(limit=30)
+        self.assertEqual(seen, self.turn_ids)
+        self.assertEqual(last_page['last_turn_id'], self.turn_ids[-1])
+
+    def test_turns_written_at_the_same_time_are_ordered_by_id(self):
+        self.session.turns.update(created_at=timezone.now())
+        seen, _ = self.walk(limit=7)
+        self.assertEqual(seen, sorted(self.turn_ids))
+
+    def test_after_returns_only_newer_turns(self):
+        page = self.get(after=self.turn_ids[89])
+        self.assertEqual([turn['id'] for turn in page['results']], self.turn_ids[90:])
+        self.assertIsNone(page['next'])
+
+        append_turn(self.session, self.session.agents.first(), '', 'A new point.', Usage(5, 5))
+        page = self.get(after=page['last_turn_id'])
+        self.assertEqual([turn['response'] for turn in page['results']], ['A new point.'])
+
+        newest = page['last_turn_id']
+        page = self.get(after=newest)
+        self.assertEqual((page['results'], page['last_turn_id']), ([], newest))
+
+    def test_bad_parameters(self):
+        self.assertEqual(self.client.get(self.url, {'after': 'x'}).status_code, 400)
+        self.assertEqual(self.client.get(self.url, {'limit': 'x'}).status_code, 400)
+        other = build_session(1, embed=False)
+        self.assertEqual(self.client.get(self.url, {'after': other.turns.get().id}).status_code, 404)
+        with mock.patch.object(TurnKeysetPagination, 'max_page_size', 40):
+            self.assertEqual(len(self.get(limit=1000)['results']), 40)
+
+
+class ColdStorageTests(TestCase):
+    def setUp(self):
+        self.session = build_session(120, embed=False)
+        self.client = token_client(self.session.user)
+        block_turns = mock.patch.object(coldstorage, 'BLOCK_TURNS', 50)
+        block_turns.start()
+        self.addCleanup(block_turns.stop)
+
+    def reads(self):
+        exports = {}
+        for fmt in ('md', 'txt', 'jsonl'):
+            response = self.client.get(f'/api/sessions/{self.session.pk}/export/{fmt}/')
+            self.assertEqual(response.status_code, 200)
+            exports[fmt] = b''.join(response.streaming_content)
+        # Everything after the header, which carries the export time
+        exports['archive'] = b''.join(export_archive(self.session.user)).split(b'\n', 1)[1]
+        exports['detail'] = json.dumps(self.client.get(f'/api/sessions/{self.session.pk}/').data['turns'])
+        exports['turns'] = json.dumps(self.client.get(f'/api/sessions/{self.session.pk}/turns/', {'limit': 500}).data)
+        return exports
+
+    def test_reads_are_identical_when_frozen_and_thawed(self):
+        hot = self.reads()
+        self.assertEqual(coldstorage.freeze_session(self.session)[0], 120)
+        self.assertEqual(self.session.cold_blocks.count(), 3)
+        self.assertFalse(self.session.turns.exclude(prompt='').exists())
+        self.assertEqual(self.reads(), hot)
+
+        self.assertEqual(coldstorage.thaw_session(self.session), 120)
+        self.assertFalse(self.session.turns.filter(cold=True).exists())
+        self.assertFalse(self.session.cold_blocks.exists())
+        self.assertEqual(self.reads(), hot)
+
+    def test_new_turns_after_freezing_stay_hot(self):
+        coldstorage.freeze_session(self.session)
+        append_turn(self.session, self.session.agents.first(), '', 'A late point.', Usage(5, 5))
+        exported = self.reads()['jsonl'].decode().splitlines()
+        # The session's header line, then its turns
+        self.assertEqual(len(exported), 122)
+        self.assertIn('A late point.', exported[-1])
+        self.assertIn(FILLER, exported[1])
+
+        self.assertEqual(coldstorage.freeze_session(self.session)[0], 1)
+        self.assertEqual(coldstorage.freeze_session(self.session), (0, 0, 0))
+
+    def test_candidates_are_old_completed_sessions_with_hot_turns(self):
+        stale = timezone.now() - timezone.timedelta(days=31)
+        active = build_session(5, embed=False)
+        Session.objects.filter(pk__in=[self.session.pk, active.pk]).update(updated_at=stale)
+        Session.objects.filter(pk=self.session.pk).update(status='COMPLETED')
+        self.assertEqual(list(coldstorage.cold_candidates()), [self.session])
+
+        coldstorage.freeze_session(self.session)
+        self.assertEqual(list(coldstorage.cold_candidates()), [])
+
+
+class AuditQueriesTests(TestCase):
+    def test_unsupported_database_is_a_command_error(self):
+        with mock.patch.object(connection, 'vendor', 'mysql'):
+            with self.assertRaisesMessage(CommandError, 'not mysql'):
+                call_command('audit_queries', stdout=io.StringIO())
+
+
+@override_settings(MEMORY_RECENT_TURNS=6, MEMORY_RETRIEVED_TURNS=4)
+class MemoryTests(TestCase):
+    def setUp(self):
+        self.session = build_session(0, embed=False)
+        self.agents = list(self.session.agents.order_by('id'))
+        self.turns = []
+
+    def say(self, response):
+        turn = append_turn(self.session, self.agents[len(self.turns) % 2], '', response, Usage(5, 5))
+        self.turns.append(turn)
+        return turn
+
+    def debate(self, older=30):
+        self.say('Zeppelins filled with hydrogen burn, so airships moved to helium.')
+        for i in range(older):
+            self.say(f'Point {i}: the budget for topic{i} should cover item{i} and cost{i}.')
+        for i in range(6):
+            self.say(f'Recent {i}: could hydrogen airships like zeppelins come back, asks speaker{i}?')
+
+    def test_related_finds_the_older_turn(self):
+        self.debate()
+        recent_ids = [turn.id for turn in self.turns[-6:]]
+        related = SessionMemory.load(self.session).related(recent_ids, 4)
+        self.assertEqual(related[0], self.turns[0].id)
+        self.assertEqual(len(related), 4)
+        self.assertFalse(set(related) & set(recent_ids))
+
+    def test_prompt_holds_the_recent_and_related_turns(self):
+        self.debate()
+        context = ConversationContext.load(self.session)
+        lines = [line for line in context.prompt.split('\n\n') if line.startswith(('Alice:', 'Bob:'))]
+        self.assertEqual(len(lines), 10)
+        self.assertIn(self.turns[0].response, context.prompt)
+        self.assertTrue(context.prompt.endswith(f'{self.turns[-1].agent.name}: {self.turns[-1].response}\n\n'))
+
+        # The prompt doesn't grow with the session
+        for i in range(20):
+            context.append(self.say(f'Later point {i} on something else{i}.'))
+        self.assertEqual(len([line for line in context.prompt.split('\n\n') if line.startswith(('Alice:', 'Bob:'))]), 10)
+
+    def test_append_turn_stores_the_embedding(self):
+        turn = self.say('Zeppelins are slow.')
+        stored = np.frombuffer(TurnEmbedding.objects.get(turn=turn).vector, dtype=np.float32)
+        np.testing.assert_array_equal(stored, embed(turn_text('', 'Zeppelins are slow.')))
+
+    def test_append_reads_only_turns_not_seen_yet(self):
+        for i in range(8):
+            self.say(f'Point {i}.')
+        context = ConversationContext.load(self.session)
+        for i in range(8, 10):
+            turn = self.say(f'Point {i}.')
+            # The turn leaving the recent ones is already known
+            with self.assertNumQueries(0):
+                context.append(turn)
+        self.assertEqual(context.prompt, ConversationContext.load(self.session).prompt)
+
+
+class ExportTests(TestCase):
+    def setUp(self):
+        self.session = build_session(60, embed=False)
+        self.participants = ['Alice', 'Bob']
+
+    def export(self, writer):
+        chunks = list(writer(self.session, self.participants))
+        return b''.join(chunk if isinstance(chunk, bytes) else chunk.encode() for chunk in chunks)
+
+    def assert_well_formed(self, pdf):
+        self.assertTrue(pdf.startswith(b'%PDF-1.4\n'))
+        self.assertTrue(pdf.endswith(b'%%EOF\n'))
+        xref_offset = int(re.search(rb'startxref\n(\d+)\n%%EOF\n$', pdf)[1])
+        self.assertTrue(pdf[xref_offset:].startswith(b'xref\n'))
+        size = int(re.search(rb'xref\n0 (\d+)\n', pdf[xref_offset:])[1])
+        self.assertIn(f'trailer\n<< /Size {size} /Root 1 0 R >>'.encode(), pdf)
+        entries = re.findall(rb'(\d{10}) 00000 n \n', pdf[xref_offset:])
+        self.assertEqual(len(entries), size - 1)
+        for number, offset in enumerate(entries, 1):
+            self.assertTrue(pdf[int(offset):].startswith(f'{number} 0 obj\n'.encode()), number)
+        for length, body in re.findall(rb'<< /Length (\d+) >>\nstream\n(.*?)\nendstream', pdf, re.S):
+            self.assertEqual(int(length), len(body))
+        pages = len(re.findall(rb'/Type /Page /Parent', pdf))
+        self.assertIn(f'/Count {pages} >>'.encode(), pdf)
+        return pages
+
+    def test_pdf_is_well_formed_across_pages(self):
+        pdf = self.export(pdf_export)
+        self.assertGreater(self.assert_well_formed(pdf), 1)
+        self.assertIn(b'(Turn 60 - Bob) Tj', pdf)
+
+    def test_pdf_of_an_empty_session_has_a_page(self):
+        self.session.turns.all().delete()
+        self.assertEqual(self.assert_well_formed(self.export(pdf_export)), 1)
+
+    def test_pdf_text_is_escaped(self):
+        self.assertEqual(PDFWriter._escape('f(x) = a\\b'), b'f\\(x\\) = a\\\\b')
+        # WinAnsi covers the euro sign; anything else prints as ?
+        self.assertEqual(PDFWriter._escape('€5 日本'), b'\x805 ??')
+
+        self.session.turns.update(response='Cost (in €) is a\\b, 日本')
+        pdf = self.export(pdf_export)
+        self.assert_well_formed(pdf)
+        self.assertIn(b'(Cost \\(in \x80\\) is a\\\\b, ??) Tj', pdf)
+
+    def test_long_responses_are_wrapped(self):
+        self.session.turns.update(response='word ' * 2000)
+        pdf = self.export(pdf_export)
+        self.assertGreater(self.assert_well_formed(pdf), 60)
+        lines = re.findall(rb'\((.*?)\) Tj', pdf)
+        self.assertLessEqual(max(len(line) for line in lines), PDFWriter.wrap_width)
+
+    def test_jsonl_has_one_object_per_turn(self):
+        records = [json.loads(line) for line in self.export(jsonl_export).decode().splitlines()]
+        self.assertEqual(records[0]['type'], 'session')
+        self.assertEqual(records[0]['participants'], self.participants)
+        turns = list(self.session.turns.order_by('created_at', 'id'))
+        self.assertEqual([record['id'] for record in records[1:]], [turn.id for turn in turns])
+        self.assertEqual({record['type'] for record in records[1:]}, {'turn'})
+        self.assertEqual(records[-1]['response'], turns[-1].response)
+
+    def test_text_and_markdown_hold_every_turn(self):
+        text = self.export(text_export).decode()
+        markdown = self.export(markdown_export).decode()
+        self.assertEqual(len(re.findall(r'^Turn \d+ - ', text, re.M)), 60)
+        self.assertEqual(len(re.findall(r'^## Turn \d+ - ', markdown, re.M)), 60)
+        self.assertTrue(markdown.startswith('# Benchmark debate\n'))
+
+
+class ReportTests(TestCase):
+    def setUp(self):
+        self.session = build_session(0, embed=False)
+        self.alice, self.bob = self.session.agents.order_by('id')
+        for agent, length, latency in ((self.alice, 10, 100), (self.bob, 200, None), (self.alice, 60, 300), (self.alice, 120, 200)):
+            append_turn(self.session, agent, '', 'x' * length, Usage(length, 2 * length), latency)
+        self.client = token_client(self.session.user)
+
+    def report(self, session=None, client=None):
+        session = session or self.session
+        response = (client or self.client).post(f'/api/sessions/{session.pk}/generate-report/')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('Alice', response.data['report'])
+        return response.data['stats']
+
+    def test_histogram_median(self):
+        self.assertEqual(histogram_median({}, 0), 0)
+        self.assertEqual(histogram_median({'3': 4}, 4), 175)
+        # Two turns below the middle: halfway through the bucket from 100 to 150
+        self.assertEqual(histogram_median({'0': 1, '2': 2, '5': 1}, 4), 125)
+
+    def test_report_stats(self):
+        stats = self.report()
+        self.assertEqual(stats['session']['turn_count'], 4)
+        self.assertEqual((stats['session']['prompt_tokens'], stats['session']['completion_tokens']), (390, 780))
+        alice, bob = stats['agents']
+        self.assertEqual(
+            {key: alice[key] for key in ('name', 'turns', 'avg_length', 'prompt_tokens', 'completion_tokens', 'avg_latency_ms')},
+            {'name': 'Alice', 'turns': 3, 'avg_length': 63, 'prompt_tokens': 190, 'completion_tokens': 380, 'avg_latency_ms': 200},
+        )
+        # The median of 10, 60 and 120 is 60, within a bucket's width
+        self.assertLess(abs(alice['median_length'] - 60), SessionAgentStats.LENGTH_BUCKET)
+        self.assertEqual((bob['turns'], bob['avg_latency_ms'], bob['median_length']), (1, None, 225))
+        self.assertEqual(alice['last_turn_at'], self.session.turns.filter(agent=self.alice).latest('created_at').created_at)
+
+    def test_imported_sessions_get_the_same_stats(self):
+        user = get_user_model().objects.create_user('importer', password='importer')
+        import_archive(user, io.BytesIO(b''.join(export_archive(self.session.user))))
+        imported = Session.objects.get(user=user)
+        source_stats, imported_stats = self.report(), self.report(imported, token_client(user))
+        for key in ('turn_count', 'prompt_tokens', 'completion_tokens', 'last_turn_at'):
+            self.assertEqual(imported_stats['session'][key], source_stats['session'][key])
+        for source_agent, imported_agent in zip(source_stats['agents'], imported_stats['agents']):
+            del source_agent['id'], imported_agent['id']
+            self.assertEqual(imported_agent, source_agent)
+
+    def test_rebuild_adds_imported_tokens_to_the_user_once(self):
+        user = get_user_model().objects.create_user('importer', password='importer')
+        import_archive(user, io.BytesIO(b''.join(export_archive(self.session.user))))
+        user.refresh_from_db()
+        self.assertEqual((user.prompt_tokens, user.completion_tokens), (390, 780))
+
+        rebuild_session_stats(Session.objects.get(user=user))
+        user.refresh_from_db()
+        self.assertEqual((user.prompt_tokens, user.completion_tokens), (390, 780))
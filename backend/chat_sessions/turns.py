@@ -0,0 +1,48 @@
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import F
+
+from .memory import embedding_for
+from .models import Session, Turn
+from .stats import record_turn
+
+
+def record_user_usage(user_id, usage):
+    get_user_model().objects.filter(pk=user_id).update(
+        prompt_tokens=F('prompt_tokens') + usage.prompt_tokens,
+        completion_tokens=F('completion_tokens') + usage.completion_tokens,
+    )
+
+
+@transaction.atomic
+def append_turn(session, agent, prompt, response, usage, latency_ms=None):
+    """
+    Writes a turn in its final form and, in the same transaction, adds it to
+    the session's turn and token counters, the agent's report statistics
+    for the session and the user's token totals, so reads never need a scan
+    over Turn rows. The turn's embedding for the session memory is stored
+    too. ``session`` is updated in memory to match.
+    """
+    turn = Turn.objects.create(
+        session=session,
+        agent=agent,
+        prompt=prompt,
+        response=response,
+        prompt_tokens=usage.prompt_tokens,
+        completion_tokens=usage.completion_tokens,
+        token_count=usage.total_tokens,
+        latency_ms=latency_ms,
+    )
+    embedding_for(turn).save()
+    Session.objects.filter(pk=session.pk).update(
+        turn_count=F('turn_count') + 1,
+        last_turn_at=turn.created_at,
+        prompt_tokens=F('prompt_tokens') + usage.prompt_tokens,
+        completion_tokens=F('completion_tokens') + usage.completion_tokens,
+    )
+    session.turn_count += 1
+    session.last_turn_at = turn.created_at
+    record_turn(session, agent, turn)
+    record_user_usage(session.user_id, usage)
+    return turn
+
@@ -2,21 +2,34 @@ from django.urls import path
 from .views import (
     SessionListCreateView, 
     SessionDetailView, 
+    SessionTurnListView,
+    SessionArchiveView,
+    SessionSearchView,
     SessionStartView, 
     SessionStopView, 
     InjectPromptView,
+    JobDetailView,
+    StreamConversationView,
     GenerateSummaryView,
-    ExportPDFView,
+    ExportSessionView,
     GenerateReportView
 )
+from .async_views import async_stream_conversation
 
 urlpatterns = [
     path('', SessionListCreateView.as_view(), name='session-list-create'),
+    path('archive/', SessionArchiveView.as_view(), name='session-archive'),
+    path('search/', SessionSearchView.as_view(), name='session-search'),
     path('<int:pk>/', SessionDetailView.as_view(), name='session-detail'),
+    path('<int:pk>/turns/', SessionTurnListView.as_view(), name='session-turn-list'),
     path('<int:pk>/start/', SessionStartView.as_view(), name='session-start'),
     path('<int:pk>/stop/', SessionStopView.as_view(), name='session-stop'),
     path('<int:pk>/inject/', InjectPromptView.as_view(), name='session-inject'),
+    path('<int:pk>/stream/', StreamConversationView.as_view(), name='session-stream'),
+    path('<int:pk>/async-stream/', async_stream_conversation, name='session-async-stream'),
+    path('<int:pk>/jobs/<int:job_id>/', JobDetailView.as_view(), name='session-job-detail'),
     path('<int:pk>/generate-summary/', GenerateSummaryView.as_view(), name='session-generate-summary'),
-    path('<int:pk>/export-pdf/', ExportPDFView.as_view(), name='session-export-pdf'),
+    path('<int:pk>/export/<str:fmt>/', ExportSessionView.as_view(), name='session-export'),
+    path('<int:pk>/export-pdf/', ExportSessionView.as_view(), {'fmt': 'pdf'}, name='session-export-pdf'),
     path('<int:pk>/generate-report/', GenerateReportView.as_view(), name='session-generate-report'),
 ]
@@ -1,36 +1,40 @@
-def generate_session_report(session):
+from .stats import session_report_stats
+
+
+def generate_session_report(session, stats=None):
     """
-    Generates a markdown report for a given session.
+    Generates a markdown report for a given session from its materialized
+    statistics (see stats.py). Pass ``stats`` if they are already loaded.
     """
-    if not session.turns.exists():
+    total_turns = session.turn_count
+    if not total_turns:
         return "No conversation to analyze."
-    
+
     # Calculate statistics
-    total_turns = session.turns.count()
-    agents_stats = {}
-    
-    for agent in session.agents.all():
-        agent_turns = session.turns.filter(agent=agent)
-        agents_stats[agent.name] = {
-            'turns': agent_turns.count(),
-            'avg_length': sum(len(t.response) for t in agent_turns) / agent_turns.count() if agent_turns.exists() else 0
-        }
-    
+    if stats is None:
+        stats = session_report_stats(session)
+
     # Build report
     report = f"# Session Analysis Report\n\n"
     report += f"**Session ID:** {session.id}\n\n"
     report += f"**Topic:** {session.topic}\n\n"
     report += f"**Status:** {session.status}\n\n"
     report += f"**Total Turns:** {total_turns} / {session.max_turns}\n\n"
-    
+    report += f"**Tokens:** {session.prompt_tokens} prompt, {session.completion_tokens} completion\n\n"
+
     report += f"## Agent Participation\n\n"
-    for agent_name, stats in agents_stats.items():
-        report += f"### {agent_name}\n"
-        report += f"- Turns: {stats['turns']}\n"
-        report += f"- Average Response Length: {int(stats['avg_length'])} characters\n\n"
-    
+    for agent in stats['agents']:
+        report += f"### {agent['name']}\n"
+        report += f"- Turns: {agent['turns']}\n"
+        report += f"- Average Response Length: {agent['avg_length']} characters\n"
+        report += f"- Median Response Length: ~{agent['median_length']} characters\n"
+        report += f"- Tokens: {agent['prompt_tokens']} prompt, {agent['completion_tokens']} completion\n"
+        if agent['avg_latency_ms'] is not None:
+            report += f"- Average Response Time: {agent['avg_latency_ms'] / 1000:.1f}s\n"
+        report += "\n"
+
     report += f"## Timeline\n\n"
     report += f"- Started: {session.created_at.strftime('%Y-%m-%d %H:%M:%S')}\n"
-    report += f"- Last Activity: {session.turns.last().created_at.strftime('%Y-%m-%d %H:%M:%S') if session.turns.exists() else 'N/A'}\n\n"
-    
+    report += f"- Last Activity: {session.last_turn_at.strftime('%Y-%m-%d %H:%M:%S') if session.last_turn_at else 'N/A'}\n\n"
+
     return report
@@ -1,257 +1,431 @@
+import datetime
+
 from rest_framework import generics, permissions, status
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
-from .models import Session, Turn
-from .serializers import SessionSerializer, TurnSerializer
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+from .models import Session, Turn, OrchestrationJob
+from .serializers import SessionSerializer, SessionListSerializer, TurnSerializer, OrchestrationJobSerializer
+from .pagination import SessionPagination, TurnKeysetPagination
+from .jobs import SessionBusy, enqueue_job, conversation_blocker, start_inline_job, extend_lease, finish_job, default_worker_id
+from .events import event_payload, format_event
+from .exports import EXPORT_FORMATS, export_stream
+from .summaries import SessionSummarizer
+from .archive import COMPRESSIONS, ArchiveError, export_archive, import_archive, zstandard
+from .search import SearchUnavailable, search_turns
+from .caching import CachedReadMixin
+from .orchestration import iter_conversation, OrchestrationError
+from .turns import record_user_usage
 from agents.models import Agent
-from vault.models import Credential
+from vault.resolver import CredentialResolver
 from core.providers import ProviderFactory
+from core.llm_cache import cached_provider
+from core.querybudget import extend_query_budget
+from core.ratelimit import rate_limited_provider
+from django.db.models import Count, Max, Prefetch, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
 from django.shortcuts import get_object_or_404
 from rest_framework.views import APIView
 
-class SessionListCreateView(generics.ListCreateAPIView):
-    serializer_class = SessionSerializer
+
+def parse_date_param(name, value):
+    try:
+        parsed = parse_datetime(value) or parse_date(value)
+    except ValueError:
+        parsed = None
+    if parsed is None:
+        raise ValidationError({name: 'Use an ISO date or datetime.'})
+    if not isinstance(parsed, datetime.datetime):
+        parsed = datetime.datetime.combine(parsed, datetime.time.min)
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+def session_queryset(user):
+    # Prefetches everything SessionSerializer reads, so a page of sessions
+    # costs the same number of queries however many turns they hold
+    return Session.objects.filter(user=user).prefetch_related(
+        'agents',
+        Prefetch('turns', queryset=Turn.objects.select_related('agent')),
+    )
+
+class SessionListCreateView(CachedReadMixin, generics.ListCreateAPIView):
+    """
+    Lists sessions as summaries, newest first, a page at a time. Filter
+    with ``?status=ACTIVE,COMPLETED``, ``?created_after=`` and
+    ``?created_before=`` (ISO dates or datetimes). Pages are cached and
+    served with ETags (see caching.py).
+    """
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = SessionPagination
+    query_budget = 8
+
+    def get_serializer_class(self):
+        if self.request.method == 'GET':
+            return SessionListSerializer
+        return SessionSerializer
 
     def get_queryset(self):
-        return Session.objects.filter(user=self.request.user)
+        if self.request.method != 'GET':
+            return session_queryset(self.request.user)
+        queryset = Session.objects.filter(user=self.request.user).annotate(
+            last_activity=Coalesce('last_turn_at', 'created_at'),
+        ).prefetch_related(
+            Prefetch('agents', queryset=Agent.objects.only('id', 'name'))
+        ).order_by('-created_at', '-id')
+        return self.filter_queryset_params(queryset)
+
+    def get_version(self):
+        # Every change to a session moves updated_at to the newest, a turn
+        # moves the turn total and a deletion the count
+        sessions = self.filter_queryset_params(Session.objects.filter(user=self.request.user))
+        version = sessions.aggregate(count=Count('id'), updated=Max('updated_at'), turns=Sum('turn_count'))
+        return f"{version['count']}:{version['updated']}:{version['turns']}"
+
+    def filter_queryset_params(self, queryset):
+        params = self.request.query_params
+        if params.get('status'):
+            queryset = queryset.filter(status__in=params['status'].upper().split(','))
+        for param, lookup in (('created_after', 'created_at__gte'), ('created_before', 'created_at__lt')):
+            if params.get(param):
+                queryset = queryset.filter(**{lookup: parse_date_param(param, params[param])})
+        return queryset
 
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
 
-class SessionDetailView(generics.RetrieveAPIView):
+class SessionDetailView(CachedReadMixin, generics.RetrieveAPIView):
+    """
+    A session with its agents and turns, cached and served with an ETag
+    (see caching.py).
+    """
     serializer_class = SessionSerializer
     permission_classes = [permissions.IsAuthenticated]
+    # One more than the serializer needs, for the version on a cache miss
+    query_budget = 6
 
     def get_queryset(self):
-        return Session.objects.filter(user=self.request.user)
+        return session_queryset(self.request.user)
+
+    def get_version(self):
+        version = Session.objects.filter(pk=self.kwargs['pk'], user=self.request.user).values_list(
+            'updated_at', 'turn_count',
+        ).first()
+        if version is None:
+            return None
+        updated_at, turn_count = version
+        return f'{updated_at.isoformat()}:{turn_count}'
+
+class SessionTurnListView(generics.ListAPIView):
+    """
+    Turns of a session, oldest first, a page at a time. Pass
+    ``?after=<turn id>`` to fetch only the turns since that one.
+    """
+    serializer_class = TurnSerializer
+    permission_classes = [permissions.IsAuthenticated]
+    pagination_class = TurnKeysetPagination
+    query_budget = 5
+
+    def get_queryset(self):
+        session = get_object_or_404(Session.objects.only('id'), pk=self.kwargs['pk'], user=self.request.user)
+        return session.turns.select_related('agent')
 
 class SessionStartView(APIView):
     permission_classes = [permissions.IsAuthenticated]
+    query_budget = 4
 
     def post(self, request, pk):
         session = get_object_or_404(Session, pk=pk, user=request.user)
         session.status = 'ACTIVE'
-        session.save()
+        session.save(update_fields=['status', 'updated_at'])
         return Response({'status': 'Session started'})
 
 class SessionStopView(APIView):
     permission_classes = [permissions.IsAuthenticated]
+    query_budget = 4
 
     def post(self, request, pk):
         session = get_object_or_404(Session, pk=pk, user=request.user)
         session.status = 'COMPLETED'
-        session.save()
+        session.save(update_fields=['status', 'updated_at'])
         return Response({'status': 'Session stopped'})
 
 class GenerateSummaryView(APIView):
+    """
+    Summarizes the whole session block by block (see summaries.py). Block
+    summaries are kept, so a later call only summarizes the new turns.
+    """
     permission_classes = [permissions.IsAuthenticated]
+    # The same for any session: turns and cold blocks are each streamed in one
+    # query. New block summaries take one INSERT, or more on a long session's
+    # first summary, which the view adds to the budget
+    query_budget = 14
 
     def post(self, request, pk):
         session = get_object_or_404(Session, pk=pk, user=request.user)
         
-        if not session.turns.exists():
+        if not session.turn_count:
             return Response({
                 'error': 'No conversation to summarize'
             }, status=status.HTTP_400_BAD_REQUEST)
         
-        # Build conversation text
-        conversation = []
-        for turn in session.turns.all():
-            conversation.append(f"{turn.agent.name}: {turn.response}")
-        
-        conversation_text = "\n\n".join(conversation)
-        
         # Generate summary using the first agent's provider
         try:
             first_agent = session.agents.first()
-            credential = Credential.objects.filter(user=request.user, provider=first_agent.provider).first()
+            api_key = CredentialResolver(request.user.id, [first_agent.provider]).get_keys(first_agent.provider)
             
-            if not credential:
+            if api_key is None:
                 return Response({
-                    'summary': f"Session Summary:\n\nTopic: {session.topic}\nTotal Turns: {session.turns.count()}\n\nThis session contains {session.turns.count()} conversation turns. To generate an AI-powered summary, please add an API key for {first_agent.provider} in the Vault."
+                    'summary': f"Session Summary:\n\nTopic: {session.topic}\nTotal Turns: {session.turn_count}\n\nThis session contains {session.turn_count} conversation turns. To generate an AI-powered summary, please add an API key for {first_agent.provider} in the Vault."
                 })
             
-            api_key = credential.get_key()
-            provider = ProviderFactory.get_provider(first_agent.provider)
+            # Summaries of an unchanged block are identical requests
+            provider = rate_limited_provider(ProviderFactory.get_provider(first_agent.provider), first_agent.provider)
+            provider = cached_provider(provider, first_agent.provider)
             
-            summary_prompt = f"Please provide a concise summary of the following conversation:\n\n{conversation_text[:3000]}"
-            
-            summary = provider.generate_response(
-                system_message="You are a helpful assistant that creates concise summaries.",
-                prompt=summary_prompt,
-                api_key=api_key,
-                model=first_agent.model
-            )
+            summarizer = SessionSummarizer(session, provider, api_key, first_agent.model)
+            summary = summarizer.summarize()
+            extend_query_budget(request, max(summarizer.insert_batches - 1, 0))
+            if summarizer.usage.total_tokens:
+                record_user_usage(request.user.id, summarizer.usage)
             
             return Response({'summary': summary})
             
         except Exception as e:
             return Response({
-                'summary': f"Session Summary:\n\nTopic: {session.topic}\nTotal Turns: {session.turns.count()}\n\nKey participants: {', '.join([a.name for a in session.agents.all()])}"
+                'summary': f"Session Summary:\n\nTopic: {session.topic}\nTotal Turns: {session.turn_count}\n\nKey participants: {', '.join([a.name for a in session.agents.all()])}"
             })
 
-class ExportPDFView(APIView):
+class ExportSessionView(APIView):
+    """
+    Streams the transcript as text, Markdown, JSONL or PDF. Turns are read in
+    chunks while the response is being sent, so memory use stays flat and the
+    first bytes go out immediately however long the session is.
+    """
     permission_classes = [permissions.IsAuthenticated]
+    # Covers the lookups before streaming starts; the turns are read in the body
+    query_budget = 4
 
-    def get(self, request, pk):
-        from django.http import HttpResponse
-        
+    def get(self, request, pk, fmt='txt'):
+        from django.http import StreamingHttpResponse
+
+        if fmt not in EXPORT_FORMATS:
+            return Response(
+                {'error': f"Unknown export format. Use one of: {', '.join(EXPORT_FORMATS)}"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
         session = get_object_or_404(Session, pk=pk, user=request.user)
-        
-        # For now, return a simple text file (PDF generation requires additional library)
-        response = HttpResponse(content_type='text/plain')
-        response['Content-Disposition'] = f'attachment; filename="session-{pk}-transcript.txt"'
-        
-        # Build transcript
-        transcript = f"AgentVerse Session Transcript\n"
-        transcript += f"=" * 50 + "\n\n"
-        transcript += f"Session ID: {session.id}\n"
-        transcript += f"Topic: {session.topic}\n"
-        transcript += f"Created: {session.created_at.strftime('%Y-%m-%d %H:%M:%S')}\n"
-        transcript += f"Participants: {', '.join([a.name for a in session.agents.all()])}\n"
-        transcript += f"\n" + "=" * 50 + "\n\n"
-        
-        for i, turn in enumerate(session.turns.all(), 1):
-            transcript += f"Turn {i} - {turn.agent.name}\n"
-            transcript += f"{'-' * 50}\n"
-            transcript += f"Time: {turn.created_at.strftime('%Y-%m-%d %H:%M:%S')}\n\n"
-            transcript += f"{turn.response}\n\n"
-            transcript += f"{'=' * 50}\n\n"
-        
-        response.write(transcript)
+        participants = list(session.agents.values_list('name', flat=True))
+
+        _, content_type, extension = EXPORT_FORMATS[fmt]
+        response = StreamingHttpResponse(export_stream(session, fmt, participants), content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename="session-{pk}-transcript.{extension}"'
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+class SessionArchiveView(APIView):
+    """
+    GET streams the user's sessions as an archive (see archive.py);
+    ``?sessions=1,2`` limits it to those sessions, ``?compress=gzip|zstd``
+    compresses it and ``?archive=zip`` writes a zip instead. POST imports an
+    archive uploaded as ``file``.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    # Imports add a query per batch of turns, so this covers archives of a few
+    # thousand turns; larger ones are better loaded with import_sessions
+    query_budget = 60
+
+    def get(self, request):
+        from django.http import StreamingHttpResponse
+
+        session_ids = None
+        if request.query_params.get('sessions'):
+            try:
+                session_ids = [int(value) for value in request.query_params['sessions'].split(',')]
+            except ValueError:
+                raise ValidationError({'sessions': 'Use comma-separated session ids.'})
+        compression = request.query_params.get('compress') or None
+        as_zip = request.query_params.get('archive') == 'zip'
+        if compression and compression not in COMPRESSIONS:
+            raise ValidationError({'compress': f"Use one of: {', '.join(COMPRESSIONS)}"})
+        if compression == 'zstd' and zstandard is None:
+            raise ValidationError({'compress': 'zstd is not available on this server.'})
+
+        if as_zip:
+            content_type, extension = 'application/zip', 'zip'
+        elif compression == 'gzip':
+            content_type, extension = 'application/gzip', 'jsonl.gz'
+        elif compression == 'zstd':
+            content_type, extension = 'application/zstd', 'jsonl.zst'
+        else:
+            content_type, extension = 'application/x-ndjson', 'jsonl'
+        chunks = export_archive(request.user, session_ids, compression=compression, as_zip=as_zip)
+        response = StreamingHttpResponse(chunks, content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename="agentverse-sessions.{extension}"'
         return response
 
+    def post(self, request):
+        upload = request.FILES.get('file')
+        if upload is None:
+            raise ValidationError({'file': 'Upload an archive as "file".'})
+        try:
+            counts = import_archive(request.user, upload)
+        except ArchiveError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(counts, status=status.HTTP_201_CREATED)
+
+class SessionSearchView(APIView):
+    """
+    Full-text search over the user's turns (see search.py), best matches
+    first. ``?q=`` holds the words to find, ``?session=`` limits it to one
+    session, and ``?page=`` / ``?page_size=`` page through the results.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    query_budget = 6
+    page_size = 20
+    max_page_size = 100
+
+    def int_param(self, name, default, minimum=1, maximum=None):
+        value = self.request.query_params.get(name)
+        if value in (None, ''):
+            return default
+        try:
+            value = int(value)
+        except ValueError:
+            raise ValidationError({name: 'Must be an integer.'})
+        if value < minimum:
+            raise ValidationError({name: f'Must be at least {minimum}.'})
+        return min(value, maximum) if maximum else value
+
+    def get(self, request):
+        text = request.query_params.get('q', '').strip()
+        if not text:
+            raise ValidationError({'q': 'Enter something to search for.'})
+        page = self.int_param('page', 1)
+        page_size = self.int_param('page_size', self.page_size, maximum=self.max_page_size)
+        session_id = self.int_param('session', None)
+
+        try:
+            # One extra result tells whether there is a next page without a COUNT
+            results = search_turns(
+                request.user, text, session_id=session_id, limit=page_size + 1, offset=(page - 1) * page_size,
+            )
+        except SearchUnavailable as e:
+            return Response({'error': str(e)}, status=status.HTTP_501_NOT_IMPLEMENTED)
+
+        url = request.build_absolute_uri()
+        previous = None
+        if page > 1:
+            previous = replace_query_param(url, 'page', page - 1) if page > 2 else remove_query_param(url, 'page')
+        return Response({
+            'next': replace_query_param(url, 'page', page + 1) if len(results) > page_size else None,
+            'previous': previous,
+            'results': results[:page_size],
+        })
+
 class GenerateReportView(APIView):
+    """
+    Returns the session report as markdown (``report``) and as structured
+    statistics (``stats``) for clients that render it themselves.
+    """
     permission_classes = [permissions.IsAuthenticated]
+    query_budget = 4
 
     def post(self, request, pk):
         session = get_object_or_404(Session, pk=pk, user=request.user)
         
-        if not session.turns.exists():
+        if not session.turn_count:
             return Response({
                 'error': 'No conversation to analyze'
             }, status=status.HTTP_400_BAD_REQUEST)
         
         # Generate report using utility function
+        from .stats import session_report_stats
         from .utils import generate_session_report
-        report = generate_session_report(session)
+        stats = session_report_stats(session)
+        report = generate_session_report(session, stats)
         
-        return Response({'report': report})
+        return Response({'report': report, 'stats': stats})
 
 class InjectPromptView(APIView):
     permission_classes = [permissions.IsAuthenticated]
+    query_budget = 7
 
     def post(self, request, pk):
         session = get_object_or_404(Session, pk=pk, user=request.user)
         prompt = request.data.get('prompt', '')
+
+        blocker = conversation_blocker(session, prompt)
+        if blocker:
+            payload, status_code = blocker
+            return Response(payload, status=status_code)
         
-        if not prompt:
-            return Response({'error': 'Prompt is required'}, status=status.HTTP_400_BAD_REQUEST)
-        
-        if session.status != 'ACTIVE':
-            return Response({'error': 'Session is not active'}, status=status.HTTP_400_BAD_REQUEST)
-        
-        # Check if max turns reached
-        if session.turns.count() >= session.max_turns:
-            session.status = 'COMPLETED'
-            session.save()
-            return Response({'error': 'Max turns reached'}, status=status.HTTP_400_BAD_REQUEST)
-        
-        # Get all agents in the session
-        agents = session.agents.all()
-        if not agents:
-            return Response({'error': 'No agents in session'}, status=status.HTTP_400_BAD_REQUEST)
-        
-        # Continue conversation until conclusion or max turns
-        conversation_active = True
-        initial_prompt = prompt
-        
-        while conversation_active and session.turns.count() < session.max_turns:
-            # For each agent, generate a response
-            for agent in agents:
-                # Check turn limit
-                if session.turns.count() >= session.max_turns:
-                    session.status = 'COMPLETED'
-                    session.save()
-                    conversation_active = False
-                    break
-                
-                try:
-                    # Get API key for this agent's provider
-                    credential = Credential.objects.filter(user=request.user, provider=agent.provider).first()
-                    if not credential:
-                        return Response({
-                            'error': f'No API key found for {agent.provider}. Please add one in the Vault.'
-                        }, status=status.HTTP_400_BAD_REQUEST)
-                    
-                    api_key = credential.get_key()
-                    provider = ProviderFactory.get_provider(agent.provider)
-                    
-                    # Build conversation history
-                    conversation_context = ""
-                    for turn in session.turns.all():
-                        conversation_context += f"{turn.agent.name}: {turn.response}\n\n"
-                    
-                    # For the first turn, use the user's prompt
-                    # For subsequent turns, use the conversation context
-                    if session.turns.count() == 0:
-                        full_prompt = f"User: {initial_prompt}"
-                    else:
-                        full_prompt = conversation_context
-                    
-                    # Enhanced system message for autonomous conversation
-                    enhanced_system_message = f"""{agent.system_message}
-
-IMPORTANT INSTRUCTIONS FOR MULTI-AGENT CONVERSATION:
-- You are in a conversation with other agents: {', '.join([a.name for a in agents if a.id != agent.id])}
-- Respond naturally to the previous messages in the conversation
-- Build upon what others have said
-- If you feel the discussion has reached a natural conclusion, end your response with the phrase: "[CONVERSATION_CONCLUDED]"
-- If there's more to discuss, continue the dialogue
-- Be concise but meaningful in your responses
-"""
-                    
-                    # Generate response
-                    response_text = provider.generate_response(
-                        system_message=enhanced_system_message,
-                        prompt=full_prompt,
-                        api_key=api_key,
-                        model=agent.model
-                    )
-                    
-                    # Create turn
-                    Turn.objects.create(
-                        session=session,
-                        agent=agent,
-                        prompt=initial_prompt if session.turns.count() == 0 else "",
-                        response=response_text,
-                        token_count=0
-                    )
-                    
-                    # Check if agent concluded the conversation
-                    if "[CONVERSATION_CONCLUDED]" in response_text:
-                        conversation_active = False
-                        # Remove the marker from the response
-                        last_turn = session.turns.last()
-                        last_turn.response = response_text.replace("[CONVERSATION_CONCLUDED]", "").strip()
-                        last_turn.save()
-                        break
-                    
-                except Exception as e:
-                    return Response({
-                        'error': f'Failed to generate response from {agent.name}: {str(e)}'
-                    }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-            
-            # After one full round, check if we should continue
-            # If no agent concluded, continue for another round
-            if conversation_active and session.turns.count() < session.max_turns:
-                # Check if we've had at least 2 rounds (all agents spoke twice)
-                turns_per_agent = session.turns.count() / len(agents)
-                if turns_per_agent >= 3:  # After 3 rounds, stop automatically
-                    conversation_active = False
-        
-        # Refresh session data
-        session.refresh_from_db()
-        serializer = SessionSerializer(session)
-        return Response(serializer.data)
+        # The conversation loop runs in a `run_session_worker` process
+        try:
+            job = enqueue_job(session, prompt)
+        except SessionBusy as e:
+            return Response(e.payload, status=status.HTTP_409_CONFLICT)
+        return Response(OrchestrationJobSerializer(job).data, status=status.HTTP_202_ACCEPTED)
+
+class JobDetailView(generics.RetrieveAPIView):
+    serializer_class = OrchestrationJobSerializer
+    permission_classes = [permissions.IsAuthenticated]
+    lookup_url_kwarg = 'job_id'
+    query_budget = 3
+
+    def get_queryset(self):
+        return OrchestrationJob.objects.filter(session_id=self.kwargs['pk'], session__user=self.request.user)
+
+class StreamConversationView(APIView):
+    """
+    Runs the conversation inside the request and streams it as Server-Sent
+    Events: ``turn_start``, ``token``, ``turn_end``, ``concluded``,
+    ``error`` and a final ``done``.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    # Covers the checks before streaming starts; the conversation itself runs in the body
+    query_budget = 7
+
+    def post(self, request, pk):
+        from django.http import StreamingHttpResponse
+
+        session = get_object_or_404(Session, pk=pk, user=request.user)
+        prompt = request.data.get('prompt', '')
+
+        blocker = conversation_blocker(session, prompt)
+        if blocker:
+            payload, status_code = blocker
+            return Response(payload, status=status_code)
+
+        try:
+            job = start_inline_job(session, prompt, worker_id=f"stream:{default_worker_id()}")
+        except SessionBusy as e:
+            return Response(e.payload, status=status.HTTP_409_CONFLICT)
+        response = StreamingHttpResponse(self.event_stream(session, job), content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+    def event_stream(self, session, job):
+        job_status, error = 'FAILED', 'Stream closed before the conversation finished'
+        try:
+            for event, data in iter_conversation(session, job.prompt, stream=True):
+                if event == 'turn_end':
+                    extend_lease(job)
+                yield format_event(event, event_payload(event, data))
+            job_status, error = 'SUCCEEDED', ''
+        except OrchestrationError as e:
+            error = str(e)
+        except Exception as e:
+            error = f'Unexpected error: {str(e)}'
+        finally:
+            # Also runs when the client disconnects and the generator is closed
+            finish_job(job, job_status, error)
+
+        if error:
+            yield format_event('error', {'error': error})
+        yield format_event('done', {'job': job.id, 'status': job.status})
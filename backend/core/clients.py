@@ -0,0 +1,101 @@
+import asyncio
+import hashlib
+import threading
+import time
+import weakref
+from collections import OrderedDict
+
+from django.conf import settings
+
+
+def key_fingerprint(api_key):
+    # Pool keys never hold the raw secret
+    return hashlib.sha256(api_key.encode()).hexdigest()[:16]
+
+
+class ClientPool:
+    """
+    Process-wide pool of provider SDK clients keyed by provider, client kind
+    and API key, so that every turn of a session reuses the same HTTP/gRPC
+    connections instead of rebuilding a client (and its TLS session).
+
+    Entries are evicted least-recently-used beyond ``max_size`` and after
+    ``ttl`` seconds. Async clients are kept in a separate pool for each
+    event loop, since their connections cannot be shared across loops; the
+    pool is held weakly by the loop, so it goes away with the loop.
+    """
+
+    def __init__(self, max_size=64, ttl=900):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._clients = OrderedDict()
+        self._loop_clients = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+
+    def _pool(self, kind):
+        if not kind.startswith('async'):
+            return self._clients
+        return self._loop_clients.setdefault(asyncio.get_running_loop(), OrderedDict())
+
+    def _pools(self):
+        return [self._clients, *self._loop_clients.values()]
+
+    def get(self, provider, kind, api_key, factory):
+        pool_key = (provider, kind, key_fingerprint(api_key))
+
+        now = time.monotonic()
+        with self._lock:
+            clients = self._pool(kind)
+            entry = clients.get(pool_key)
+            if entry and now - entry[1] < self.ttl:
+                clients.move_to_end(pool_key)
+                return entry[0]
+
+            expired = [entry[0]] if entry else []
+            client = factory()
+            clients[pool_key] = (client, now)
+            clients.move_to_end(pool_key)
+            while len(clients) > self.max_size:
+                expired.append(clients.popitem(last=False)[1][0])
+
+        for old in expired:
+            _close(old)
+        return client
+
+    def evict(self, api_key):
+        fingerprint = key_fingerprint(api_key)
+        clients = []
+        with self._lock:
+            for pool in self._pools():
+                stale = [k for k in pool if k[2] == fingerprint]
+                clients += [pool.pop(k)[0] for k in stale]
+        for client in clients:
+            _close(client)
+
+    def clear(self):
+        with self._lock:
+            clients = [entry[0] for pool in self._pools() for entry in pool.values()]
+            self._clients.clear()
+            self._loop_clients.clear()
+        for client in clients:
+            _close(client)
+
+    def __len__(self):
+        return sum(len(pool) for pool in self._pools())
+
+
+def _close(client):
+    # Sync clients release their connections; async ones are left to their loop
+    close = getattr(client, 'close', None)
+    if close is None or asyncio.iscoroutinefunction(close):
+        return
+    try:
+        close()
+    except Exception:
+        pass
+
+
+client_pool = ClientPool(
+    max_size=getattr(settings, 'LLM_CLIENT_POOL_SIZE', 64),
+    ttl=getattr(settings, 'LLM_CLIENT_TTL', 900),
+)
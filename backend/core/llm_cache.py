@@ -0,0 +1,372 @@
+"""
+Content-addressed cache for provider responses.
+
+Responses are keyed on a hash of (provider, model, system message,
+prompt), so repeating an identical request - regenerating a summary of an
+unchanged session, replaying a templated debate - is served locally instead
+of calling the provider again. Providers are called with their default
+sampling settings, so nothing else changes the output. A hit costs no
+tokens and reports zero usage. Workers log each process's hits, misses
+and evictions with log_stats.
+"""
+import abc
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.utils import timezone
+
+from .providers import LLMProvider
+from .usage import Completion, Usage
+
+logger = logging.getLogger(__name__)
+
+def response_cache_key(provider_name, model, system_message, prompt):
+    payload = json.dumps(
+        [provider_name, model, system_message, prompt],
+        sort_keys=True, ensure_ascii=False
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class CacheBackend(abc.ABC):
+    def __init__(self, ttl=86400, max_entries=1000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        value = self._get(key)
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+
+    def set(self, key, value):
+        evicted = self._set(key, value)
+        if evicted:
+            with self._lock:
+                self.evictions += evicted
+
+    def stats(self):
+        return {
+            'backend': type(self).__name__,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'entries': self.size(),
+        }
+
+    @abc.abstractmethod
+    def _get(self, key):
+        pass
+
+    @abc.abstractmethod
+    def _set(self, key, value):
+        # Returns how many entries were evicted to make room
+        pass
+
+    @abc.abstractmethod
+    def size(self):
+        pass
+
+    @abc.abstractmethod
+    def clear(self):
+        pass
+
+
+class MemoryBackend(CacheBackend):
+    """
+    Per-process LRU.
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._entries = OrderedDict()
+
+    def _get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[1] < time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def _set(self, key, value):
+        evicted = 0
+        with self._lock:
+            self._entries[key] = (value, time.time() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                evicted += 1
+        return evicted
+
+    def size(self):
+        return len(self._entries)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class FileBackend(CacheBackend):
+    """
+    One JSON file per entry under ``location``, shared by every process on
+    the host. A file's mtime records its last use; the least recently used
+    files are removed once ``max_entries`` is exceeded.
+    """
+
+    def __init__(self, location, **kwargs):
+        super().__init__(**kwargs)
+        self.location = str(location)
+        os.makedirs(self.location, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.location, f"{key}.json")
+
+    def _get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, encoding='utf-8') as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if entry['expires'] < time.time():
+            self._remove(path)
+            return None
+        os.utime(path)
+        return entry['value']
+
+    def _set(self, key, value):
+        # Write to a temporary file and rename so readers never see partial entries
+        fd, tmp_path = tempfile.mkstemp(dir=self.location, suffix='.tmp')
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump({'value': value, 'expires': time.time() + self.ttl}, f)
+        os.replace(tmp_path, self._path(key))
+        return self._evict()
+
+    def _entries(self):
+        with os.scandir(self.location) as it:
+            return [entry for entry in it if entry.name.endswith('.json')]
+
+    def _evict(self):
+        entries = self._entries()
+        overflow = len(entries) - self.max_entries
+        if overflow <= 0:
+            return 0
+        entries.sort(key=lambda entry: entry.stat().st_mtime)
+        for entry in entries[:overflow]:
+            self._remove(entry.path)
+        return overflow
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def size(self):
+        return len(self._entries())
+
+    def clear(self):
+        for entry in self._entries():
+            self._remove(entry.path)
+
+
+class DatabaseBackend(CacheBackend):
+    """
+    Entries in the ``CachedResponse`` table, shared by every process using
+    the database. Expired and least recently used entries are evicted when
+    the writes of this process have used up the room the last eviction left,
+    so the table may run over ``max_entries`` by what other processes wrote
+    since, until their own next eviction.
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        # Entries this process may still add before counting the table again
+        self._room = 0
+
+    def _get(self, key):
+        from .models import CachedResponse
+
+        entry = CachedResponse.objects.filter(key=key).only('response', 'expires_at').first()
+        if entry is None:
+            return None
+        if entry.expires_at < timezone.now():
+            entry.delete()
+            return None
+        CachedResponse.objects.filter(key=key).update(last_used_at=timezone.now())
+        return entry.response
+
+    def _set(self, key, value):
+        from .models import CachedResponse
+
+        now = timezone.now()
+        _, created = CachedResponse.objects.update_or_create(key=key, defaults={
+            'response': value,
+            'expires_at': now + timedelta(seconds=self.ttl),
+            'last_used_at': now,
+        })
+        with self._lock:
+            if created:
+                self._room -= 1
+            if self._room >= 0:
+                return 0
+        return self._evict(now)
+
+    def _evict(self, now):
+        from .models import CachedResponse
+
+        evicted, _ = CachedResponse.objects.filter(expires_at__lt=now).delete()
+        overflow = CachedResponse.objects.count() - self.max_entries
+        if overflow > 0:
+            stale = CachedResponse.objects.order_by('last_used_at').values_list('key', flat=True)[:overflow]
+            evicted += CachedResponse.objects.filter(key__in=list(stale)).delete()[0]
+        with self._lock:
+            self._room = max(-overflow, 0)
+        return evicted
+
+    def size(self):
+        from .models import CachedResponse
+
+        return CachedResponse.objects.count()
+
+    def clear(self):
+        from .models import CachedResponse
+
+        CachedResponse.objects.all().delete()
+        with self._lock:
+            self._room = 0
+
+
+BACKENDS = {
+    'memory': MemoryBackend,
+    'file': FileBackend,
+    'db': DatabaseBackend,
+}
+
+_response_cache = None
+_response_cache_lock = threading.Lock()
+
+
+def get_response_cache():
+    """
+    Returns the process-wide backend configured by LLM_RESPONSE_CACHE, or
+    None when caching is disabled.
+    """
+    global _response_cache
+    config = getattr(settings, 'LLM_RESPONSE_CACHE', {})
+    name = config.get('BACKEND', 'memory')
+    if name in (None, '', 'none'):
+        return None
+    with _response_cache_lock:
+        if _response_cache is None:
+            kwargs = {'ttl': config.get('TTL', 86400), 'max_entries': config.get('MAX_ENTRIES', 1000)}
+            if name == 'file':
+                kwargs['location'] = config['LOCATION']
+            _response_cache = BACKENDS[name](**kwargs)
+    return _response_cache
+
+
+def log_stats(cache=None):
+    """
+    Logs the hits, misses and evictions of the response cache in this
+    process since it started. The entry count isn't logged, as it may take
+    a query.
+    """
+    cache = cache or get_response_cache()
+    if cache is not None and (cache.hits or cache.misses):
+        logger.info(
+            '%s: %d hits, %d misses, %d evictions',
+            type(cache).__name__, cache.hits, cache.misses, cache.evictions,
+        )
+
+
+class CachedProvider(LLMProvider):
+    """
+    Wraps a provider so identical requests are answered from the cache.
+    Only wrap agents whose output is meant to be deterministic.
+    """
+
+    def __init__(self, provider, provider_name, cache):
+        self.provider = provider
+        self.provider_name = provider_name
+        self.cache = cache
+
+    def _key(self, system_message, prompt, model):
+        return response_cache_key(self.provider_name, model, system_message, prompt)
+
+    def generate_response(self, system_message, prompt, api_key, model):
+        return self.complete(system_message, prompt, api_key, model).text
+
+    def complete(self, system_message, prompt, api_key, model):
+        key = self._key(system_message, prompt, model)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return Completion(cached, Usage())
+        completion = self.provider.complete(system_message, prompt, api_key, model)
+        self.cache.set(key, completion.text)
+        return completion
+
+    def stream_response(self, system_message, prompt, api_key, model, usage=None):
+        key = self._key(system_message, prompt, model)
+        cached = self.cache.get(key)
+        if cached is not None:
+            yield cached
+            return
+        chunks = []
+        for chunk in self.provider.stream_response(system_message, prompt, api_key, model, usage=usage):
+            chunks.append(chunk)
+            yield chunk
+        self.cache.set(key, "".join(chunks))
+
+    async def acomplete(self, system_message, prompt, api_key, model):
+        key = self._key(system_message, prompt, model)
+        cached = await sync_to_async(self.cache.get)(key)
+        if cached is not None:
+            return Completion(cached, Usage())
+        completion = await self.provider.acomplete(system_message, prompt, api_key, model)
+        await sync_to_async(self.cache.set)(key, completion.text)
+        return completion
+
+    async def astream_response(self, system_message, prompt, api_key, model, usage=None):
+        key = self._key(system_message, prompt, model)
+        cached = await sync_to_async(self.cache.get)(key)
+        if cached is not None:
+            yield cached
+            return
+        chunks = []
+        async for chunk in self.provider.astream_response(system_message, prompt, api_key, model, usage=usage):
+            chunks.append(chunk)
+            yield chunk
+        await sync_to_async(self.cache.set)(key, "".join(chunks))
+
+
+def cached_provider(provider, provider_name):
+    """
+    Returns ``provider`` wrapped in the configured response cache, or
+    unchanged when caching is disabled.
+    """
+    cache = get_response_cache()
+    if cache is None:
+        return provider
+    return CachedProvider(provider, provider_name, cache)
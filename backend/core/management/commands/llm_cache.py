@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from core.llm_cache import get_response_cache
+
+
+class Command(BaseCommand):
+    help = 'Shows or clears the LLM response cache'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clear', action='store_true', help='Remove every cached response')
+
+    def handle(self, *args, **options):
+        cache = get_response_cache()
+        if cache is None:
+            self.stdout.write('LLM response cache is disabled')
+            return
+        if options['clear']:
+            cache.clear()
+            self.stdout.write('LLM response cache cleared')
+        # Hit/miss counters are per process, so only entry counts are meaningful here
+        stats = cache.stats()
+        self.stdout.write(f"{stats['backend']}: {stats['entries']} entries")
@@ -1,3 +1,12 @@
 from django.db import models
 
-# Create your models here.
+class CachedResponse(models.Model):
+    # sha256 of (provider, model, system message, prompt), see llm_cache.py
+    key = models.CharField(max_length=64, primary_key=True)
+    response = models.TextField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    last_used_at = models.DateTimeField(db_index=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return f"CachedResponse {self.key[:12]}"
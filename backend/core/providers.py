@@ -1,44 +1,217 @@
 import abc
+import asyncio
 import openai
 import google.generativeai as genai
+from google.ai import generativelanguage as glm
 from django.conf import settings
+from .clients import client_pool
+from .usage import Completion, Usage, estimate_usage
 
 class LLMProvider(abc.ABC):
     @abc.abstractmethod
     def generate_response(self, system_message, prompt, api_key, model):
         pass
 
+    def complete(self, system_message, prompt, api_key, model):
+        # Providers that don't report usage get a local token count
+        text = self.generate_response(system_message, prompt, api_key, model)
+        return Completion(text, estimate_usage(system_message, prompt, text))
+
+    def stream_response(self, system_message, prompt, api_key, model, usage=None):
+        # Providers without native streaming yield the whole response at once.
+        # When a Usage is passed in, it is filled once the stream ends.
+        completion = self.complete(system_message, prompt, api_key, model)
+        if usage is not None:
+            usage.update(completion.usage)
+        yield completion.text
+
+    async def agenerate_response(self, system_message, prompt, api_key, model):
+        return (await self.acomplete(system_message, prompt, api_key, model)).text
+
+    async def acomplete(self, system_message, prompt, api_key, model):
+        # Providers without an async client run the blocking call in a thread
+        return await asyncio.to_thread(self.complete, system_message, prompt, api_key, model)
+
+    async def astream_response(self, system_message, prompt, api_key, model, usage=None):
+        completion = await self.acomplete(system_message, prompt, api_key, model)
+        if usage is not None:
+            usage.update(completion.usage)
+        yield completion.text
+
 class OpenAIProvider(LLMProvider):
+    # Retries are left to RateLimitedProvider (see ratelimit.py), which backs
+    # off on the shared bucket; the SDK's own retries would multiply them
+    @staticmethod
+    def _client(api_key):
+        return client_pool.get('OPENAI', 'sync', api_key, lambda: openai.OpenAI(api_key=api_key, max_retries=0))
+
+    @staticmethod
+    def _async_client(api_key):
+        return client_pool.get('OPENAI', 'async', api_key, lambda: openai.AsyncOpenAI(api_key=api_key, max_retries=0))
+
+    @staticmethod
+    def _messages(system_message, prompt):
+        return [
+            {"role": "system", "content": system_message},
+            {"role": "user", "content": prompt}
+        ]
+
+    @staticmethod
+    def _completion(response, system_message, prompt):
+        text = response.choices[0].message.content
+        if response.usage is None:
+            return Completion(text, estimate_usage(system_message, prompt, text))
+        return Completion(text, Usage(response.usage.prompt_tokens, response.usage.completion_tokens))
+
     def generate_response(self, system_message, prompt, api_key, model):
-        client = openai.OpenAI(api_key=api_key)
+        return self.complete(system_message, prompt, api_key, model).text
+
+    def complete(self, system_message, prompt, api_key, model):
+        client = self._client(api_key)
         response = client.chat.completions.create(
             model=model,
-            messages=[
-                {"role": "system", "content": system_message},
-                {"role": "user", "content": prompt}
-            ]
+            messages=self._messages(system_message, prompt)
+        )
+        return self._completion(response, system_message, prompt)
+
+    def stream_response(self, system_message, prompt, api_key, model, usage=None):
+        client = self._client(api_key)
+        stream = client.chat.completions.create(
+            model=model,
+            messages=self._messages(system_message, prompt),
+            stream=True,
+            stream_options={"include_usage": True}
+        )
+        for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+            # The final chunk carries usage and no choices
+            if chunk.usage is not None and usage is not None:
+                usage.update(Usage(chunk.usage.prompt_tokens, chunk.usage.completion_tokens))
+
+    async def acomplete(self, system_message, prompt, api_key, model):
+        client = self._async_client(api_key)
+        response = await client.chat.completions.create(
+            model=model,
+            messages=self._messages(system_message, prompt)
+        )
+        return self._completion(response, system_message, prompt)
+
+    async def astream_response(self, system_message, prompt, api_key, model, usage=None):
+        client = self._async_client(api_key)
+        stream = await client.chat.completions.create(
+            model=model,
+            messages=self._messages(system_message, prompt),
+            stream=True,
+            stream_options={"include_usage": True}
         )
-        return response.choices[0].message.content
+        async for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+            if chunk.usage is not None and usage is not None:
+                usage.update(Usage(chunk.usage.prompt_tokens, chunk.usage.completion_tokens))
 
 class GeminiProvider(LLMProvider):
-    def generate_response(self, system_message, prompt, api_key, model):
-        genai.configure(api_key=api_key)
+    @staticmethod
+    def _model(api_key, model):
+        # genai.configure() is process-global, so two users' keys would race.
+        # Give each model its own pooled client for this key instead.
+        model_instance = genai.GenerativeModel(model)
+        model_instance._client = client_pool.get(
+            'GEMINI', 'sync', api_key,
+            lambda: glm.GenerativeServiceClient(client_options={'api_key': api_key})
+        )
+        return model_instance
+
+    @staticmethod
+    def _async_model(api_key, model):
         model_instance = genai.GenerativeModel(model)
+        model_instance._async_client = client_pool.get(
+            'GEMINI', 'async', api_key,
+            lambda: glm.GenerativeServiceAsyncClient(client_options={'api_key': api_key})
+        )
+        return model_instance
+
+    @staticmethod
+    def _prompt(system_message, prompt):
         # Gemini doesn't have a direct "system" role in the same way, usually prepended
-        full_prompt = f"System: {system_message}\nUser: {prompt}"
-        response = model_instance.generate_content(full_prompt)
-        return response.text
+        return f"System: {system_message}\nUser: {prompt}"
+
+    @staticmethod
+    def _usage(response):
+        metadata = getattr(response, 'usage_metadata', None)
+        if not metadata or not metadata.prompt_token_count:
+            return None
+        return Usage(metadata.prompt_token_count, metadata.candidates_token_count)
+
+    def _completion(self, response, system_message, prompt):
+        text = response.text
+        return Completion(text, self._usage(response) or estimate_usage(system_message, prompt, text))
+
+    def generate_response(self, system_message, prompt, api_key, model):
+        return self.complete(system_message, prompt, api_key, model).text
+
+    def complete(self, system_message, prompt, api_key, model):
+        model_instance = self._model(api_key, model)
+        response = model_instance.generate_content(self._prompt(system_message, prompt))
+        return self._completion(response, system_message, prompt)
+
+    def stream_response(self, system_message, prompt, api_key, model, usage=None):
+        model_instance = self._model(api_key, model)
+        for chunk in model_instance.generate_content(self._prompt(system_message, prompt), stream=True):
+            if chunk.text:
+                yield chunk.text
+            # Each chunk reports the running totals
+            chunk_usage = self._usage(chunk)
+            if chunk_usage and usage is not None:
+                usage.update(chunk_usage)
+
+    async def acomplete(self, system_message, prompt, api_key, model):
+        model_instance = self._async_model(api_key, model)
+        response = await model_instance.generate_content_async(self._prompt(system_message, prompt))
+        return self._completion(response, system_message, prompt)
+
+    async def astream_response(self, system_message, prompt, api_key, model, usage=None):
+        model_instance = self._async_model(api_key, model)
+        stream = await model_instance.generate_content_async(self._prompt(system_message, prompt), stream=True)
+        async for chunk in stream:
+            if chunk.text:
+                yield chunk.text
+            chunk_usage = self._usage(chunk)
+            if chunk_usage and usage is not None:
+                usage.update(chunk_usage)
 
 class MockProvider(LLMProvider):
     def generate_response(self, system_message, prompt, api_key, model):
         return f"Mock response to: {prompt} (Model: {model})"
 
+    def stream_response(self, system_message, prompt, api_key, model, usage=None):
+        text = self.generate_response(system_message, prompt, api_key, model)
+        words = text.split(" ")
+        for i, word in enumerate(words):
+            yield word if i == len(words) - 1 else word + " "
+        if usage is not None:
+            usage.update(estimate_usage(system_message, prompt, text))
+
+    async def acomplete(self, system_message, prompt, api_key, model):
+        return self.complete(system_message, prompt, api_key, model)
+
+    async def astream_response(self, system_message, prompt, api_key, model, usage=None):
+        for chunk in self.stream_response(system_message, prompt, api_key, model, usage=usage):
+            yield chunk
+
 class ProviderFactory:
+    # Providers are stateless (clients live in the pool), so one instance each is shared
+    _instances = {}
+
     @staticmethod
     def get_provider(provider_name):
         if provider_name == 'OPENAI':
-            return OpenAIProvider()
+            provider_class = OpenAIProvider
         elif provider_name == 'GEMINI':
-            return GeminiProvider()
+            provider_class = GeminiProvider
         else:
-            return MockProvider()
+            provider_class = MockProvider
+        if provider_class not in ProviderFactory._instances:
+            ProviderFactory._instances[provider_class] = provider_class()
+        return ProviderFactory._instances[provider_class]
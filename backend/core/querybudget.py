@@ -0,0 +1,102 @@
+"""
+Per-request query budgets.
+
+A view declares the most queries one request may issue with a
+``query_budget`` class attribute (views without one get
+QUERY_BUDGET_DEFAULT). A view whose writes are batched by size can raise the
+budget of one request by the extra batches with extend_query_budget.
+QueryBudgetMiddleware counts the queries each request
+runs and logs the ones that go over budget; with QUERY_BUDGET_STRICT on, as
+in tests, an over-budget request raises instead.
+
+Only queries run while the view builds its response are counted. The body
+of a streaming response is produced after the middleware returns, and async
+views run their queries on other threads, so neither is covered.
+"""
+import logging
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import connection
+
+logger = logging.getLogger(__name__)
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+class QueryCounter:
+    """
+    Database execute wrapper that counts queries and keeps their SQL.
+    """
+
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        self.queries.append(sql)
+        return execute(sql, params, many, context)
+
+    def __len__(self):
+        return len(self.queries)
+
+
+def _over_budget_message(label, count, budget, queries):
+    listing = "\n".join(f"  {i}. {sql}" for i, sql in enumerate(queries, 1))
+    return f"{label} ran {count} queries, budget is {budget}:\n{listing}"
+
+
+@contextmanager
+def query_budget(budget, label='Block'):
+    """
+    Fails with QueryBudgetExceeded if the block runs more than ``budget``
+    queries. Unlike assertNumQueries this is an upper bound, so it doesn't
+    break when a query is optimised away::
+
+        with query_budget(4):
+            client.get(f'/api/sessions/{session.id}/')
+    """
+    counter = QueryCounter()
+    with connection.execute_wrapper(counter):
+        yield counter
+    if len(counter) > budget:
+        raise QueryBudgetExceeded(_over_budget_message(label, len(counter), budget, counter.queries))
+
+
+def extend_query_budget(request, queries):
+    """Lets ``request`` run ``queries`` more queries than its view's budget."""
+    # DRF requests wrap the HttpRequest the middleware sees
+    request = getattr(request, '_request', request)
+    request.query_budget_extra = getattr(request, 'query_budget_extra', 0) + queries
+
+
+def view_query_budget(request):
+    match = getattr(request, 'resolver_match', None)
+    view_class = getattr(getattr(match, 'func', None), 'view_class', None)
+    budget = getattr(view_class, 'query_budget', None)
+    if budget is None:
+        budget = getattr(settings, 'QUERY_BUDGET_DEFAULT', None)
+    if budget is not None:
+        budget += getattr(request, 'query_budget_extra', 0)
+    return budget
+
+
+class QueryBudgetMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        counter = QueryCounter()
+        with connection.execute_wrapper(counter):
+            response = self.get_response(request)
+
+        budget = view_query_budget(request)
+        if settings.DEBUG:
+            response['X-Query-Count'] = str(len(counter))
+        if budget is not None and len(counter) > budget:
+            label = f"{request.method} {request.path}"
+            if getattr(settings, 'QUERY_BUDGET_STRICT', False):
+                raise QueryBudgetExceeded(_over_budget_message(label, len(counter), budget, counter.queries))
+            logger.warning('%s ran %d queries, budget is %d', label, len(counter), budget)
+        return response
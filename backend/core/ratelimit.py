@@ -0,0 +1,371 @@
+"""
+Per-key request scheduling for provider calls.
+
+Every (provider, API key) pair gets a token bucket sized from
+LLM_RATE_LIMITS. Calls reserve a slot before hitting the provider, so
+concurrent conversations sharing a key queue up instead of tripping the
+provider's limit. Transient failures (429, 5xx, timeouts, dropped
+connections) are retried with jittered exponential backoff, and a 429
+pauses the whole bucket for the Retry-After period.
+
+Wherever an API key is expected, a key pool (vault.keypool.KeyPool) may be
+passed instead. A key is then acquired for every attempt, and a key that is
+rate limited or rejected fails over to another healthy key without waiting.
+"""
+import asyncio
+import logging
+import random
+import threading
+import time
+
+import openai
+from google.api_core import exceptions as google_exceptions
+from django.conf import settings
+
+from .clients import key_fingerprint
+from .providers import LLMProvider
+
+logger = logging.getLogger(__name__)
+
+TRANSIENT_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+
+TRANSIENT_ERRORS = (
+    openai.APIConnectionError,  # includes APITimeoutError
+    openai.RateLimitError,
+    openai.InternalServerError,
+    google_exceptions.TooManyRequests,
+    google_exceptions.ResourceExhausted,
+    google_exceptions.ServiceUnavailable,
+    google_exceptions.InternalServerError,
+    google_exceptions.DeadlineExceeded,
+    TimeoutError,
+    ConnectionError,
+)
+
+
+def is_transient(error):
+    if isinstance(error, TRANSIENT_ERRORS):
+        return True
+    return getattr(error, 'status_code', None) in TRANSIENT_STATUS_CODES
+
+
+def is_rate_limited(error):
+    return (
+        isinstance(error, (openai.RateLimitError, google_exceptions.TooManyRequests, google_exceptions.ResourceExhausted))
+        or getattr(error, 'status_code', None) == 429
+    )
+
+
+def is_auth_error(error):
+    return (
+        isinstance(error, (openai.AuthenticationError, openai.PermissionDeniedError,
+                           google_exceptions.Unauthenticated, google_exceptions.PermissionDenied))
+        or getattr(error, 'status_code', None) in (401, 403)
+    )
+
+
+def retry_after(error):
+    """
+    Seconds the provider asked us to wait, if it said so.
+    """
+    response = getattr(error, 'response', None)
+    headers = getattr(response, 'headers', None) or {}
+    value = headers.get('retry-after-ms')
+    if value:
+        try:
+            return float(value) / 1000
+        except ValueError:
+            pass
+    value = headers.get('retry-after')
+    if value:
+        try:
+            return float(value)
+        except ValueError:
+            pass
+    return None
+
+
+class TokenBucket:
+    """
+    Classic token bucket that hands out reservations: a caller takes a
+    token immediately (the balance may go negative) and is told how long to
+    wait before using it, which keeps waiters in FIFO order. A ``rate`` of
+    None never throttles but still honours pauses after a 429.
+    """
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.lock = threading.Lock()
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.calls = 0
+        self.retries = 0
+        self.throttled = 0
+
+    def reserve(self):
+        with self.lock:
+            now = time.monotonic()
+            if self.rate is None:
+                # Unlimited key: only a provider-requested pause applies
+                wait = max(0.0, self.paused_until - now)
+            else:
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                self.tokens -= 1
+                wait = max(0.0, -self.tokens / self.rate, self.paused_until - now)
+            self.calls += 1
+            self.total_wait += wait
+            self.max_wait = max(self.max_wait, wait)
+            return wait
+
+    def pause(self, seconds):
+        # A 429 means the provider's window is exhausted for every caller on this key
+        with self.lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+            self.throttled += 1
+
+    def stats(self):
+        with self.lock:
+            return {
+                'calls': self.calls,
+                'retries': self.retries,
+                'throttled': self.throttled,
+                'avg_wait': self.total_wait / self.calls if self.calls else 0.0,
+                'max_wait': self.max_wait,
+            }
+
+
+class RateLimiter:
+    def __init__(self, limits=None, max_retries=4, base_delay=1.0, max_delay=30.0):
+        self.limits = limits or {}
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def bucket(self, provider_name, api_key):
+        bucket_key = (provider_name, key_fingerprint(api_key))
+        with self._lock:
+            if bucket_key not in self._buckets:
+                limit = self.limits.get(provider_name) or self.limits.get('default') or {}
+                self._buckets[bucket_key] = TokenBucket(limit.get('rate'), limit.get('burst', 1))
+            return self._buckets[bucket_key]
+
+    def backoff(self, attempt, error):
+        # Full jitter, unless the provider told us exactly how long to wait
+        delay = retry_after(error)
+        if delay is None:
+            delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        return delay
+
+    def _on_error(self, bucket, provider_name, attempt, error):
+        if attempt >= self.max_retries or not is_transient(error):
+            return None
+        delay = self.backoff(attempt, error)
+        if is_rate_limited(error):
+            bucket.pause(delay)
+        with bucket.lock:
+            bucket.retries += 1
+        logger.warning('%s call failed (%s), retry %d in %.1fs', provider_name, type(error).__name__, attempt + 1, delay)
+        return delay
+
+    def _log_wait(self, provider_name, wait):
+        if wait > 0:
+            logger.info('%s call queued for %.2fs by the rate limiter', provider_name, wait)
+
+    @staticmethod
+    def _acquire(api_key):
+        # A key pool hands out one of its keys per attempt
+        if hasattr(api_key, 'acquire'):
+            pooled = api_key.acquire()
+            return pooled, pooled.api_key
+        return None, api_key
+
+    def _failover(self, bucket, provider_name, keys, pooled, attempt, error):
+        """
+        Releases a pooled key after an error. Returns True when the call
+        should be retried straight away on another key.
+        """
+        if pooled is None:
+            return False
+        keys.release(pooled, error)
+        if attempt >= self.max_retries or not (is_rate_limited(error) or is_auth_error(error)):
+            return False
+        if not keys.has_alternative(pooled):
+            return False
+        if is_rate_limited(error):
+            bucket.pause(self.backoff(attempt, error))
+        logger.warning('%s key rejected (%s), failing over to another key', provider_name, type(error).__name__)
+        return True
+
+    @staticmethod
+    def _result(api_key, pooled, result, hold_key):
+        if not hold_key:
+            if pooled is not None:
+                api_key.release(pooled)
+            return result
+
+        def release(error=None):
+            if pooled is not None:
+                api_key.release(pooled, error)
+        return result, release
+
+    def call(self, provider_name, api_key, fn, hold_key=False):
+        """
+        Calls ``fn(key)`` once a slot is free, retrying transient failures.
+
+        With ``hold_key`` a pooled key stays in flight after ``fn`` returns
+        and ``(result, release)`` is returned; call ``release(error=None)``
+        once the result is used up, such as a stream.
+        """
+        attempt = 0
+        while True:
+            pooled, key = self._acquire(api_key)
+            bucket = self.bucket(provider_name, key)
+            wait = bucket.reserve()
+            self._log_wait(provider_name, wait)
+            time.sleep(wait)
+            try:
+                result = fn(key)
+            except Exception as e:
+                if self._failover(bucket, provider_name, api_key, pooled, attempt, e):
+                    attempt += 1
+                    continue
+                delay = self._on_error(bucket, provider_name, attempt, e)
+                if delay is None:
+                    raise
+                time.sleep(delay)
+                attempt += 1
+            except BaseException as e:
+                # Cancelled mid-call: the key is fine, just no longer in flight
+                if pooled is not None:
+                    api_key.release(pooled, e)
+                raise
+            else:
+                return self._result(api_key, pooled, result, hold_key)
+
+    async def acall(self, provider_name, api_key, fn, hold_key=False):
+        attempt = 0
+        while True:
+            pooled, key = self._acquire(api_key)
+            bucket = self.bucket(provider_name, key)
+            wait = bucket.reserve()
+            self._log_wait(provider_name, wait)
+            await asyncio.sleep(wait)
+            try:
+                result = await fn(key)
+            except Exception as e:
+                if self._failover(bucket, provider_name, api_key, pooled, attempt, e):
+                    attempt += 1
+                    continue
+                delay = self._on_error(bucket, provider_name, attempt, e)
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+                attempt += 1
+            except BaseException as e:
+                # Cancelled mid-call: the key is fine, just no longer in flight
+                if pooled is not None:
+                    api_key.release(pooled, e)
+                raise
+            else:
+                return self._result(api_key, pooled, result, hold_key)
+
+    def stats(self):
+        with self._lock:
+            buckets = dict(self._buckets)
+        return {f"{provider}:{fingerprint}": bucket.stats() for (provider, fingerprint), bucket in buckets.items()}
+
+
+rate_limiter = RateLimiter(
+    limits=getattr(settings, 'LLM_RATE_LIMITS', {}),
+    max_retries=getattr(settings, 'LLM_MAX_RETRIES', 4),
+)
+
+
+def log_stats(limiter=None):
+    """
+    Logs the counters of every bucket that has taken a call. They cover
+    this process since it started.
+    """
+    for bucket, stats in sorted((limiter or rate_limiter).stats().items()):
+        if stats['calls']:
+            logger.info(
+                '%s: %d calls, %d retries, %d throttled, wait avg %.2fs max %.2fs',
+                bucket, stats['calls'], stats['retries'], stats['throttled'], stats['avg_wait'], stats['max_wait'],
+            )
+
+
+class RateLimitedProvider(LLMProvider):
+    """
+    Schedules a provider's calls through the rate limiter. Streams are only
+    retried if they fail before the first chunk arrives, and hold their
+    pooled key until they end.
+    """
+
+    def __init__(self, provider, provider_name, limiter=None):
+        self.provider = provider
+        self.provider_name = provider_name
+        self.limiter = limiter or rate_limiter
+
+    def generate_response(self, system_message, prompt, api_key, model):
+        return self.complete(system_message, prompt, api_key, model).text
+
+    def complete(self, system_message, prompt, api_key, model):
+        return self.limiter.call(
+            self.provider_name, api_key,
+            lambda key: self.provider.complete(system_message, prompt, key, model)
+        )
+
+    def stream_response(self, system_message, prompt, api_key, model, usage=None):
+        def first_chunk(key):
+            stream = self.provider.stream_response(system_message, prompt, key, model, usage=usage)
+            return stream, next(stream, None)
+
+        (stream, chunk), release = self.limiter.call(self.provider_name, api_key, first_chunk, hold_key=True)
+        error = None
+        try:
+            if chunk is not None:
+                yield chunk
+                yield from stream
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            release(error)
+
+    async def acomplete(self, system_message, prompt, api_key, model):
+        return await self.limiter.acall(
+            self.provider_name, api_key,
+            lambda key: self.provider.acomplete(system_message, prompt, key, model)
+        )
+
+    async def astream_response(self, system_message, prompt, api_key, model, usage=None):
+        async def first_chunk(key):
+            stream = self.provider.astream_response(system_message, prompt, key, model, usage=usage)
+            try:
+                return stream, await stream.__anext__()
+            except StopAsyncIteration:
+                return stream, None
+
+        (stream, chunk), release = await self.limiter.acall(self.provider_name, api_key, first_chunk, hold_key=True)
+        error = None
+        try:
+            if chunk is not None:
+                yield chunk
+                async for chunk in stream:
+                    yield chunk
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            release(error)
+
+
+def rate_limited_provider(provider, provider_name):
+    return RateLimitedProvider(provider, provider_name)
@@ -0,0 +1,26 @@
+"""
+Test runner for ``manage.py test``.
+
+Query budgets are enforced (QUERY_BUDGET_STRICT), so a view going over its
+budget fails the test that calls it. Only the apps' ``tests*.py`` modules
+are collected: the ``test_*.py`` scripts next to manage.py are manual checks
+against a live database.
+"""
+from django.conf import settings
+from django.test.runner import DiscoverRunner
+
+
+class TestRunner(DiscoverRunner):
+    @classmethod
+    def add_arguments(cls, parser):
+        super().add_arguments(parser)
+        parser.set_defaults(pattern='tests*.py')
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self._strict_budgets = settings.QUERY_BUDGET_STRICT
+        settings.QUERY_BUDGET_STRICT = True
+
+    def teardown_test_environment(self, **kwargs):
+        settings.QUERY_BUDGET_STRICT = self._strict_budgets
+        super().teardown_test_environment(**kwargs)
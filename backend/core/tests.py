@@ -1,3 +1,258 @@
-from django.test import TestCase
+import asyncio
+import gc
+from unittest import mock
 
-# Create your tests here.
+import openai
+
+from django.db import connection
+from django.test import SimpleTestCase, TestCase
+from django.test.utils import CaptureQueriesContext
+
+from .clients import ClientPool, client_pool
+from . import llm_cache
+from .llm_cache import CachedProvider, DatabaseBackend, MemoryBackend
+from .providers import MockProvider, OpenAIProvider
+from . import ratelimit
+from .ratelimit import RateLimiter, log_stats
+from .usage import Usage
+
+
+class Client:
+    closed = False
+
+    def close(self):
+        self.closed = True
+
+
+class ClientPoolTests(SimpleTestCase):
+    def setUp(self):
+        self.pool = ClientPool(max_size=2, ttl=60)
+
+    def test_sync_clients_are_reused(self):
+        client = self.pool.get('OPENAI', 'sync', 'key-1', Client)
+        self.assertIs(self.pool.get('OPENAI', 'sync', 'key-1', Client), client)
+        self.assertIsNot(self.pool.get('OPENAI', 'sync', 'key-2', Client), client)
+
+    def test_least_recently_used_client_is_closed(self):
+        first = self.pool.get('OPENAI', 'sync', 'key-1', Client)
+        self.pool.get('OPENAI', 'sync', 'key-2', Client)
+        self.pool.get('OPENAI', 'sync', 'key-3', Client)
+        self.assertTrue(first.closed)
+        self.assertEqual(len(self.pool), 2)
+
+    def test_async_clients_belong_to_their_loop(self):
+        async def get():
+            return self.pool.get('OPENAI', 'async', 'key-1', Client)
+
+        async def get_twice():
+            return await get(), await get()
+
+        first, again = asyncio.run(get_twice())
+        self.assertIs(first, again)
+        # A later loop may be given the id of a collected one; it still gets its own client
+        for _ in range(5):
+            gc.collect()
+            self.assertIsNot(asyncio.run(get()), first)
+
+    def test_pools_of_closed_loops_are_dropped(self):
+        async def get():
+            return self.pool.get('OPENAI', 'async', 'key-1', Client)
+
+        asyncio.run(get())
+        gc.collect()
+        self.assertEqual(len(self.pool), 0)
+
+    def test_evict_drops_the_key_everywhere(self):
+        loop = asyncio.new_event_loop()
+        self.addCleanup(loop.close)
+
+        async def get():
+            return self.pool.get('OPENAI', 'async', 'key-1', Client)
+
+        sync_client = self.pool.get('OPENAI', 'sync', 'key-1', Client)
+        loop.run_until_complete(get())
+        self.pool.get('OPENAI', 'sync', 'key-2', Client)
+        self.pool.evict('key-1')
+        self.assertTrue(sync_client.closed)
+        self.assertEqual(len(self.pool), 1)
+
+
+class OpenAIProviderTests(SimpleTestCase):
+    def tearDown(self):
+        client_pool.clear()
+
+    def test_sdk_does_not_retry(self):
+        self.assertEqual(OpenAIProvider._client('sk-test').max_retries, 0)
+
+        async def get():
+            return OpenAIProvider._async_client('sk-test')
+
+        self.assertEqual(asyncio.run(get()).max_retries, 0)
+
+
+class RateLimiterStatsTests(SimpleTestCase):
+    def test_stats_are_logged_per_bucket(self):
+        limiter = RateLimiter(limits={'OPENAI': {'rate': 100, 'burst': 10}})
+        for _ in range(3):
+            limiter.call('OPENAI', 'sk-test', lambda api_key: 'ok')
+        limiter.bucket('GEMINI', 'unused')
+        with self.assertLogs('core.ratelimit', 'INFO') as logs:
+            log_stats(limiter)
+        self.assertEqual(len(logs.output), 1)
+        self.assertIn('3 calls, 0 retries', logs.output[0])
+
+
+REQUEST = mock.Mock(method='POST', url='https://api.openai.com/v1/chat/completions')
+
+
+def api_error(error_class, status_code, headers=None):
+    # The SDK's errors only read these attributes of the HTTP response
+    response = mock.Mock(status_code=status_code, headers=headers or {}, request=REQUEST)
+    return error_class('Provider error', response=response, body=None)
+
+
+class Flaky:
+    """Call target that raises ``errors`` in turn, then returns the key it was called with."""
+
+    def __init__(self, *errors):
+        self.errors = list(errors)
+        self.keys = []
+
+    def __call__(self, key):
+        self.keys.append(key)
+        if self.errors:
+            raise self.errors.pop(0)
+        return key
+
+    async def acall(self, key):
+        return self(key)
+
+
+class RateLimiterRetryTests(SimpleTestCase):
+    def setUp(self):
+        self.limiter = RateLimiter(max_retries=2, base_delay=1.0)
+        sleep = mock.patch.object(ratelimit.time, 'sleep')
+        self.sleep = sleep.start()
+        self.addCleanup(sleep.stop)
+        logger = mock.patch.object(ratelimit, 'logger')
+        self.logger = logger.start()
+        self.addCleanup(logger.stop)
+
+    def delays(self):
+        # The rate limiter's own waits are 0 for an unlimited key
+        return [call.args[0] for call in self.sleep.call_args_list if call.args[0]]
+
+    def test_transient_errors_are_retried(self):
+        fn = Flaky(openai.APIConnectionError(request=REQUEST), api_error(openai.InternalServerError, 503))
+        self.assertEqual(self.limiter.call('OPENAI', 'sk-test', fn), 'sk-test')
+        self.assertEqual(len(fn.keys), 3)
+        self.assertEqual(self.limiter.bucket('OPENAI', 'sk-test').stats()['retries'], 2)
+        # Full jitter below base_delay * 2 ** attempt
+        self.assertEqual(len(self.sleep.call_args_list), 5)
+        for attempt, delay in enumerate(self.delays()):
+            self.assertLessEqual(delay, 2 ** attempt)
+
+    def test_rate_limit_pauses_the_bucket(self):
+        fn = Flaky(api_error(openai.RateLimitError, 429, {'retry-after': '7'}))
+        self.limiter.call('OPENAI', 'sk-test', fn)
+        # The retry sleeps 7s, then waits out the bucket's pause, which a
+        # mocked sleep hasn't let run down
+        self.assertEqual(self.delays()[0], 7.0)
+        self.assertAlmostEqual(self.delays()[1], 7.0, places=1)
+        bucket = self.limiter.bucket('OPENAI', 'sk-test')
+        self.assertEqual(bucket.stats()['throttled'], 1)
+        # Every other caller on the key waits out the pause too
+        self.assertGreater(bucket.reserve(), 6)
+        self.assertEqual(self.limiter.bucket('OPENAI', 'sk-other').reserve(), 0)
+
+    def test_retry_after_ms_takes_precedence(self):
+        error = api_error(openai.RateLimitError, 429, {'retry-after-ms': '1500', 'retry-after': '2'})
+        self.assertEqual(ratelimit.retry_after(error), 1.5)
+        self.assertIsNone(ratelimit.retry_after(openai.APIConnectionError(request=REQUEST)))
+
+    def test_auth_errors_are_raised_at_once(self):
+        fn = Flaky(api_error(openai.AuthenticationError, 401))
+        with self.assertRaises(openai.AuthenticationError):
+            self.limiter.call('OPENAI', 'sk-test', fn)
+        self.assertEqual(len(fn.keys), 1)
+        self.assertEqual(self.delays(), [])
+
+    def test_retries_stop_at_the_limit(self):
+        fn = Flaky(*[openai.APIConnectionError(request=REQUEST) for _ in range(5)])
+        with self.assertRaises(openai.APIConnectionError):
+            self.limiter.call('OPENAI', 'sk-test', fn)
+        self.assertEqual(len(fn.keys), 3)
+        self.assertEqual(self.limiter.bucket('OPENAI', 'sk-test').stats()['retries'], 2)
+
+    def test_async_calls_are_retried(self):
+        fn = Flaky(api_error(openai.RateLimitError, 429, {'retry-after': '3'}))
+        with mock.patch.object(ratelimit.asyncio, 'sleep', new=mock.AsyncMock()) as sleep:
+            self.assertEqual(asyncio.run(self.limiter.acall('OPENAI', 'sk-test', fn.acall)), 'sk-test')
+        self.assertEqual([call.args[0] for call in sleep.call_args_list if call.args[0]][0], 3.0)
+        self.assertEqual(len(fn.keys), 2)
+
+
+class CachedProviderTests(SimpleTestCase):
+    def setUp(self):
+        self.provider = CachedProvider(MockProvider(), 'CLAUDE', MemoryBackend())
+        self.request = {'system_message': 'Be brief.', 'prompt': 'Hello', 'api_key': 'key', 'model': 'mock'}
+
+    def test_hits_cost_nothing(self):
+        miss = self.provider.complete(**self.request)
+        self.assertGreater(miss.usage.total_tokens, 0)
+        hit = self.provider.complete(**self.request)
+        self.assertEqual(hit.text, miss.text)
+        self.assertEqual(hit.usage, Usage())
+
+        usage = Usage()
+        self.assertEqual(''.join(self.provider.stream_response(**self.request, usage=usage)), miss.text)
+        self.assertEqual(usage.total_tokens, 0)
+
+    def test_async_hits_cost_nothing(self):
+        async def calls():
+            miss = await self.provider.acomplete(**self.request)
+            hit = await self.provider.acomplete(**self.request)
+            usage = Usage()
+            chunks = [chunk async for chunk in self.provider.astream_response(**self.request, usage=usage)]
+            return miss, hit, usage, chunks
+
+        miss, hit, usage, chunks = asyncio.run(calls())
+        self.assertGreater(miss.usage.total_tokens, 0)
+        self.assertEqual(hit.usage.total_tokens, 0)
+        self.assertEqual((''.join(chunks), usage.total_tokens), (miss.text, 0))
+
+    def test_key_covers_the_request(self):
+        self.provider.complete(**self.request)
+        self.provider.complete(**{**self.request, 'model': 'other'})
+        self.provider.complete(**{**self.request, 'system_message': 'Be long.'})
+        self.assertEqual(self.provider.cache.stats()['hits'], 0)
+        self.assertEqual(self.provider.cache.size(), 3)
+
+    def test_stats_are_logged(self):
+        self.provider.complete(**self.request)
+        self.provider.complete(**self.request)
+        with self.assertLogs('core.llm_cache', 'INFO') as logs:
+            llm_cache.log_stats(self.provider.cache)
+        self.assertIn('MemoryBackend: 1 hits, 1 misses, 0 evictions', logs.output[0])
+
+
+class DatabaseBackendTests(TestCase):
+    def test_least_recently_used_entries_are_evicted(self):
+        backend = DatabaseBackend(max_entries=3)
+        for i in range(4):
+            backend.set(f'key-{i}', f'value-{i}')
+        backend.get('key-1')
+        backend.set('key-4', 'value-4')
+        self.assertEqual(backend.size(), 3)
+        self.assertEqual(backend.evictions, 2)
+        self.assertEqual([backend.get(f'key-{i}') for i in (0, 1, 2)], [None, 'value-1', None])
+
+    def test_writes_with_room_left_do_not_count_the_table(self):
+        backend = DatabaseBackend(max_entries=10)
+        backend.set('key-0', 'value')
+        with CaptureQueriesContext(connection) as queries:
+            for i in range(1, 10):
+                backend.set(f'key-{i}', 'value')
+        self.assertFalse([query for query in queries.captured_queries if 'COUNT(' in query['sql']])
+        backend.set('key-10', 'value')
+        self.assertEqual((backend.size(), backend.evictions), (10, 1))
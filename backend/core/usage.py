@@ -0,0 +1,55 @@
+from dataclasses import dataclass, field
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+
+@dataclass
+class Usage:
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    # True when counted locally rather than reported by the provider
+    estimated: bool = False
+
+    @property
+    def total_tokens(self):
+        return self.prompt_tokens + self.completion_tokens
+
+    def update(self, other):
+        self.prompt_tokens = other.prompt_tokens
+        self.completion_tokens = other.completion_tokens
+        self.estimated = other.estimated
+
+
+@dataclass
+class Completion:
+    text: str
+    usage: Usage = field(default_factory=Usage)
+
+
+_encoding = None
+
+
+def count_tokens(text):
+    """
+    Counts tokens with tiktoken when it is installed, otherwise estimates
+    roughly four characters per token.
+    """
+    global _encoding
+    if not text:
+        return 0
+    if tiktoken is not None:
+        if _encoding is None:
+            _encoding = tiktoken.get_encoding('cl100k_base')
+        return len(_encoding.encode(text, disallowed_special=()))
+    return max(1, (len(text) + 3) // 4)
+
+
+def estimate_usage(system_message, prompt, completion):
+    return Usage(
+        prompt_tokens=count_tokens(system_message) + count_tokens(prompt),
+        completion_tokens=count_tokens(completion),
+        estimated=True,
+    )
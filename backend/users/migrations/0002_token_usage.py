@@ -0,0 +1,23 @@
+# Generated by Django 5.2.6 on 2026-10-18 16:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='completion_tokens',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='prompt_tokens',
+            field=models.BigIntegerField(default=0),
+        ),
+    ]
@@ -10,6 +10,9 @@ class User(AbstractUser):
     
     plan = models.CharField(max_length=10, choices=PLAN_CHOICES, default='BASIC')
     verified = models.BooleanField(default=False)
+    # Token usage across all of the user's sessions and summaries
+    prompt_tokens = models.BigIntegerField(default=0)
+    completion_tokens = models.BigIntegerField(default=0)
 
     def __str__(self):
         return self.email
@@ -6,8 +6,8 @@ User = get_user_model()
 class UserSerializer(serializers.ModelSerializer):
     class Meta:
         model = User
-        fields = ('id', 'username', 'email', 'plan', 'verified')
-        read_only_fields = ('plan', 'verified')
+        fields = ('id', 'username', 'email', 'plan', 'verified', 'prompt_tokens', 'completion_tokens')
+        read_only_fields = ('plan', 'verified', 'prompt_tokens', 'completion_tokens')
 
 class RegisterSerializer(serializers.ModelSerializer):
     password = serializers.CharField(write_only=True)
@@ -0,0 +1,134 @@
+import itertools
+import threading
+import time
+
+from django.conf import settings
+
+from core.ratelimit import is_auth_error, is_rate_limited, is_transient, retry_after
+from .resolver import key_cache
+
+
+class KeyHealth:
+    """
+    Process-wide health of each credential: calls in flight, consecutive
+    failures and when an ejected key may be used again.
+    """
+
+    def __init__(self, base_cooldown=30, max_cooldown=600):
+        self.base_cooldown = base_cooldown
+        self.max_cooldown = max_cooldown
+        self._state = {}
+        self._lock = threading.Lock()
+
+    def _entry(self, credential_id):
+        return self._state.setdefault(credential_id, {'in_flight': 0, 'failures': 0, 'ejected_until': 0.0})
+
+    def in_flight(self, credential_id):
+        with self._lock:
+            return self._entry(credential_id)['in_flight']
+
+    def ejected_until(self, credential_id):
+        with self._lock:
+            return self._entry(credential_id)['ejected_until']
+
+    def started(self, credential_id):
+        with self._lock:
+            self._entry(credential_id)['in_flight'] += 1
+
+    def succeeded(self, credential_id):
+        with self._lock:
+            entry = self._entry(credential_id)
+            entry['in_flight'] -= 1
+            entry['failures'] = 0
+            entry['ejected_until'] = 0.0
+
+    def failed(self, credential_id, eject=False, cooldown=None):
+        with self._lock:
+            entry = self._entry(credential_id)
+            entry['in_flight'] -= 1
+            if not eject:
+                return
+            entry['failures'] += 1
+            if cooldown is None:
+                cooldown = min(self.max_cooldown, self.base_cooldown * 2 ** (entry['failures'] - 1))
+            entry['ejected_until'] = time.monotonic() + cooldown
+
+    def forget(self, credential_id):
+        with self._lock:
+            self._state.pop(credential_id, None)
+
+    def stats(self):
+        with self._lock:
+            return {credential_id: dict(entry) for credential_id, entry in self._state.items()}
+
+
+key_health = KeyHealth(base_cooldown=getattr(settings, 'VAULT_KEY_EJECT_SECONDS', 30))
+
+_round_robin = {}
+_round_robin_lock = threading.Lock()
+
+
+def _next_index(pool_key):
+    with _round_robin_lock:
+        counter = _round_robin.setdefault(pool_key, itertools.count())
+        return next(counter)
+
+
+class PooledKey:
+    def __init__(self, credential):
+        self.credential = credential
+        self.api_key = key_cache.get(credential)
+
+
+class KeyPool:
+    """
+    Spreads calls for one provider across all of a user's credentials for
+    it. ``round_robin`` rotates through healthy keys; ``least_loaded``
+    picks the healthy key with the fewest calls in flight. Keys that fail
+    with a transient or auth error are ejected for a cooldown that grows
+    with consecutive failures (or for the provider's Retry-After on a 429);
+    if every key is ejected, the one that comes back soonest is used.
+
+    The rate limiter accepts a KeyPool wherever it takes an API key and
+    acquires a key for every attempt, so a retry after a 429 lands on a
+    different key.
+    """
+
+    def __init__(self, user_id, provider, credentials, strategy=None):
+        self.user_id = user_id
+        self.provider = provider
+        self.credentials = list(credentials)
+        self.strategy = strategy or getattr(settings, 'VAULT_KEY_POOL_STRATEGY', 'round_robin')
+
+    def __len__(self):
+        return len(self.credentials)
+
+    def healthy(self):
+        now = time.monotonic()
+        return [c for c in self.credentials if key_health.ejected_until(c.pk) <= now]
+
+    def has_alternative(self, pooled_key):
+        return any(c.pk != pooled_key.credential.pk for c in self.healthy())
+
+    def _choose(self):
+        candidates = self.healthy()
+        if not candidates:
+            return min(self.credentials, key=lambda c: key_health.ejected_until(c.pk))
+        if self.strategy == 'least_loaded':
+            return min(candidates, key=lambda c: (key_health.in_flight(c.pk), c.pk))
+        return candidates[_next_index((self.user_id, self.provider)) % len(candidates)]
+
+    def acquire(self):
+        credential = self._choose()
+        key_health.started(credential.pk)
+        return PooledKey(credential)
+
+    def release(self, pooled_key, error=None):
+        credential_id = pooled_key.credential.pk
+        if error is None:
+            key_health.succeeded(credential_id)
+            return
+        # Bad requests say nothing about the key, so it stays in rotation
+        eject = is_transient(error) or is_auth_error(error)
+        cooldown = retry_after(error) if is_rate_limited(error) else None
+        key_health.failed(credential_id, eject=eject, cooldown=cooldown)
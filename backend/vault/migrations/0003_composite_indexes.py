@@ -0,0 +1,19 @@
+# Generated by Django 5.2.6 on 2026-10-18 18:39
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vault', '0002_alter_credential_unique_together_credential_name'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='credential',
+            index=models.Index(fields=['user', 'provider'], name='credential_user_provider'),
+        ),
+    ]
@@ -3,6 +3,13 @@ from django.conf import settings
 from cryptography.fernet import Fernet
 import base64
 import os
+from functools import lru_cache
+
+
+@lru_cache(maxsize=4)
+def _fernet(secret_key):
+    key_material = secret_key.encode()[:32].ljust(32, b'0')
+    return Fernet(base64.urlsafe_b64encode(key_material))
 
 class Credential(models.Model):
     PROVIDER_CHOICES = [
@@ -24,17 +31,16 @@ class Credential(models.Model):
         # For simplicity in this demo, we'll generate a key if not present or use a fixed derivation.
         # Ideally, use a proper KDF. Here we'll just use a separate env var or derive from SECRET_KEY.
         
-        # Simple derivation for MVP:
-        key_material = settings.SECRET_KEY.encode()[:32].ljust(32, b'0')
-        fernet_key = base64.urlsafe_b64encode(key_material)
-        f = Fernet(fernet_key)
-        self.encrypted_key = f.encrypt(key.encode()).decode()
+        # Simple derivation for MVP (built once per SECRET_KEY, see _fernet):
+        self.encrypted_key = _fernet(settings.SECRET_KEY).encrypt(key.encode()).decode()
 
     def get_key(self):
-        key_material = settings.SECRET_KEY.encode()[:32].ljust(32, b'0')
-        fernet_key = base64.urlsafe_b64encode(key_material)
-        f = Fernet(fernet_key)
-        return f.decrypt(self.encrypted_key.encode()).decode()
+        return _fernet(settings.SECRET_KEY).decrypt(self.encrypted_key.encode()).decode()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'provider'], name='credential_user_provider'),
+        ]
 
     def __str__(self):
         return f"{self.provider} - {self.user.email}"
@@ -0,0 +1,82 @@
+import threading
+import time
+
+from django.conf import settings
+
+from .models import Credential
+
+
+class KeyCache:
+    """
+    Short-lived in-process cache of decrypted API keys by credential id.
+    Entries are dropped when the credential is saved or deleted (see
+    signals.py), so the TTL only bounds how long a key lives in memory.
+    """
+
+    def __init__(self, ttl=60):
+        self.ttl = ttl
+        self._keys = {}
+        self._lock = threading.Lock()
+
+    def get(self, credential):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._keys.get(credential.pk)
+            if entry and entry[1] > now:
+                return entry[0]
+        key = credential.get_key()
+        with self._lock:
+            self._keys[credential.pk] = (key, now + self.ttl)
+        return key
+
+    def peek(self, credential_id):
+        with self._lock:
+            entry = self._keys.get(credential_id)
+        return entry[0] if entry else None
+
+    def invalidate(self, credential_id):
+        with self._lock:
+            self._keys.pop(credential_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._keys.clear()
+
+
+key_cache = KeyCache(ttl=getattr(settings, 'VAULT_KEY_CACHE_TTL', 60))
+
+
+class CredentialResolver:
+    """
+    Resolves the API keys for each provider a set of agents needs with a
+    single query, decrypting each key at most once per TTL.
+
+    When a user has several credentials for one provider, ``get_keys``
+    returns a pool that spreads calls across all of them; ``get_key`` still
+    returns the lowest id.
+    """
+
+    def __init__(self, user_id, providers):
+        self.user_id = user_id
+        self.credentials = {}
+        queryset = Credential.objects.filter(user_id=user_id, provider__in=set(providers)).order_by('id')
+        for credential in queryset:
+            self.credentials.setdefault(credential.provider, []).append(credential)
+
+    @classmethod
+    def for_agents(cls, user_id, agents):
+        return cls(user_id, [agent.provider for agent in agents])
+
+    def get_key(self, provider):
+        credentials = self.credentials.get(provider)
+        if not credentials:
+            return None
+        return key_cache.get(credentials[0])
+
+    def get_keys(self, provider):
+        from .keypool import KeyPool
+
+        credentials = self.credentials.get(provider)
+        if not credentials:
+            return None
+        return KeyPool(self.user_id, provider, credentials)
@@ -0,0 +1,19 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from core.clients import client_pool
+from .models import Credential
+from .keypool import key_health
+from .resolver import key_cache
+
+
+@receiver(post_save, sender=Credential)
+@receiver(post_delete, sender=Credential)
+def invalidate_credential(sender, instance, **kwargs):
+    # Drop pooled clients built with the key we had decrypted before the change
+    old_key = key_cache.peek(instance.pk)
+    if old_key:
+        client_pool.evict(old_key)
+    key_cache.invalidate(instance.pk)
+    # A replaced key starts with a clean health record
+    key_health.forget(instance.pk)
@@ -1,3 +1,208 @@
+import time
+from unittest import mock
+
+import openai
+from django.contrib.auth import get_user_model
 from django.test import TestCase
 
-# Create your tests here.
+from core import ratelimit
+from core.providers import MockProvider
+from core.ratelimit import RateLimitedProvider, RateLimiter
+from . import keypool, resolver
+from .keypool import KeyHealth, KeyPool
+from .models import Credential
+from .resolver import CredentialResolver, KeyCache, key_cache
+
+
+def api_error(error_class, status_code, headers=None):
+    # The SDK's errors only read these attributes of the HTTP response
+    response = mock.Mock(status_code=status_code, headers=headers or {}, request=None)
+    return error_class('Provider error', response=response, body=None)
+
+
+def create_credentials(user, provider, count):
+    credentials = []
+    for i in range(count):
+        credential = Credential(user=user, provider=provider, name=f'Key {i}')
+        credential.set_key(f'sk-{provider.lower()}-{i}')
+        credential.save()
+        credentials.append(credential)
+    return credentials
+
+
+class KeyPoolTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user('pooled', password='pooled')
+        self.credentials = create_credentials(self.user, 'OPENAI', 3)
+        # Health and rotation are process-wide; each test starts from scratch
+        self.health = KeyHealth(base_cooldown=30, max_cooldown=600)
+        for patcher in (mock.patch.object(keypool, 'key_health', self.health),
+                        mock.patch.object(keypool, '_round_robin', {})):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def pool(self, strategy='round_robin', credentials=None):
+        return KeyPool(self.user.pk, 'OPENAI', credentials or self.credentials, strategy=strategy)
+
+    def cooldown(self, credential):
+        return self.health.ejected_until(credential.pk) - time.monotonic()
+
+    def test_round_robin_rotates_through_the_keys(self):
+        pool = self.pool()
+        used = []
+        for _ in range(6):
+            pooled = pool.acquire()
+            used.append(pooled.api_key)
+            pool.release(pooled)
+        self.assertEqual(used, ['sk-openai-0', 'sk-openai-1', 'sk-openai-2'] * 2)
+
+    def test_least_loaded_picks_the_key_with_fewest_calls_in_flight(self):
+        pool = self.pool('least_loaded')
+        first, second, third = pool.acquire(), pool.acquire(), pool.acquire()
+        self.assertEqual([p.credential for p in (first, second, third)], self.credentials)
+        pool.release(second)
+        self.assertEqual(pool.acquire().credential, self.credentials[1])
+        self.assertEqual(self.health.in_flight(self.credentials[0].pk), 1)
+
+    def test_failing_keys_are_ejected_for_a_growing_cooldown(self):
+        pool = self.pool()
+        credential = self.credentials[0]
+        solo = self.pool(credentials=[credential])
+        for expected in (30, 60):
+            solo.release(solo.acquire(), openai.APIConnectionError(request=None))
+            self.assertAlmostEqual(self.cooldown(credential), expected, delta=1)
+            self.assertNotIn(credential, pool.healthy())
+
+        # A success puts the key straight back
+        solo.release(solo.acquire())
+        self.assertIn(credential, pool.healthy())
+        self.assertEqual(self.health.stats()[credential.pk]['failures'], 0)
+
+    def test_rate_limited_keys_cool_down_for_retry_after(self):
+        pool = self.pool()
+        pooled = pool.acquire()
+        pool.release(pooled, api_error(openai.RateLimitError, 429, {'retry-after': '5'}))
+        self.assertAlmostEqual(self.cooldown(pooled.credential), 5, delta=1)
+
+    def test_bad_requests_do_not_eject(self):
+        pool = self.pool()
+        pooled = pool.acquire()
+        pool.release(pooled, api_error(openai.BadRequestError, 400))
+        self.assertEqual(pool.healthy(), self.credentials)
+        self.assertEqual(self.health.in_flight(pooled.credential.pk), 0)
+
+    def test_soonest_back_is_used_when_every_key_is_ejected(self):
+        pool = self.pool()
+        for credential, seconds in zip(self.credentials, ('50', '10', '30')):
+            solo = self.pool(credentials=[credential])
+            solo.release(solo.acquire(), api_error(openai.RateLimitError, 429, {'retry-after': seconds}))
+        self.assertEqual(pool.healthy(), [])
+        self.assertEqual(pool.acquire().credential, self.credentials[1])
+
+
+class KeyFailoverTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user('failover', password='failover')
+        self.credentials = create_credentials(self.user, 'OPENAI', 2)
+        self.health = KeyHealth()
+        self.limiter = RateLimiter(max_retries=2)
+        for patcher in (mock.patch.object(keypool, 'key_health', self.health),
+                        mock.patch.object(keypool, '_round_robin', {}),
+                        mock.patch.object(ratelimit.time, 'sleep'),
+                        mock.patch.object(ratelimit, 'logger')):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.pool = KeyPool(self.user.pk, 'OPENAI', self.credentials)
+
+    def failing_first(self, error):
+        keys = []
+
+        def fn(key):
+            keys.append(key)
+            if len(keys) == 1:
+                raise error
+            return key
+        return fn, keys
+
+    def test_rate_limited_key_fails_over(self):
+        fn, keys = self.failing_first(api_error(openai.RateLimitError, 429, {'retry-after': '20'}))
+        self.assertEqual(self.limiter.call('OPENAI', self.pool, fn), 'sk-openai-1')
+        self.assertEqual(keys, ['sk-openai-0', 'sk-openai-1'])
+        # Only the rejected key's bucket is paused; the retry didn't wait for it
+        self.assertGreater(self.limiter.bucket('OPENAI', 'sk-openai-0').reserve(), 15)
+        self.assertEqual([call.args[0] for call in ratelimit.time.sleep.call_args_list], [0.0, 0.0])
+        self.assertEqual(self.health.in_flight(self.credentials[1].pk), 0)
+
+    def test_rejected_key_fails_over(self):
+        fn, keys = self.failing_first(api_error(openai.AuthenticationError, 401))
+        self.assertEqual(self.limiter.call('OPENAI', self.pool, fn), 'sk-openai-1')
+        self.assertNotIn(self.credentials[0], self.pool.healthy())
+
+    def test_rejected_last_key_is_raised(self):
+        pool = KeyPool(self.user.pk, 'OPENAI', self.credentials[:1])
+        fn, keys = self.failing_first(api_error(openai.AuthenticationError, 401))
+        with self.assertRaises(openai.AuthenticationError):
+            self.limiter.call('OPENAI', pool, fn)
+        self.assertEqual(len(keys), 1)
+
+    def test_streams_hold_their_key_until_they_end(self):
+        provider = RateLimitedProvider(MockProvider(), 'OPENAI', self.limiter)
+        stream = provider.stream_response('You debate.', 'Hello there', self.pool, 'mock')
+        next(stream)
+        self.assertEqual(self.health.in_flight(self.credentials[0].pk), 1)
+        list(stream)
+        self.assertEqual(self.health.in_flight(self.credentials[0].pk), 0)
+
+        # A stream dropped part way gives its key back too
+        stream = provider.stream_response('You debate.', 'Hello there', self.pool, 'mock')
+        next(stream)
+        stream.close()
+        self.assertEqual(self.health.in_flight(self.credentials[1].pk), 0)
+
+
+class KeyCacheTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user('resolver', password='resolver')
+        self.openai, self.second_openai = create_credentials(self.user, 'OPENAI', 2)
+        self.gemini, = create_credentials(self.user, 'GEMINI', 1)
+        key_cache.clear()
+        self.addCleanup(key_cache.clear)
+
+    def test_keys_are_decrypted_once_per_ttl(self):
+        cache = KeyCache(ttl=60)
+        with mock.patch.object(Credential, 'get_key', autospec=True, side_effect=Credential.get_key) as get_key, \
+                mock.patch.object(resolver.time, 'monotonic', return_value=1000.0) as monotonic:
+            self.assertEqual(cache.get(self.openai), 'sk-openai-0')
+            self.assertEqual(cache.get(self.openai), 'sk-openai-0')
+            self.assertEqual(get_key.call_count, 1)
+            monotonic.return_value = 1061.0
+            cache.get(self.openai)
+            self.assertEqual(get_key.call_count, 2)
+
+    def test_saving_a_credential_drops_its_key(self):
+        self.assertEqual(key_cache.get(self.openai), 'sk-openai-0')
+        with mock.patch('vault.signals.client_pool') as client_pool:
+            self.openai.set_key('sk-replaced')
+            self.openai.save()
+        client_pool.evict.assert_called_once_with('sk-openai-0')
+        self.assertIsNone(key_cache.peek(self.openai.pk))
+        self.assertEqual(key_cache.get(Credential.objects.get(pk=self.openai.pk)), 'sk-replaced')
+
+    def test_deleting_a_credential_drops_its_key(self):
+        key_cache.get(self.openai)
+        credential_id = self.openai.pk
+        self.openai.delete()
+        self.assertIsNone(key_cache.peek(credential_id))
+
+    def test_resolver_reads_every_provider_in_one_query(self):
+        with self.assertNumQueries(1):
+            credentials = CredentialResolver(self.user.pk, ['OPENAI', 'GEMINI', 'CLAUDE'])
+        self.assertEqual(credentials.get_key('OPENAI'), 'sk-openai-0')
+        self.assertEqual(credentials.get_key('GEMINI'), 'sk-gemini-0')
+        self.assertIsNone(credentials.get_key('CLAUDE'))
+        self.assertIsNone(credentials.get_keys('CLAUDE'))
+        self.assertEqual(credentials.get_keys('OPENAI').credentials, [self.openai, self.second_openai])
+
+    def test_other_users_keys_are_not_resolved(self):
+        other = get_user_model().objects.create_user('other', password='other')
+        self.assertIsNone(CredentialResolver(other.pk, ['OPENAI']).get_key('OPENAI'))
@@ -5,6 +5,7 @@ from .serializers import CredentialSerializer
 class CredentialListCreateView(generics.ListCreateAPIView):
     serializer_class = CredentialSerializer
     permission_classes = [permissions.IsAuthenticated]
+    query_budget = 3
 
     def get_queryset(self):
         return Credential.objects.filter(user=self.request.user)
@@ -15,6 +16,7 @@ class CredentialListCreateView(generics.ListCreateAPIView):
 class CredentialDetailView(generics.RetrieveUpdateDestroyAPIView):
     serializer_class = CredentialSerializer
     permission_classes = [permissions.IsAuthenticated]
+    query_budget = 5
 
     def get_queryset(self):
         return Credential.objects.filter(user=self.request.user)
@@ -8,7 +8,7 @@ import api from "@/lib/api"
 import Link from "next/link"
 
 export default function DashboardPage() {
-    const [stats, setStats] = useState({ agents: 0, sessions: 0, tokens: 0 })
+    const [stats, setStats] = useState({ agents: 0, sessions: 0, promptTokens: 0, completionTokens: 0 })
     const [recentSessions, setRecentSessions] = useState<any[]>([])
     const [user, setUser] = useState<any>(null)
     const [avatarUrl, setAvatarUrl] = useState("/avatar.png")
@@ -16,7 +16,6 @@ export default function DashboardPage() {
 
     useEffect(() => {
         fetchData()
-        fetchUser()
         // Load custom images from localStorage
         const savedAvatar = localStorage.getItem('userAvatar')
         const savedBanner = localStorage.getItem('userBanner')
@@ -26,27 +25,29 @@ export default function DashboardPage() {
 
     const fetchData = async () => {
         try {
-            const agentsRes = await api.get('/agents/')
-            const sessionsRes = await api.get('/sessions/')
+            const [agentsRes, sessionsRes, userRes] = await Promise.all([
+                api.get('/agents/'),
+                api.get('/sessions/', { params: { page_size: 3 } }),
+                api.get('/users/me/'),
+            ])
 
+            setUser(userRes.data)
             setStats({
                 agents: agentsRes.data.length,
-                sessions: sessionsRes.data.length,
-                tokens: 1200000 // Mock for now as backend doesn't track tokens yet
+                sessions: sessionsRes.data.count,
+                promptTokens: userRes.data.prompt_tokens,
+                completionTokens: userRes.data.completion_tokens,
             })
-            setRecentSessions(sessionsRes.data.slice(0, 3))
+            setRecentSessions(sessionsRes.data.results)
         } catch (error) {
             console.error("Failed to fetch dashboard data", error)
         }
     }
 
-    const fetchUser = async () => {
-        try {
-            const response = await api.get('/users/me/')
-            setUser(response.data)
-        } catch (error) {
-            console.error("Failed to fetch user info", error)
-        }
+    const formatTokens = (tokens: number) => {
+        if (tokens >= 1000000) return `${(tokens / 1000000).toFixed(1)}M`
+        if (tokens >= 1000) return `${(tokens / 1000).toFixed(1)}K`
+        return `${tokens}`
     }
 
     return (
@@ -103,8 +104,10 @@ export default function DashboardPage() {
                         <DollarSign className="h-5 w-5" />
                     </CardHeader>
                     <CardContent>
-                        <div className="text-4xl font-display font-bold">{(stats.tokens / 1000000).toFixed(1)}M</div>
-                        <p className="text-xs font-bold text-muted-foreground">Est. cost: $24.00</p>
+                        <div className="text-4xl font-display font-bold">{formatTokens(stats.promptTokens + stats.completionTokens)}</div>
+                        <p className="text-xs font-bold text-muted-foreground">
+                            {formatTokens(stats.promptTokens)} prompt / {formatTokens(stats.completionTokens)} completion
+                        </p>
                     </CardContent>
                 </Card>
             </div>
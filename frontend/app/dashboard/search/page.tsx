@@ -0,0 +1,87 @@
+"use client"
+
+import { Button } from "@/components/ui/button"
+import { Card, CardDescription, CardHeader, CardTitle } from "@/components/ui/card"
+import { Input } from "@/components/ui/input"
+import { Search, Clock } from "lucide-react"
+import Link from "next/link"
+import { useState } from "react"
+import api from "@/lib/api"
+
+export default function SearchPage() {
+    const [query, setQuery] = useState("")
+    const [results, setResults] = useState<any[] | null>(null)
+    const [isLoading, setIsLoading] = useState(false)
+    const [nextPage, setNextPage] = useState<string | null>(null)
+
+    const fetchResults = async (url: string, append: boolean) => {
+        setIsLoading(true)
+        try {
+            const response = await api.get(url)
+            setResults((current) => append && current ? [...current, ...response.data.results] : response.data.results)
+            setNextPage(response.data.next)
+        } catch (error) {
+            console.error("Search failed", error)
+        } finally {
+            setIsLoading(false)
+        }
+    }
+
+    const handleSearch = (e: React.FormEvent) => {
+        e.preventDefault()
+        if (!query.trim()) return
+        fetchResults(`/sessions/search/?q=${encodeURIComponent(query.trim())}`, false)
+    }
+
+    return (
+        <div className="space-y-8">
+            <h1 className="text-4xl font-display font-bold">SEARCH</h1>
+
+            <form onSubmit={handleSearch} className="flex gap-2">
+                <Input
+                    value={query}
+                    onChange={(e) => setQuery(e.target.value)}
+                    placeholder="Search all your sessions..."
+                />
+                <Button type="submit" className="gap-2" disabled={isLoading}>
+                    <Search className="h-4 w-4" />
+                    Search
+                </Button>
+            </form>
+
+            {results !== null && (results.length === 0 ? (
+                <div className="text-center py-12 text-muted-foreground">No turns match your search.</div>
+            ) : (
+                <div className="grid gap-4">
+                    {results.map((result) => (
+                        <Card key={result.turn} className="border-2 border-border">
+                            <CardHeader className="space-y-2">
+                                <div className="flex items-center justify-between gap-4">
+                                    <CardTitle className="text-lg font-bold truncate">{result.session_topic}</CardTitle>
+                                    <Button variant="outline" size="sm" asChild>
+                                        <Link href={`/dashboard/sessions/${result.session}`}>Open</Link>
+                                    </Button>
+                                </div>
+                                <CardDescription className="flex items-center gap-2 text-sm">
+                                    <span className="font-bold">{result.agent_name}</span>
+                                    <Clock className="h-4 w-4" />
+                                    <span>{new Date(result.created_at).toLocaleString()}</span>
+                                </CardDescription>
+                                {/* The snippet is escaped by the server apart from its <mark> tags */}
+                                <p
+                                    className="text-sm [&_mark]:bg-primary [&_mark]:px-0.5"
+                                    dangerouslySetInnerHTML={{ __html: result.snippet }}
+                                />
+                            </CardHeader>
+                        </Card>
+                    ))}
+                    {nextPage && (
+                        <Button variant="outline" onClick={() => fetchResults(nextPage, true)} disabled={isLoading}>
+                            Load more
+                        </Button>
+                    )}
+                </div>
+            ))}
+        </div>
+    )
+}
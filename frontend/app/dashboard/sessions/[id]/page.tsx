@@ -3,7 +3,7 @@
 import { Button } from "@/components/ui/button"
 import { Input } from "@/components/ui/input"
 import { Card } from "@/components/ui/card"
-import { useState, useEffect, use } from "react"
+import { useState, useEffect, useRef, use } from "react"
 import { ArrowLeft, Play, Square, Send, FileText, Download, BarChart } from "lucide-react"
 import api from "@/lib/api"
 import Link from "next/link"
@@ -17,6 +17,7 @@ export default function SessionDetailPage({ params }: { params: Promise<{ id: st
     const [prompt, setPrompt] = useState("")
     const [isGenerating, setIsGenerating] = useState(false)
     const [thinkingAgent, setThinkingAgent] = useState<string>("")
+    const lastTurnId = useRef<number | null>(null)
 
     useEffect(() => {
         fetchSession()
@@ -25,6 +26,8 @@ export default function SessionDetailPage({ params }: { params: Promise<{ id: st
     const fetchSession = async () => {
         try {
             const response = await api.get(`/sessions/${id}/`)
+            const turns = response.data.turns || []
+            lastTurnId.current = turns.length > 0 ? turns[turns.length - 1].id : null
             setSession(response.data)
         } catch (error) {
             console.error("Failed to fetch session", error)
@@ -33,6 +36,24 @@ export default function SessionDetailPage({ params }: { params: Promise<{ id: st
         }
     }
 
+    // Downloads only the turns created since the last one we have
+    const fetchNewTurns = async () => {
+        let url: string | null = `/sessions/${id}/turns/`
+        if (lastTurnId.current !== null) {
+            url += `?after=${lastTurnId.current}`
+        }
+        const newTurns: any[] = []
+        while (url) {
+            const data: any = (await api.get(url)).data
+            newTurns.push(...data.results)
+            lastTurnId.current = data.last_turn_id
+            url = data.next
+        }
+        if (newTurns.length > 0) {
+            setSession((current: any) => ({ ...current, turns: [...(current.turns || []), ...newTurns] }))
+        }
+    }
+
     const handleStart = async () => {
         try {
             await api.post(`/sessions/${id}/start/`)
@@ -62,8 +83,20 @@ export default function SessionDetailPage({ params }: { params: Promise<{ id: st
             const response = await api.post(`/sessions/${id}/inject/`, {
                 prompt: prompt
             })
-            setSession(response.data)
             setPrompt("")
+
+            // The conversation runs in a background worker; poll the job until it finishes
+            let job = response.data
+            while (job.status === 'PENDING' || job.status === 'RUNNING') {
+                await new Promise((resolve) => setTimeout(resolve, 2000))
+                job = (await api.get(`/sessions/${id}/jobs/${job.id}/`)).data
+                await fetchNewTurns()
+            }
+            // Picks up the final status (e.g. COMPLETED after max turns)
+            await fetchSession()
+            if (job.status === 'FAILED') {
+                alert(job.error || "Failed to generate responses")
+            }
         } catch (error: any) {
             console.error("Failed to inject prompt", error)
             let errorMessage = "Failed to send prompt"
@@ -87,24 +120,22 @@ export default function SessionDetailPage({ params }: { params: Promise<{ id: st
         }
     }
 
-    const handleDownloadPDF = async () => {
+    const handleDownload = async (format: 'pdf' | 'md') => {
         try {
-            const response = await api.get(`/sessions/${id}/export-pdf/`, {
-                responseType: 'text'
+            const response = await api.get(`/sessions/${id}/export/${format}/`, {
+                responseType: 'blob'
             })
 
-            // Create blob from text response
-            const blob = new Blob([response.data], { type: 'text/plain' })
-            const url = window.URL.createObjectURL(blob)
+            const url = window.URL.createObjectURL(response.data)
             const link = document.createElement('a')
             link.href = url
-            link.setAttribute('download', `session-${id}-transcript.txt`)
+            link.setAttribute('download', `session-${id}-transcript.${format}`)
             document.body.appendChild(link)
             link.click()
             link.remove()
             window.URL.revokeObjectURL(url)
         } catch (error) {
-            console.error("Failed to download PDF", error)
+            console.error("Failed to download transcript", error)
             alert("Failed to download transcript")
         }
     }
@@ -141,10 +172,14 @@ export default function SessionDetailPage({ params }: { params: Promise<{ id: st
                         <FileText className="mr-2 h-4 w-4" />
                         Summary
                     </Button>
-                    <Button variant="outline" size="sm" onClick={handleDownloadPDF}>
+                    <Button variant="outline" size="sm" onClick={() => handleDownload('pdf')}>
                         <Download className="mr-2 h-4 w-4" />
                         PDF
                     </Button>
+                    <Button variant="outline" size="sm" onClick={() => handleDownload('md')}>
+                        <Download className="mr-2 h-4 w-4" />
+                        Markdown
+                    </Button>
                     <Button variant="outline" size="sm" asChild>
                         <Link href={`/dashboard/sessions/${id}/report`}>
                             <BarChart className="mr-2 h-4 w-4" />
@@ -17,6 +17,7 @@ export default function ReportDashboardPage({ params }: { params: Promise<{ id:
     const [session, setSession] = useState<any>(null)
     const [summary, setSummary] = useState<string>("")
     const [report, setReport] = useState<string>("")
+    const [stats, setStats] = useState<any>(null)
     const [isLoading, setIsLoading] = useState(true)
     const [chartData, setChartData] = useState<any[]>([])
 
@@ -37,20 +38,14 @@ export default function ReportDashboardPage({ params }: { params: Promise<{ id:
             // Fetch report
             const reportRes = await api.post(`/sessions/${id}/generate-report/`)
             setReport(reportRes.data.report)
-
-            // Process chart data
-            const agentStats: any = {}
-            sessionRes.data.turns?.forEach((turn: any) => {
-                if (!agentStats[turn.agent_name]) {
-                    agentStats[turn.agent_name] = 0
-                }
-                agentStats[turn.agent_name]++
-            })
-
-            const data = Object.entries(agentStats).map(([name, value]) => ({
-                name,
-                value,
-                percentage: ((value as number) / sessionRes.data.turns.length * 100).toFixed(1)
+            setStats(reportRes.data.stats)
+
+            // Chart data comes from the report's per-agent statistics
+            const stats = reportRes.data.stats
+            const data = stats.agents.map((agent: any) => ({
+                name: agent.name,
+                value: agent.turns,
+                percentage: stats.session.turn_count ? (agent.turns / stats.session.turn_count * 100).toFixed(1) : "0.0"
             }))
             setChartData(data)
 
@@ -169,7 +164,7 @@ export default function ReportDashboardPage({ params }: { params: Promise<{ id:
                         <div className="grid grid-cols-2 gap-4">
                             <div className="bg-accent/20 p-4 rounded border-2 border-border">
                                 <p className="text-sm text-muted-foreground">Total Turns</p>
-                                <p className="text-3xl font-bold">{session?.turns?.length || 0}</p>
+                                <p className="text-3xl font-bold">{stats?.session.turn_count || 0}</p>
                             </div>
                             <div className="bg-accent/20 p-4 rounded border-2 border-border">
                                 <p className="text-sm text-muted-foreground">Agents</p>
@@ -181,7 +176,7 @@ export default function ReportDashboardPage({ params }: { params: Promise<{ id:
                             </div>
                             <div className="bg-accent/20 p-4 rounded border-2 border-border">
                                 <p className="text-sm text-muted-foreground">Progress</p>
-                                <p className="text-xl font-bold">{session?.turns?.length}/{session?.max_turns}</p>
+                                <p className="text-xl font-bold">{stats?.session.turn_count || 0}/{session?.max_turns}</p>
                             </div>
                         </div>
                     </CardContent>
@@ -10,15 +10,17 @@ import api from "@/lib/api"
 export default function SessionsPage() {
     const [sessions, setSessions] = useState<any[]>([])
     const [isLoading, setIsLoading] = useState(true)
+    const [nextPage, setNextPage] = useState<string | null>(null)
 
     useEffect(() => {
         fetchSessions()
     }, [])
 
-    const fetchSessions = async () => {
+    const fetchSessions = async (url: string = '/sessions/') => {
         try {
-            const response = await api.get('/sessions/')
-            setSessions(response.data)
+            const response = await api.get(url)
+            setSessions((current) => url === '/sessions/' ? response.data.results : [...current, ...response.data.results])
+            setNextPage(response.data.next)
         } catch (error) {
             console.error("Failed to fetch sessions", error)
         } finally {
@@ -61,7 +63,7 @@ export default function SessionsPage() {
                                     <div className="flex-1 min-w-0">
                                         <CardTitle className="text-xl font-bold truncate">{session.topic}</CardTitle>
                                         <CardDescription className="text-sm">
-                                            {session.agents?.map((a: any) => a.name).join(', ')}
+                                            {session.agent_names?.join(', ')} · {session.turn_count} turns
                                         </CardDescription>
                                     </div>
                                 </div>
@@ -77,6 +79,11 @@ export default function SessionsPage() {
                             </CardHeader>
                         </Card>
                     ))}
+                    {nextPage && (
+                        <Button variant="outline" onClick={() => fetchSessions(nextPage)}>
+                            Load more
+                        </Button>
+                    )}
                 </div>
             )}
         </div>
@@ -3,12 +3,13 @@
 import Link from "next/link"
 import { usePathname } from "next/navigation"
 import { cn } from "@/lib/utils"
-import { LayoutDashboard, Users, Key, MessageSquare, Settings, LogOut } from "lucide-react"
+import { LayoutDashboard, Users, Key, MessageSquare, Search, Settings, LogOut } from "lucide-react"
 
 const sidebarItems = [
     { icon: LayoutDashboard, label: "Dashboard", href: "/dashboard" },
     { icon: Users, label: "Agents", href: "/dashboard/agents" },
     { icon: MessageSquare, label: "Sessions", href: "/dashboard/sessions" },
+    { icon: Search, label: "Search", href: "/dashboard/search" },
     { icon: Key, label: "Vault", href: "/dashboard/vault" },
     { icon: Settings, label: "Settings", href: "/dashboard/settings" },
 ]